@@ -16,10 +16,24 @@ Page Analyzer - анализ характеристик страниц PDF
 """
 
 import fitz  # PyMuPDF
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import pickle
 import re
+import weakref
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
 
 from ..models.data_models import PageMetadata, LayoutType
+from ..utils.bbox_ops import BBoxArray, union_area
 
 
 class PageAnalyzer:
@@ -42,10 +56,43 @@ class PageAnalyzer:
     MULTI_COLUMN_GAP = 50  # Минимальный зазор между колонками (пикселей)
     HIGH_DENSITY_CHARS = 2000  # Порог "высокой плотности" текста
     TOKEN_ESTIMATE_RATIO = 0.25  # Примерное соотношение токенов к символам
+    COLUMN_OUTLIER_Z = 1.75  # Блоки дальше (по Z-оценке середины) - не колонки
     
-    def __init__(self):
-        """Инициализация анализатора"""
-        pass
+    # Кэш результатов analyze_page
+    CACHE_VERSION = 2  # Увеличить при изменении эвристик (старые записи игнорируются)
+    MEMORY_CACHE_SIZE = 4096  # Страниц в памяти процесса
+    
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        Инициализация анализатора
+        
+        Args:
+            cache_dir: Каталог дискового кэша PageMetadata (None - только кэш в памяти).
+                       Повторный запуск на том же PDF не анализирует страницы заново.
+        """
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        self._memory_cache: "OrderedDict[str, PageMetadata]" = OrderedDict()
+        self._doc_digests: Dict[tuple, str] = {}  # (path, mtime, size) → digest
+        
+        # Страница → (get_image_info(), get_drawings()): каждый вызов заново
+        # обходит content stream; запись удаляется вместе с объектом страницы
+        self._page_graphics = weakref.WeakKeyDictionary()
+    
+    def __getstate__(self):
+        """Для пула процессов: кэши в памяти не передаются"""
+        state = self.__dict__.copy()
+        state["_memory_cache"] = OrderedDict()
+        state["_doc_digests"] = {}
+        state["_page_graphics"] = None
+        return state
+    
+    def __setstate__(self, state):
+        """Восстановление в процессе пула"""
+        self.__dict__.update(state)
+        self._page_graphics = weakref.WeakKeyDictionary()
     
     def analyze_page(self, page: fitz.Page) -> PageMetadata:
         """
@@ -57,23 +104,41 @@ class PageAnalyzer:
         Returns:
             PageMetadata: Метаданные страницы
         """
+        key = self._cache_key(page)
+        if key is None:
+            return self._analyze_page(page)
+        
+        metadata = self._cache_get(key)
+        if metadata is None:
+            metadata = self._analyze_page(page)
+            self._cache_put(key, metadata)
+        
+        return metadata
+    
+    def _analyze_page(self, page: fitz.Page) -> PageMetadata:
+        """Анализ страницы без кэша"""
         rect = page.rect
         page_num = page.number
         
+        # Текст страницы разбираем ОДИН раз: get_text() каждый раз
+        # заново разбирает content stream - самая дорогая операция анализа.
+        # "blocks" - кортежи (x0, y0, x1, y1, text, block_no, block_type):
+        # без словарей строк/спанов, которые строит "dict"
+        blocks = page.get_text("blocks")
+        
         # Извлечение базовой информации
-        text = page.get_text()
+        text = self._blocks_text(blocks)
         has_text_layer = bool(text.strip())
-        text_density = self.estimate_text_density(page)
+        text_density = self._density_from_text(text)
         
         # Анализ layout
-        layout_type = self.detect_layout_type(page)
+        layout_type = self._layout_from_blocks(blocks, rect.width)
         
-        # Подсчет графических элементов
-        images = page.get_images(full=True)
-        drawings = page.get_drawings()
+        # Подсчет графических элементов (один обход страницы на оба вида)
+        image_infos, drawings = self._page_graphics_of(page)
         
         # Оценка покрытия графикой
-        bbox_coverage = self.calculate_bbox_coverage(page)
+        bbox_coverage = self.calculate_bbox_coverage(page, image_infos=image_infos, drawings=drawings)
         
         return PageMetadata(
             page_num=page_num,
@@ -83,12 +148,128 @@ class PageAnalyzer:
             has_text_layer=has_text_layer,
             text_density=text_density,
             layout_type=layout_type,
-            image_count=len(images),
+            image_count=len(image_infos),
             drawing_count=len(drawings),
             table_count=0,  # Будет определено позже в extractors
             bbox_coverage=bbox_coverage
         )
     
+    def _page_graphics_of(self, page: fitz.Page) -> Tuple[List[dict], List[dict]]:
+        """
+        Изображения и векторная графика страницы (с кэшем на объект страницы)
+        
+        Returns:
+            (page.get_image_info(), page.get_drawings())
+        """
+        graphics = self._page_graphics.get(page)
+        if graphics is None:
+            # get_image_info: bbox всех показанных изображений за один проход
+            graphics = (page.get_image_info(), page.get_drawings())
+            self._page_graphics[page] = graphics
+        return graphics
+    
+    def _cache_key(self, page: fitz.Page) -> Optional[str]:
+        """
+        Ключ кэша страницы: хэш (первые 4 КБ файла, mtime, размер) + номер страницы
+        
+        Returns:
+            Ключ или None для документов не из файла (кэш не используется)
+        """
+        path = page.parent.name
+        if not path or not os.path.isfile(path):
+            return None
+        
+        stat = os.stat(path)
+        file_id = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._doc_digests.get(file_id)
+        if digest is None:
+            with open(path, "rb") as f:
+                head = f.read(4096)
+            digest = hashlib.blake2b(
+                head + f"{stat.st_mtime_ns}:{stat.st_size}:{self.CACHE_VERSION}".encode(),
+                digest_size=16
+            ).hexdigest()
+            self._doc_digests[file_id] = digest
+        
+        return f"{digest}-{page.number}"
+    
+    def _cache_get(self, key: str) -> Optional[PageMetadata]:
+        """PageMetadata из кэша (память, затем диск) или None"""
+        metadata = self._memory_cache.get(key)
+        if metadata is not None:
+            self._memory_cache.move_to_end(key)
+            return metadata
+        
+        if not self.cache_dir:
+            return None
+        
+        try:
+            with open(os.path.join(self.cache_dir, key + ".pkl"), "rb") as f:
+                metadata = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None  # Нет записи / запись повреждена - анализируем заново
+        
+        self._remember(key, metadata)
+        return metadata
+    
+    def _cache_put(self, key: str, metadata: PageMetadata):
+        """Сохранить PageMetadata в кэш (память и диск)"""
+        self._remember(key, metadata)
+        
+        if not self.cache_dir:
+            return
+        
+        # Запись через временный файл: параллельные процессы не видят частичный файл
+        path = os.path.join(self.cache_dir, key + ".pkl")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Не удалось записать кэш анализа страницы: {e}")
+    
+    def _remember(self, key: str, metadata: PageMetadata):
+        """Кэш в памяти (LRU на MEMORY_CACHE_SIZE страниц)"""
+        self._memory_cache[key] = metadata
+        self._memory_cache.move_to_end(key)
+        if len(self._memory_cache) > self.MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+    
+    def analyze_document(self, pdf_path: str, workers: Optional[int] = None) -> List[PageMetadata]:
+        """
+        Анализ всех страниц документа в пуле процессов
+        
+        Страницы анализируются независимо, поэтому документ делится на
+        диапазоны страниц; каждый процесс открывает свою копию документа
+        (объекты fitz не передаются между процессами).
+        
+        Args:
+            pdf_path: Путь к PDF файлу
+            workers: Количество процессов (по умолчанию os.cpu_count())
+        
+        Returns:
+            PageMetadata для каждой страницы (в порядке страниц)
+        """
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            workers = min(workers or os.cpu_count() or 1, page_count)
+            
+            # Маленький документ / один процесс - без накладных расходов пула
+            if workers <= 1:
+                return [self.analyze_page(page) for page in doc]
+        
+        # Несколько диапазонов на процесс - выравнивание нагрузки
+        chunk = max(1, -(-page_count // (workers * 4)))
+        ranges = [
+            (self, pdf_path, start, min(start + chunk, page_count))
+            for start in range(0, page_count, chunk)
+        ]
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_analyze_range, ranges, chunksize=1)
+            return [metadata for part in results for metadata in part]
+    
     def estimate_text_density(self, page: fitz.Page) -> int:
         """
         Оценка плотности текста на странице
@@ -102,8 +283,10 @@ class PageAnalyzer:
         Returns:
             int: Примерное количество токенов
         """
-        text = page.get_text()
-        
+        return self._density_from_text(page.get_text())
+    
+    def _density_from_text(self, text: str) -> int:
+        """Оценка количества токенов по уже извлеченному тексту"""
         # Очистка текста
         text = text.strip()
         if not text:
@@ -135,35 +318,48 @@ class PageAnalyzer:
             LayoutType: Тип layout
         """
         # Получаем текстовые блоки с координатами
-        text_dict = page.get_text("dict")
-        blocks = text_dict.get("blocks", [])
+        return self._layout_from_blocks(page.get_text("blocks"), page.rect.width)
+    
+    def _layout_from_blocks(self, blocks: List[tuple], page_width: float) -> LayoutType:
+        """
+        Тип layout по уже извлеченным блокам get_text("blocks")
+        
+        Args:
+            blocks: Блоки страницы (x0, y0, x1, y1, text, block_no, block_type)
+            page_width: Ширина страницы
         
+        Returns:
+            LayoutType: Тип layout
+        """
         if not blocks:
             return LayoutType.UNKNOWN
         
         # Анализ распределения блоков по X
-        text_blocks = [b for b in blocks if b.get("type") == 0]  # 0 = текст
+        text_blocks = [b for b in blocks if b[6] == 0]  # 0 = текст
         if len(text_blocks) < 2:
             return LayoutType.SINGLE_COLUMN
         
-        # Получаем X координаты всех текстовых блоков
-        x_coords = []
-        for block in text_blocks:
-            bbox = block.get("bbox")
-            if bbox:
-                x_coords.append((bbox[0], bbox[2]))  # (x0, x1)
+        # Получаем X координаты всех текстовых блоков: (x0, x1)
+        x_coords = [(b[0], b[2]) for b in text_blocks]
         
-        if not x_coords:
-            return LayoutType.UNKNOWN
+        # Быстрый выход (обычная одноколоночная страница): каждый блок начинается
+        # не дальше MULTI_COLUMN_GAP от самого короткого правого края - новой
+        # колонки не начнется ни при каком подмножестве блоков
+        if max(x0 for x0, _ in x_coords) <= min(x1 for _, x1 in x_coords) + self.MULTI_COLUMN_GAP:
+            return LayoutType.SINGLE_COLUMN
         
         # Определяем колонки методом кластеризации
-        columns = self._detect_columns(x_coords, page.rect.width)
+        # (без одиночных блоков на краях: номер страницы, сноска на полях).
+        # При N < 5 |Z| не превышает (N-1)/sqrt(N) < COLUMN_OUTLIER_Z - фильтр не нужен
+        if len(x_coords) >= 5:
+            x_coords = self._drop_outliers(x_coords)
+        columns = self._count_columns(x_coords)
         
-        if len(columns) == 1:
+        if columns == 1:
             return LayoutType.SINGLE_COLUMN
-        elif len(columns) == 2:
+        elif columns == 2:
             return LayoutType.MULTI_COLUMN
-        elif len(columns) >= 3:
+        elif columns >= 3:
             # Много колонок + много блоков = газетный стиль
             if len(text_blocks) > 10:
                 return LayoutType.NEWSPAPER
@@ -172,51 +368,99 @@ class PageAnalyzer:
         else:
             return LayoutType.SINGLE_COLUMN
     
-    def _detect_columns(self, x_coords: List[Tuple[float, float]], page_width: float) -> List[Tuple[float, float]]:
+    @staticmethod
+    def _blocks_text(blocks: List[tuple]) -> str:
         """
-        Определение колонок текста по X координатам
+        Текст страницы из блоков get_text("blocks") (аналог page.get_text())
         
-        Простая эвристика: группируем блоки с перекрывающимися X диапазонами.
+        Args:
+            blocks: Блоки страницы (x0, y0, x1, y1, text, block_no, block_type)
+        
+        Returns:
+            Текст текстовых блоков подряд
+        """
+        return "".join(b[4] for b in blocks if b[6] == 0)
+    
+    def _drop_outliers(self, x_coords: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        """
+        Убрать блоки-выбросы по X перед подсчетом колонок
+        
+        Боковая врезка или номер страницы на полях иначе дают ложную
+        "колонку" и отправляют простую страницу в OCR. Выброс - блок,
+        середина которого отстоит от средней больше чем на
+        COLUMN_OUTLIER_Z стандартных отклонений.
         
         Args:
             x_coords: Список (x0, x1) координат блоков
-            page_width: Ширина страницы
         
         Returns:
-            Список колонок (x_start, x_end)
+            Координаты без выбросов (массив NumPy или список)
+        """
+        if NUMPY_AVAILABLE:
+            xs = np.asarray(x_coords, dtype=np.float64)
+            mid = (xs[:, 0] + xs[:, 1]) * 0.5
+            z = (mid - mid.mean()) / (mid.std() + 1e-6)
+            return xs[np.abs(z) < self.COLUMN_OUTLIER_Z]
+        
+        mids = [(x0 + x1) * 0.5 for x0, x1 in x_coords]
+        mean = sum(mids) / len(mids)
+        std = (sum((m - mean) ** 2 for m in mids) / len(mids)) ** 0.5
+        return [
+            coords for coords, m in zip(x_coords, mids)
+            if abs(m - mean) / (std + 1e-6) < self.COLUMN_OUTLIER_Z
+        ]
+    
+    def _count_columns(self, x_coords: List[Tuple[float, float]]) -> int:
         """
-        if not x_coords:
-            return []
+        Количество колонок текста по X координатам
         
-        # Сортируем по x0
-        sorted_coords = sorted(x_coords, key=lambda c: c[0])
+        Простая эвристика: группируем блоки с перекрывающимися X диапазонами.
+        После сортировки по x0 новая колонка начинается там, где x0 блока
+        дальше MULTI_COLUMN_GAP от максимального x1 всех предыдущих блоков
+        (running max = правая граница текущей колонки).
+        
+        Args:
+            x_coords: Список (x0, x1) координат блоков
         
-        columns = []
-        current_col = list(sorted_coords[0])  # [x_start, x_end]
+        Returns:
+            int: Количество колонок
+        """
+        if len(x_coords) == 0:
+            return 0
         
-        for x0, x1 in sorted_coords[1:]:
-            # Проверяем, перекрывается ли с текущей колонкой
-            if x0 <= current_col[1] + self.MULTI_COLUMN_GAP:
-                # Расширяем текущую колонку
-                current_col[1] = max(current_col[1], x1)
-            else:
-                # Начинаем новую колонку
-                columns.append(tuple(current_col))
-                current_col = [x0, x1]
+        if NUMPY_AVAILABLE:
+            xs = np.asarray(x_coords, dtype=np.float64)
+            xs = xs[np.argsort(xs[:, 0], kind="stable")]
+            running_end = np.maximum.accumulate(xs[:, 1])
+            starts_new = xs[1:, 0] > running_end[:-1] + self.MULTI_COLUMN_GAP
+            return 1 + int(starts_new.sum())
         
-        # Добавляем последнюю колонку
-        columns.append(tuple(current_col))
+        # Без NumPy - тот же проход на Python
+        sorted_coords = sorted(x_coords, key=lambda c: c[0])
+        columns = 1
+        running_end = sorted_coords[0][1]
+        for x0, x1 in sorted_coords[1:]:
+            if x0 > running_end + self.MULTI_COLUMN_GAP:
+                columns += 1
+            running_end = max(running_end, x1)
         
         return columns
     
-    def calculate_bbox_coverage(self, page: fitz.Page) -> float:
+    def calculate_bbox_coverage(self, page: fitz.Page,
+                                image_infos: Optional[List[dict]] = None,
+                                drawings: Optional[List[dict]] = None) -> float:
         """
         Рассчитать процент площади страницы, покрытой графикой
         
         Высокий % coverage → больше графических элементов → OCR
         
+        Считается площадь ОБЪЕДИНЕНИЯ графики в пределах страницы:
+        перекрывающиеся изображения/drawings не завышают покрытие.
+        
         Args:
             page: Объект страницы
+            image_infos: Результат page.get_image_info(), если уже получен
+            drawings: Результат page.get_drawings(), если уже получен
         
         Returns:
             float: Процент покрытия (0.0 - 1.0)
@@ -225,29 +469,37 @@ class PageAnalyzer:
         if page_area == 0:
             return 0.0
         
-        graphic_area = 0.0
+        rects = []
+        
+        if image_infos is None or drawings is None:
+            cached_infos, cached_drawings = self._page_graphics_of(page)
+            image_infos = cached_infos if image_infos is None else image_infos
+            drawings = cached_drawings if drawings is None else drawings
         
-        # Учитываем изображения
-        images = page.get_images(full=True)
-        for img in images:
-            try:
-                bbox = page.get_image_bbox(img[0])
-                if bbox:
-                    area = (bbox.x1 - bbox.x0) * (bbox.y1 - bbox.y0)
-                    graphic_area += area
-            except Exception:
-                continue
+        # Учитываем изображения (bbox всех изображений - одним проходом по странице,
+        # вместо get_image_bbox на каждое изображение)
+        for info in image_infos:
+            rects.append(tuple(info["bbox"]))
         
         # Учитываем векторную графику (drawings)
-        drawings = page.get_drawings()
         for drawing in drawings:
             rect = drawing.get("rect")
             if rect:
-                area = (rect[2] - rect[0]) * (rect[3] - rect[1])
-                graphic_area += area
+                rects.append((rect[0], rect[1], rect[2], rect[3]))
+        
+        # Обрезаем по границам страницы (графика может выходить за них)
+        page_rect = page.rect
+        if NUMPY_AVAILABLE:
+            graphics = BBoxArray(rects).clip(page_rect.x0, page_rect.y0, page_rect.x1, page_rect.y1)
+            return min(graphics.union_area() / page_area, 1.0)
         
-        # Ограничиваем максимум 1.0 (может быть overlap)
-        coverage = min(graphic_area / page_area, 1.0)
+        clipped = [
+            (max(x0, page_rect.x0), max(y0, page_rect.y0),
+             min(x1, page_rect.x1), min(y1, page_rect.y1))
+            for x0, y0, x1, y1 in rects
+        ]
+        
+        coverage = min(union_area(clipped) / page_area, 1.0)
         
         return coverage
     
@@ -264,12 +516,15 @@ class PageAnalyzer:
         text = page.get_text().strip()
         return bool(text)
     
-    def is_dense_page(self, page: fitz.Page, threshold: int = None) -> bool:
+    def is_dense_page(self, meta: PageMetadata, threshold: int = None) -> bool:
         """
         Проверка: страница с высокой плотностью текста?
         
+        Принимает уже посчитанные PageMetadata (analyze_page), чтобы
+        не извлекать текст страницы повторно.
+        
         Args:
-            page: Объект страницы
+            meta: Метаданные страницы
             threshold: Порог плотности (по умолчанию HIGH_DENSITY_CHARS)
         
         Returns:
@@ -278,25 +533,58 @@ class PageAnalyzer:
         if threshold is None:
             threshold = self.HIGH_DENSITY_CHARS
         
-        density = self.estimate_text_density(page)
-        return density >= threshold
+        return meta.text_density >= threshold
     
-    def is_complex_layout(self, page: fitz.Page) -> bool:
+    def is_complex_layout(self, meta: PageMetadata) -> bool:
         """
         Проверка: сложный layout?
         
+        Args:
+            meta: Метаданные страницы (analyze_page)
+        
+        Returns:
+            bool: True если layout сложный
+        """
+        return meta.layout_type in (LayoutType.COMPLEX, LayoutType.NEWSPAPER)
+    
+    def is_dense_page_from_page(self, page: fitz.Page, threshold: int = None) -> bool:
+        """
+        is_dense_page для страницы без метаданных (одно извлечение текста)
+        
+        Args:
+            page: Объект страницы
+            threshold: Порог плотности (по умолчанию HIGH_DENSITY_CHARS)
+        
+        Returns:
+            bool: True если плотность высокая
+        """
+        if threshold is None:
+            threshold = self.HIGH_DENSITY_CHARS
+        
+        return self.estimate_text_density(page) >= threshold
+    
+    def is_complex_layout_from_page(self, page: fitz.Page) -> bool:
+        """
+        is_complex_layout для страницы без метаданных (одно извлечение текста)
+        
         Args:
             page: Объект страницы
         
         Returns:
             bool: True если layout сложный
         """
-        layout_type = self.detect_layout_type(page)
-        return layout_type in [LayoutType.COMPLEX, LayoutType.NEWSPAPER]
+        return self.detect_layout_type(page) in (LayoutType.COMPLEX, LayoutType.NEWSPAPER)
     
     def __repr__(self) -> str:
         """Строковое представление"""
+        if self.cache_dir:
+            return f"PageAnalyzer(cache_dir={self.cache_dir!r})"
         return "PageAnalyzer()"
 
 
 
+def _analyze_range(task: Tuple["PageAnalyzer", str, int, int]) -> List[PageMetadata]:
+    """Анализ диапазона страниц [start, end) в процессе пула (analyze_document)"""
+    analyzer, pdf_path, start, end = task
+    with fitz.open(pdf_path) as doc:
+        return [analyzer.analyze_page(doc[page_num]) for page_num in range(start, end)]
@@ -12,35 +12,17 @@ PDF Parser - базовый парсер PDF файлов
 """
 
 import fitz  # PyMuPDF
-import os
-import sys
-import contextlib
+import re
 from typing import Optional, Dict, Any
 from datetime import datetime
 from pathlib import Path
 
 from ..ir.models import DocumentMetadata
+from ..utils.stderr import suppress_stderr
 
 
-@contextlib.contextmanager
-def suppress_stderr():
-    """
-    Подавление stderr на уровне файловых дескрипторов.
-    Работает с низкоуровневыми C-библиотеками (PyMuPDF).
-    """
-    stderr_fd = sys.stderr.fileno()
-    # Сохраняем оригинальный stderr
-    with os.fdopen(os.dup(stderr_fd), 'wb') as old_stderr:
-        # Перенаправляем stderr в /dev/null
-        devnull_fd = os.open(os.devnull, os.O_WRONLY)
-        os.dup2(devnull_fd, stderr_fd)
-        os.close(devnull_fd)
-        try:
-            yield
-        finally:
-            # Восстанавливаем stderr
-            sys.stderr.flush()
-            os.dup2(old_stderr.fileno(), stderr_fd)
+# D:YYYYMMDD[HHmmSS] — временная зона и прочий хвост игнорируются
+_PDF_DATE_RE = re.compile(r"D?:?(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(\d{2}))?")
 
 
 class PDFParser:
@@ -153,19 +135,19 @@ class PDFParser:
         if not self._is_open:
             raise RuntimeError("PDF не открыт")
         
-        meta = self.doc.metadata
+        get = self.doc.metadata.get
         
         # Парсинг дат (PyMuPDF возвращает строки в формате PDF)
-        creation_date = self._parse_pdf_date(meta.get('creationDate'))
-        modification_date = self._parse_pdf_date(meta.get('modDate'))
+        creation_date = self._parse_pdf_date(get('creationDate'))
+        modification_date = self._parse_pdf_date(get('modDate'))
         
         return DocumentMetadata(
-            title=meta.get('title') or self.file_path.stem,
-            author=meta.get('author'),
-            subject=meta.get('subject'),
-            keywords=meta.get('keywords'),
-            creator=meta.get('creator'),
-            producer=meta.get('producer'),
+            title=get('title') or self.file_path.stem,
+            author=get('author'),
+            subject=get('subject'),
+            keywords=get('keywords'),
+            creator=get('creator'),
+            producer=get('producer'),
             creation_date=creation_date,
             modification_date=modification_date,
             source_file=str(self.file_path),
@@ -189,19 +171,17 @@ class PDFParser:
         if not date_str:
             return None
         
+        m = _PDF_DATE_RE.match(date_str)
+        if m is None:
+            return None
+        
         try:
-            # Убираем префикс D: и временную зону
-            date_str = date_str.replace("D:", "")
-            date_str = date_str.split("+")[0].split("-")[0]
-            
-            # Парсим основную часть
-            if len(date_str) >= 14:
-                return datetime.strptime(date_str[:14], "%Y%m%d%H%M%S")
-            elif len(date_str) >= 8:
-                return datetime.strptime(date_str[:8], "%Y%m%d")
-            else:
-                return None
-        except Exception:
+            if m.group(4) is None:
+                return datetime(int(m[1]), int(m[2]), int(m[3]))
+            return datetime(int(m[1]), int(m[2]), int(m[3]),
+                            int(m[4]), int(m[5]), int(m[6]))
+        except ValueError:
+            # Некорректные значения (например, месяц 13)
             return None
     
     def get_page_info(self, page_num: int) -> Dict[str, Any]:
@@ -18,7 +18,15 @@ Content Router - маршрутизация контента PDF
 """
 
 import fitz  # PyMuPDF
-from typing import Optional
+from bisect import bisect_left
+from typing import Callable, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
 
 from ..models.data_models import (
     RouteDecision,
@@ -75,6 +83,24 @@ class ContentRouter:
     MODE_LARGE_MAX = 5000     # До 5000 токенов → Large (400 vision tokens)
     # > 5000 токенов → Gundam (dynamic tiles)
     
+    # Решение по номеру правила (индекс 0 не используется)
+    _RULE_DECISIONS = (
+        None,
+        RouteDecision.OCR,
+        RouteDecision.OCR,
+        RouteDecision.OCR,
+        RouteDecision.OCR,
+        RouteDecision.HYBRID,
+        RouteDecision.OCR,
+        RouteDecision.NATIVE,
+    )
+    
+    # Обоснования правил без подстановки значений
+    _STATIC_REASONS = {
+        1: "Отсутствует текстовый слой (скан или изображение)",
+        2: "Газетный layout (multi-column, high density)",
+    }
+    
     def __init__(self, analyzer: Optional[PageAnalyzer] = None, 
                  prioritize_accuracy: bool = True):
         """
@@ -87,6 +113,21 @@ class ContentRouter:
         """
         self.analyzer = analyzer or PageAnalyzer()
         self.prioritize_accuracy = prioritize_accuracy
+        
+        # Таблицы "порог плотности → режим" (по prioritize_accuracy):
+        # modes[i] для плотности <= thresholds[i], последний режим - выше всех порогов
+        self._mode_tables = {
+            # Приоритет точности: Base вместо Small/Tiny, Large, Gundam для сверхплотных
+            True: (
+                (self.MODE_BASE_MAX, self.MODE_LARGE_MAX),
+                (OCRMode.BASE, OCRMode.LARGE, OCRMode.GUNDAM),
+            ),
+            # Баланс скорости и точности
+            False: (
+                (self.MODE_TINY_MAX, self.MODE_SMALL_MAX, self.MODE_BASE_MAX, self.MODE_LARGE_MAX),
+                (OCRMode.TINY, OCRMode.SMALL, OCRMode.BASE, OCRMode.LARGE, OCRMode.GUNDAM),
+            ),
+        }
     
     def route_page(self, page: fitz.Page, 
                    metadata: Optional[PageMetadata] = None) -> RouteDecisionInfo:
@@ -114,77 +155,204 @@ class ContentRouter:
             metadata=metadata
         )
     
-    def _apply_routing_rules(self, meta: PageMetadata) -> tuple[RouteDecision, Optional[OCRMode], str]:
+    def route_document(self, pdf_path: str,
+                       workers: Optional[int] = None) -> List[RouteDecisionInfo]:
+        """
+        Принять решения о маршрутизации для всех страниц документа
+        
+        Анализ страниц (основная стоимость) выполняется в пуле процессов
+        через PageAnalyzer.analyze_document; правила применяются в текущем процессе.
+        
+        Args:
+            pdf_path: Путь к PDF файлу
+            workers: Количество процессов (по умолчанию os.cpu_count())
+        
+        Returns:
+            RouteDecisionInfo для каждой страницы (в порядке страниц)
+        """
+        return self.route_pages(self.analyzer.analyze_document(pdf_path, workers=workers))
+    
+    def route_pages(self, metas: Sequence[PageMetadata]) -> List[RouteDecisionInfo]:
+        """
+        Принять решения для набора уже проанализированных страниц
+        
+        Правила вычисляются векторно: характеристики страниц собираются в
+        массивы, номер сработавшего правила выбирается одним np.select
+        (в порядке приоритета, как в _apply_routing_rules), режимы OCR -
+        одним select_ocr_modes.
+        
+        Args:
+            metas: PageMetadata страниц
+        
+        Returns:
+            RouteDecisionInfo для каждой страницы (в том же порядке)
+        """
+        if not NUMPY_AVAILABLE or not metas:
+            return [self.route_page(None, metadata=meta) for meta in metas]
+        
+        count = len(metas)
+        has_text = np.fromiter((m.has_text_layer for m in metas), dtype=bool, count=count)
+        density = np.fromiter((m.text_density for m in metas), dtype=np.int64, count=count)
+        coverage = np.fromiter((m.bbox_coverage for m in metas), dtype=np.float64, count=count)
+        newspaper = np.fromiter((m.layout_type == LayoutType.NEWSPAPER for m in metas), dtype=bool, count=count)
+        complex_layout = np.fromiter((m.layout_type == LayoutType.COMPLEX for m in metas), dtype=bool, count=count)
+        has_graphics = np.fromiter(
+            (m.image_count > 0 or m.drawing_count > 5 for m in metas), dtype=bool, count=count
+        )
+        
+        accuracy = self.prioritize_accuracy
+        rules = np.select(
+            [
+                ~has_text,
+                newspaper,
+                complex_layout,
+                coverage > self.BBOX_COVERAGE_HIGH,
+                (coverage > self.BBOX_COVERAGE_LOW) & has_graphics & accuracy,
+                (density > self.TEXT_DENSITY_VERY_HIGH) & accuracy,
+            ],
+            [1, 2, 3, 4, 5, 6],
+            default=7
+        )
+        
+        modes = self.select_ocr_modes(density, [m.layout_type for m in metas])
+        
+        return [
+            RouteDecisionInfo(
+                decision=self._RULE_DECISIONS[rule],
+                ocr_mode=None if rule == 7 else mode,
+                reason=self._lazy_reason(rule, meta),
+                metadata=meta
+            )
+            for rule, mode, meta in zip(rules.tolist(), modes, metas)
+        ]
+    
+    def _apply_routing_rules(
+        self, meta: PageMetadata
+    ) -> tuple[RouteDecision, Optional[OCRMode], Union[str, Callable[[], str]]]:
         """
         Применить правила маршрутизации
         
+        Обоснования с подстановкой значений возвращаются функциями:
+        строка форматируется только при чтении (RouteDecisionInfo.reason_str).
+        
         Returns:
             (decision, ocr_mode, reason)
         """
-        # ПРАВИЛО 1: Нет текстового слоя → OCR
-        if not meta.has_text_layer:
+        rule = self._match_rule(meta)
+        
+        if rule == 7:
+            ocr_mode = None
+        else:
+            # Газетный layout (правило 2) → Gundam внутри _select_ocr_mode
             ocr_mode = self._select_ocr_mode(meta.text_density, meta.layout_type)
-            return (
-                RouteDecision.OCR,
-                ocr_mode,
-                "Отсутствует текстовый слой (скан или изображение)"
-            )
         
-        # ПРАВИЛО 2: Газетный layout → OCR Gundam
-        if meta.layout_type == LayoutType.NEWSPAPER:
-            return (
-                RouteDecision.OCR,
-                OCRMode.GUNDAM,
-                "Газетный layout (multi-column, high density)"
-            )
+        return self._RULE_DECISIONS[rule], ocr_mode, self._lazy_reason(rule, meta)
+    
+    @property
+    def prioritize_accuracy(self) -> bool:
+        """Приоритет точности над скоростью"""
+        return self._prioritize_accuracy
+    
+    @prioritize_accuracy.setter
+    def prioritize_accuracy(self, value: bool):
+        # Правила зависят от режима - пересобираем специализированную функцию
+        self._prioritize_accuracy = value
+        self._match_rule = self._build_rule_matcher()
+    
+    def _build_rule_matcher(self) -> Callable[[PageMetadata], int]:
+        """
+        Собрать функцию "номер первого сработавшего правила (1-7)"
         
-        # ПРАВИЛО 3: Сложный layout → OCR
-        if meta.layout_type == LayoutType.COMPLEX:
-            ocr_mode = self._select_ocr_mode(meta.text_density, meta.layout_type)
-            return (
-                RouteDecision.OCR,
-                ocr_mode,
-                f"Сложный layout (тип: {meta.layout_type.value})"
-            )
+        Пороги и режим точности не меняются между страницами, поэтому
+        они связываются в замыкание один раз: на каждой странице нет
+        чтения атрибутов self, а ветка prioritize_accuracy выбрана заранее.
         
-        # ПРАВИЛО 4: Высокое покрытие графикой → OCR
-        if meta.bbox_coverage > self.BBOX_COVERAGE_HIGH:
-            ocr_mode = self._select_ocr_mode(meta.text_density, meta.layout_type)
+        Returns:
+            Функция meta → номер правила
+        """
+        coverage_low = self.BBOX_COVERAGE_LOW
+        coverage_high = self.BBOX_COVERAGE_HIGH
+        density_very_high = self.TEXT_DENSITY_VERY_HIGH
+        newspaper = LayoutType.NEWSPAPER
+        complex_layout = LayoutType.COMPLEX
+        
+        def match_common(meta: PageMetadata) -> int:
+            # ПРАВИЛО 1: Нет текстового слоя → OCR
+            if not meta.has_text_layer:
+                return 1
+            
+            layout_type = meta.layout_type
+            
+            # ПРАВИЛО 2: Газетный layout → OCR Gundam
+            if layout_type == newspaper:
+                return 2
+            
+            # ПРАВИЛО 3: Сложный layout → OCR
+            if layout_type == complex_layout:
+                return 3
+            
+            # ПРАВИЛО 4: Высокое покрытие графикой → OCR
+            if meta.bbox_coverage > coverage_high:
+                return 4
+            
+            return 0
+        
+        if not self.prioritize_accuracy:
+            # Правила 5 и 6 действуют только при приоритете точности
+            def match_balanced(meta: PageMetadata) -> int:
+                # ПРАВИЛО 7 (default): Простой случай → NATIVE
+                return match_common(meta) or 7
+            
+            return match_balanced
+        
+        def match_accuracy(meta: PageMetadata) -> int:
+            rule = match_common(meta)
+            if rule:
+                return rule
+            
+            # ПРАВИЛО 5: Средние показатели → HYBRID
+            # Есть текст, но много графики → гибридный подход:
+            # используем OCR для графических элементов
+            if (meta.bbox_coverage > coverage_low and
+                    (meta.image_count > 0 or meta.drawing_count > 5)):
+                return 5
+            
+            # ПРАВИЛО 6: Очень высокая плотность текста → OCR Large/Gundam
+            # (нативный парсинг может терять структуру)
+            if meta.text_density > density_very_high:
+                return 6
+            
+            # ПРАВИЛО 7 (default): Простой случай → NATIVE
+            return 7
+        
+        return match_accuracy
+    
+    @classmethod
+    def _lazy_reason(cls, rule: int, meta: PageMetadata) -> Union[str, Callable[[], str]]:
+        """Обоснование правила: готовая строка или функция, форматирующая его по требованию"""
+        reason = cls._STATIC_REASONS.get(rule)
+        if reason is not None:
+            return reason
+        return lambda: cls._format_reason(rule, meta)
+    
+    @staticmethod
+    def _format_reason(rule: int, meta: PageMetadata) -> str:
+        """Обоснование правила 3-7 с характеристиками страницы"""
+        if rule == 3:
+            return f"Сложный layout (тип: {meta.layout_type.value})"
+        if rule == 4:
+            return f"Высокое покрытие графикой ({meta.bbox_coverage:.1%})"
+        if rule == 5:
             return (
-                RouteDecision.OCR,
-                ocr_mode,
-                f"Высокое покрытие графикой ({meta.bbox_coverage:.1%})"
+                f"Гибридный: текст нативно, графика через OCR "
+                f"(изображений: {meta.image_count}, векторов: {meta.drawing_count})"
             )
-        
-        # ПРАВИЛО 5: Средние показатели → HYBRID
-        if (meta.bbox_coverage > self.BBOX_COVERAGE_LOW and 
-            (meta.image_count > 0 or meta.drawing_count > 5)):
-            # Есть текст, но много графики → гибридный подход
-            # Приоритет точности: используем OCR для графических элементов
-            if self.prioritize_accuracy:
-                ocr_mode = self._select_ocr_mode(meta.text_density, meta.layout_type)
-                return (
-                    RouteDecision.HYBRID,
-                    ocr_mode,
-                    f"Гибридный: текст нативно, графика через OCR "
-                    f"(изображений: {meta.image_count}, векторов: {meta.drawing_count})"
-                )
-        
-        # ПРАВИЛО 6: Очень высокая плотность текста → OCR Large/Gundam
-        # (нативный парсинг может терять структуру)
-        if self.prioritize_accuracy and meta.text_density > self.TEXT_DENSITY_VERY_HIGH:
-            ocr_mode = self._select_ocr_mode(meta.text_density, meta.layout_type)
+        if rule == 6:
             return (
-                RouteDecision.OCR,
-                ocr_mode,
                 f"Очень высокая плотность текста ({meta.text_density} токенов), "
                 f"OCR сохранит структуру лучше"
             )
-        
-        # ПРАВИЛО 7 (default): Простой случай → NATIVE
         return (
-            RouteDecision.NATIVE,
-            None,
             f"Стандартный PDF с текстовым слоем "
             f"(layout: {meta.layout_type.value}, плотность: {meta.text_density} токенов)"
         )
@@ -211,28 +379,38 @@ class ContentRouter:
         if layout_type == LayoutType.NEWSPAPER:
             return OCRMode.GUNDAM
         
-        # Приоритет точности: выбираем более мощные режимы
-        if self.prioritize_accuracy:
-            if text_density <= self.MODE_SMALL_MAX:
-                return OCRMode.BASE  # Используем Base вместо Small/Tiny
-            elif text_density <= self.MODE_BASE_MAX:
-                return OCRMode.BASE  # Рекомендуемый режим
-            elif text_density <= self.MODE_LARGE_MAX:
-                return OCRMode.LARGE  # Для плотных страниц
-            else:
-                return OCRMode.GUNDAM  # Для сверхплотных
-        else:
-            # Баланс скорости и точности
-            if text_density <= self.MODE_TINY_MAX:
-                return OCRMode.TINY
-            elif text_density <= self.MODE_SMALL_MAX:
-                return OCRMode.SMALL
-            elif text_density <= self.MODE_BASE_MAX:
-                return OCRMode.BASE
-            elif text_density <= self.MODE_LARGE_MAX:
-                return OCRMode.LARGE
-            else:
-                return OCRMode.GUNDAM
+        thresholds, modes = self._mode_tables[self.prioritize_accuracy]
+        # Плотность <= MAX порога → режим этого порога (bisect_left)
+        return modes[bisect_left(thresholds, text_density)]
+    
+    def select_ocr_modes(self, text_densities: Sequence[int],
+                         layout_types: Sequence[LayoutType]) -> List[OCRMode]:
+        """
+        Выбор режимов OCR для набора страниц (весь документ за один вызов)
+        
+        Args:
+            text_densities: Плотности страниц (токены)
+            layout_types: Типы layout страниц
+        
+        Returns:
+            List[OCRMode]: Режимы в том же порядке (как _select_ocr_mode)
+        """
+        if not NUMPY_AVAILABLE:
+            return [
+                self._select_ocr_mode(density, layout)
+                for density, layout in zip(text_densities, layout_types)
+            ]
+        
+        thresholds, modes = self._mode_tables[self.prioritize_accuracy]
+        indices = np.searchsorted(thresholds, np.asarray(text_densities), side="left")
+        
+        newspaper = np.fromiter(
+            (layout == LayoutType.NEWSPAPER for layout in layout_types),
+            dtype=bool, count=len(indices)
+        )
+        indices[newspaper] = len(modes) - 1  # Gundam
+        
+        return [modes[index] for index in indices.tolist()]
     
     def __repr__(self) -> str:
         """Строковое представление"""
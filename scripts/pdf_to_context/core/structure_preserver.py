@@ -15,9 +15,12 @@ Structure Preserver - встраивание OCR результатов в ст
 - Dependency Inversion: Зависит от абстракции OCRClient
 """
 
-from typing import List, Union, Optional
-from PIL import Image
-import io
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List, Union, Optional, Dict, Tuple, Callable
 
 from ..models.data_models import (
     TextBlock,
@@ -25,10 +28,48 @@ from ..models.data_models import (
     DrawingBlock,
     TableBlock,
     OCRBlock,
+    OCRResponse,
     BBox,
     ContentType
 )
 from ..extractors.ocr_client import OCRClient
+from ..extractors.circuit_breaker import CircuitOpenError
+from ..utils.image_hash import dhash, hamming_distance
+from ..utils.block_order import sort_reading_order
+from ..utils.image_resize import preshrink_many
+
+
+# Результат OCR "пропущено": размыкатель OCRClient открыт, запрос не отправлялся
+# (в отличие от None - запрос отправлен, но OCR не удался)
+_OCR_SKIPPED = object()
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов (RPS) для асинхронной обработки
+    
+    Равномерно распределяет вызовы: не чаще одного раза в 1/rps секунд.
+    Рассчитан на работу внутри одного event loop.
+    """
+    
+    def __init__(self, requests_per_second: float):
+        """
+        Args:
+            requests_per_second: Максимальное число запросов в секунду
+        """
+        if requests_per_second <= 0:
+            raise ValueError(f"requests_per_second должен быть > 0: {requests_per_second}")
+        self.min_interval = 1.0 / requests_per_second
+        self._next_ts = 0.0
+    
+    async def acquire(self):
+        """Дождаться слота для следующего запроса"""
+        now = time.monotonic()
+        wait = self._next_ts - now
+        # Резервируем слот до await, чтобы параллельные корутины не заняли тот же
+        self._next_ts = max(now, self._next_ts) + self.min_interval
+        if wait > 0:
+            await asyncio.sleep(wait)
 
 
 class StructurePreserver:
@@ -46,23 +87,52 @@ class StructurePreserver:
     5. Возвращает полную структуру с сохранением layout
     """
     
-    def __init__(self, ocr_client: Optional[OCRClient] = None, min_area: float = 1000.0):
+    # Длинная сторона изображений при preshrink (= base_size запросов OCR)
+    PRESHRINK_SIZE = 1024
+    
+    def __init__(self,
+                 ocr_client: Optional[OCRClient] = None,
+                 min_area: float = 1000.0,
+                 max_in_flight: int = 8,
+                 requests_per_second: Optional[float] = None,
+                 dedupe: bool = False,
+                 dedupe_distance: int = 4,
+                 preshrink: bool = False):
         """
         Инициализация
         
         Args:
             ocr_client: Клиент для OCR (если None - пропускаем OCR)
-            min_area: Минимальная площадь изображения для OCR (px²)
+            min_area: Минимальная площадь изображения для OCR (px²);
+                     меньшие (иконки, маркеры) не распознаются. 0 - все изображения
+            max_in_flight: Максимум одновременных OCR запросов на страницу
+            requests_per_second: Лимит частоты OCR запросов (None - без лимита)
+            dedupe: Распознавать почти одинаковые изображения (dHash) один раз
+                   и копировать результат остальным
+            dedupe_distance: Максимальное расстояние Хэмминга между dHash дубликатов
+            preshrink: Уменьшать крупные изображения до PRESHRINK_SIZE (JPEG)
+                      перед отправкой в OCR (в пуле процессов)
+        
+        Note:
+            dedupe выключен по умолчанию: схемы с одинаковой компоновкой,
+            но разными подписями могут дать близкие хэши.
         """
         self.ocr_client = ocr_client
         self.min_area = min_area
+        self.max_in_flight = max(1, max_in_flight)
+        self._rate_limiter = RateLimiter(requests_per_second) if requests_per_second else None
+        self.dedupe = dedupe
+        self.dedupe_distance = dedupe_distance
+        self.preshrink = preshrink
         self._stats = {
             "total_images": 0,
             "total_drawings": 0,
             "ocr_processed": 0,
             "ocr_skipped": 0,
-            "ocr_errors": 0
+            "ocr_errors": 0,
+            "ocr_deduplicated": 0
         }
+        self._circuit_warned = False  # Предупреждение об открытом размыкателе уже выведено
     
     def process_structure(
         self,
@@ -72,6 +142,9 @@ class StructurePreserver:
         """
         Обработка структуры страницы
         
+        OCR запросы ждут сеть, поэтому изображения страницы распознаются
+        в пуле из max_in_flight потоков (GIL освобождается на время ожидания).
+        
         Args:
             blocks: Список блоков с placeholder'ами для графики
             page_num: Номер страницы (для логирования)
@@ -79,20 +152,355 @@ class StructurePreserver:
         Returns:
             Полная структура с встроенными OCR результатами
         """
+        indices = self._ocr_candidates(blocks)
+        results = self._ocr_items(
+            [(blocks[index], page_num) for index in indices],
+            self._process_images_threaded
+        )
+        return self._assemble(blocks, dict(zip(indices, results)))
+    
+    async def process_structure_async(
+        self,
+        blocks: List[Union[TextBlock, ImageBlock, DrawingBlock, TableBlock]],
+        page_num: int
+    ) -> List[Union[TextBlock, OCRBlock, DrawingBlock, TableBlock]]:
+        """
+        Асинхронная обработка структуры страницы
+        
+        OCR запросы отправляются параллельно (не более max_in_flight одновременно,
+        с учетом лимита requests_per_second). Время страницы с N изображениями:
+        ~latency * ceil(N / max_in_flight) вместо N * latency.
+        
+        Args:
+            blocks: Список блоков с placeholder'ами для графики
+            page_num: Номер страницы (для логирования)
+        
+        Returns:
+            Полная структура с встроенными OCR результатами (как process_structure)
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        
+        async def run(block: ImageBlock) -> Optional[OCRBlock]:
+            async with semaphore:
+                if self._rate_limiter:
+                    await self._rate_limiter.acquire()
+                # OCRClient синхронный (requests) - выполняем в пуле потоков
+                return await loop.run_in_executor(None, self._process_image_ocr, block, page_num)
+        
+        indices = self._ocr_candidates(blocks)
+        items = [(blocks[index], page_num) for index in indices]
+        if self.dedupe and len(items) > 1:
+            # dHash декодирует и уменьшает каждое изображение (PIL) - не в event loop
+            owner = await loop.run_in_executor(None, self._group_duplicates, items)
+        else:
+            owner = self._group_duplicates(items)
+        unique = [i for i, representative in enumerate(owner) if representative == i]
+        unique_items = [items[i] for i in unique]
+        upload_items = unique_items
+        if self.preshrink:
+            upload_items = await loop.run_in_executor(None, self._preshrink_items, unique_items)
+        
+        results = await asyncio.gather(
+            *(run(block) for block, _ in upload_items),
+            return_exceptions=True
+        )
+        results = self._restore_ids(
+            unique_items, upload_items,
+            [None if isinstance(result, BaseException) else result for result in results]
+        )
+        unique_results = dict(zip(unique, results))
+        results = self._expand_duplicates(items, owner, unique_results)
+        return self._assemble(blocks, dict(zip(indices, results)))
+    
+    def process_document(
+        self,
+        pages: List[Tuple[List[Union[TextBlock, ImageBlock, DrawingBlock, TableBlock]], int]],
+        batch_size: int = 16
+    ) -> List[List[Union[TextBlock, OCRBlock, DrawingBlock, TableBlock]]]:
+        """
+        Обработка структуры нескольких страниц с пакетным OCR
+        
+        Изображения со всех страниц собираются и отправляются пакетами
+        по batch_size (OCRClient.ocr_figures_batch), затем результаты
+        раскладываются обратно по страницам.
+        
+        Args:
+            pages: Список (blocks, page_num) для каждой страницы
+            batch_size: Максимум изображений в одном запросе
+        
+        Returns:
+            Структура каждой страницы (в порядке pages), как в process_structure
+        """
+        # (индекс страницы, индекс блока) для всех изображений документа
+        candidates = [
+            (page_index, block_index)
+            for page_index, (blocks, _) in enumerate(pages)
+            for block_index in self._ocr_candidates(blocks)
+        ]
+        
+        batch_size = max(1, batch_size)
+        
+        def ocr_batched(items: List[Tuple[ImageBlock, int]]) -> List[Optional[OCRBlock]]:
+            results = []
+            for start in range(0, len(items), batch_size):
+                results.extend(self._process_images_batch(items[start:start + batch_size]))
+            return results
+        
+        # Дедупликация - по всему документу, до разбиения на пакеты
+        results = self._ocr_items(
+            [
+                (pages[page_index][0][block_index], pages[page_index][1])
+                for page_index, block_index in candidates
+            ],
+            ocr_batched
+        )
+        
+        page_results: List[Dict[int, Optional[OCRBlock]]] = [{} for _ in pages]
+        for (page_index, block_index), ocr_block in zip(candidates, results):
+            page_results[page_index][block_index] = ocr_block
+        
+        return [
+            self._assemble(blocks, page_results[page_index])
+            for page_index, (blocks, _) in enumerate(pages)
+        ]
+    
+    def _process_images_batch(self, items: List[Tuple[ImageBlock, int]]) -> List[Optional[OCRBlock]]:
+        """
+        Пакетный OCR изображений
+        
+        Args:
+            items: Список (image_block, page_num)
+        
+        Returns:
+            OCRBlock (или None при ошибке) для каждого элемента
+        """
+        if not self.ocr_client:
+            return [None] * len(items)
+        
+        try:
+            responses = self.ocr_client.ocr_figures_batch(
+                [(block.image_data, block.bbox, page_num) for block, page_num in items],
+                prompt_type="ocr_simple",  # Как в _process_image_ocr
+                base_size=1024,
+                image_size=1024
+            )
+        except CircuitOpenError as e:
+            self._warn_circuit_open(e)
+            return [_OCR_SKIPPED] * len(items)
+        except Exception as e:
+            print(f"⚠️  Пакетный OCR не удался ({e}), обработка по одному изображению")
+            return [self._process_image_ocr(block, page_num) for block, page_num in items]
+        
+        return [
+            self._image_ocr_block(block, page_num, response) if response else None
+            for (block, page_num), response in zip(items, responses)
+        ]
+    
+    def _process_images_threaded(self, items: List[Tuple[ImageBlock, int]]) -> List[Optional[OCRBlock]]:
+        """
+        OCR изображений в пуле потоков (порядок результатов = порядок items)
+        
+        Args:
+            items: Список (image_block, page_num)
+        
+        Returns:
+            OCRBlock (или None) для каждого элемента
+        """
+        if len(items) <= 1 or self.max_in_flight == 1:
+            return [self._process_image_ocr(block, page_num) for block, page_num in items]
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(items))) as executor:
+            return list(executor.map(lambda item: self._process_image_ocr(*item), items))
+    
+    def _ocr_items(
+        self,
+        items: List[Tuple[ImageBlock, int]],
+        ocr_many: Callable[[List[Tuple[ImageBlock, int]]], List[Optional[OCRBlock]]]
+    ) -> List[Optional[OCRBlock]]:
+        """
+        OCR списка изображений с учетом дедупликации
+        
+        Args:
+            items: Список (image_block, page_num)
+            ocr_many: Функция OCR для списка уникальных изображений
+        
+        Returns:
+            OCRBlock (или None) для каждого элемента items
+        """
+        owner = self._group_duplicates(items)
+        unique = [i for i, representative in enumerate(owner) if representative == i]
+        unique_items = [items[i] for i in unique]
+        upload_items = self._preshrink_items(unique_items)
+        results = self._restore_ids(unique_items, upload_items, ocr_many(upload_items))
+        return self._expand_duplicates(items, owner, dict(zip(unique, results)))
+    
+    def _preshrink_items(self, items: List[Tuple[ImageBlock, int]]) -> List[Tuple[ImageBlock, int]]:
+        """
+        Уменьшение крупных изображений перед OCR (если включен preshrink)
+        
+        Args:
+            items: Список (image_block, page_num)
+        
+        Returns:
+            Список той же длины; уменьшенные изображения - копии ImageBlock
+            с новыми image_data, остальные элементы - без изменений
+        """
+        if not self.preshrink:
+            return items
+        
+        # Размер известен из PDF - маленькие изображения даже не декодируем
+        targets = [
+            index for index, (block, _) in enumerate(items)
+            if not (block.width and block.height
+                    and max(block.width, block.height) <= self.PRESHRINK_SIZE)
+        ]
+        if not targets:
+            return items
+        
+        shrunk = preshrink_many([items[index][0].image_data for index in targets], self.PRESHRINK_SIZE)
+        
+        upload_items = list(items)
+        for index, image_data in zip(targets, shrunk):
+            block, page_num = items[index]
+            if image_data != block.image_data:
+                upload_items[index] = (replace(block, image_data=image_data), page_num)
+        return upload_items
+    
+    def _restore_ids(
+        self,
+        items: List[Tuple[ImageBlock, int]],
+        upload_items: List[Tuple[ImageBlock, int]],
+        results: List[Optional[OCRBlock]]
+    ) -> List[Optional[OCRBlock]]:
+        """ID OCRBlock - от исходного ImageBlock, а не от уменьшенной копии"""
+        if upload_items is items:
+            return results
+        
+        return [
+            replace(result, id=self._ocr_block_id("image", page_num, block))
+            if isinstance(result, OCRBlock) and upload is not block else result
+            for (block, page_num), (upload, _), result in zip(items, upload_items, results)
+        ]
+    
+    def _group_duplicates(self, items: List[Tuple[ImageBlock, int]]) -> List[int]:
+        """
+        Группировка почти одинаковых изображений по dHash
+        
+        Args:
+            items: Список (image_block, page_num)
+        
+        Returns:
+            Для каждого элемента - индекс представителя группы (сам элемент, если уникален)
+        """
+        owner = list(range(len(items)))
+        if not self.dedupe or len(items) < 2:
+            return owner
+        
+        representatives: List[Tuple[int, int]] = []  # (hash, index)
+        for index, (block, _) in enumerate(items):
+            image_hash = dhash(block.image_data)
+            if image_hash is None:
+                continue
+            
+            for representative_hash, representative in representatives:
+                if hamming_distance(image_hash, representative_hash) <= self.dedupe_distance:
+                    owner[index] = representative
+                    break
+            else:
+                representatives.append((image_hash, index))
+        
+        return owner
+    
+    def _expand_duplicates(
+        self,
+        items: List[Tuple[ImageBlock, int]],
+        owner: List[int],
+        unique_results: Dict[int, Optional[OCRBlock]]
+    ) -> List[Optional[OCRBlock]]:
+        """
+        Копирование результата представителя на дубликаты (с их bbox и страницей)
+        """
+        results = []
+        for index, (block, page_num) in enumerate(items):
+            representative = owner[index]
+            ocr_block = unique_results.get(representative)
+            
+            if representative != index and isinstance(ocr_block, OCRBlock):
+                self._stats["ocr_deduplicated"] += 1
+                ocr_block = replace(
+                    ocr_block,
+                    id=self._ocr_block_id("image", page_num, block),
+                    bbox=block.bbox,
+                    page_num=page_num,
+                    metadata={**ocr_block.metadata, "duplicate_of": ocr_block.id}
+                )
+            
+            results.append(ocr_block)
+        
+        return results
+    
+    @staticmethod
+    def _combine_blocks(blocks: List[OCRBlock]) -> Tuple[OCRBlock, str]:
+        """
+        Первый блок и объединенный текст за один проход по блокам OCR
+        
+        Returns:
+            (первый блок, содержимое всех блоков через перевод строки)
+        """
+        iterator = iter(blocks)
+        first_block = next(iterator)
+        parts = [first_block.content]
+        for block in iterator:
+            parts.append(block.content)
+        return first_block, "\n".join(parts)
+    
+    @staticmethod
+    def _ocr_block_id(kind: str, page_num: int, block) -> str:
+        """
+        ID OCRBlock для исходного блока (kind: image / drawing)
+        
+        Детерминированный: хэш содержимого изображения и bbox, поэтому
+        повторный прогон дает те же ID, а одинаковые изображения
+        в разных местах страницы - разные.
+        """
+        digest = hashlib.blake2b(block.image_data or b"", digest_size=8)
+        bbox = block.bbox
+        digest.update(f"{bbox.x0},{bbox.y0},{bbox.x1},{bbox.y1}".encode("ascii"))
+        return f"ocr_{kind}_{page_num}_{digest.hexdigest()}"
+    
+    def _ocr_candidates(self, blocks: List) -> List[int]:
+        """Индексы блоков, требующих OCR (не меньше min_area)"""
+        return [
+            index for index, block in enumerate(blocks)
+            if isinstance(block, ImageBlock) and block.needs_ocr
+            and block.bbox.area() >= self.min_area
+        ]
+    
+    def _assemble(self, blocks: List, ocr_results: Dict[int, Optional[OCRBlock]]) -> List:
+        """
+        Сборка структуры страницы из исходных блоков и результатов OCR
+        
+        Args:
+            blocks: Исходные блоки страницы
+            ocr_results: Индекс блока → OCRBlock (или None при ошибке)
+        
+        Returns:
+            Блоки в порядке чтения
+        """
         processed_blocks = []
         
-        for block in blocks:
-            # Если это ImageBlock с флагом needs_ocr - обрабатываем через OCR
-            if isinstance(block, ImageBlock) and block.needs_ocr:
+        for index, block in enumerate(blocks):
+            # Если это ImageBlock с флагом needs_ocr - подставляем результат OCR
+            if index in ocr_results:
                 self._stats["total_images"] += 1
+                ocr_block = ocr_results[index]
                 
-                # Обрабатываем ВСЕ изображения без ограничения по площади
-                # (схемы BPMN могут быть любого размера)
-                
-                # OCR обработка
-                ocr_block = self._process_image_ocr(block, page_num)
-                
-                if ocr_block:
+                if ocr_block is _OCR_SKIPPED:
+                    # OCR сервис недоступен (размыкатель открыт) - оставляем ImageBlock
+                    self._stats["ocr_skipped"] += 1
+                    processed_blocks.append(block)
+                elif ocr_block:
                     self._stats["ocr_processed"] += 1
                     processed_blocks.append(ocr_block)
                 else:
@@ -100,6 +508,12 @@ class StructurePreserver:
                     # OCR не удался - оставляем оригинальный ImageBlock
                     processed_blocks.append(block)
             
+            elif isinstance(block, ImageBlock) and block.needs_ocr:
+                # Меньше min_area - OCR не вызывался, оставляем ImageBlock
+                self._stats["total_images"] += 1
+                self._stats["ocr_skipped"] += 1
+                processed_blocks.append(block)
+            
             # DrawingBlock (векторная графика) - полностью игнорируем
             # Векторные примитивы (линии, стрелки, рамки) не нужны в контексте
             elif isinstance(block, DrawingBlock):
@@ -111,9 +525,7 @@ class StructurePreserver:
                 processed_blocks.append(block)
         
         # Сортируем блоки в порядке чтения: страница → Y (сверху вниз) → X (слева направо)
-        sorted_blocks = sorted(processed_blocks, key=lambda b: self._get_position_key(b))
-        
-        return sorted_blocks
+        return sort_reading_order(processed_blocks)
     
     def _process_image_ocr(self, image_block: ImageBlock, page_num: int) -> Optional[OCRBlock]:
         """
@@ -124,7 +536,8 @@ class StructurePreserver:
             page_num: Номер страницы
         
         Returns:
-            OCRBlock с результатом или None при ошибке
+            OCRBlock с результатом, None при ошибке,
+            _OCR_SKIPPED если OCR сервис недоступен (размыкатель открыт)
         """
         if not self.ocr_client:
             return None
@@ -141,36 +554,46 @@ class StructurePreserver:
                 image_size=1024
             )
             
-            # Если OCR вернул результаты
-            if ocr_response and ocr_response.blocks:
-                # Объединяем все блоки в один OCRBlock
-                combined_content = "\n".join([b.content for b in ocr_response.blocks])
-                first_block = ocr_response.blocks[0]
-                
-                # Создаем OCRBlock
-                ocr_block = OCRBlock(
-                    id=f"ocr_image_{page_num}_{id(image_block)}",
-                    bbox=image_block.bbox,  # Сохраняем оригинальный bbox
-                    content=combined_content,
-                    page_num=page_num,
-                    type=first_block.type,
-                    confidence=ocr_response.confidence_avg,
-                    metadata={
-                        "source": "image_ocr",
-                        "original_format": image_block.format,
-                        "markdown": ocr_response.markdown,
-                        **first_block.metadata
-                    }
-                )
-                
-                return ocr_block
-            else:
-                return None
-                
+            return self._image_ocr_block(image_block, page_num, ocr_response)
+        
+        except CircuitOpenError as e:
+            self._warn_circuit_open(e)
+            return _OCR_SKIPPED
         except Exception as e:
             print(f"⚠️  OCR error for image on page {page_num}: {e}")
             return None
     
+    def _image_ocr_block(self, image_block: ImageBlock, page_num: int,
+                         ocr_response: Optional[OCRResponse]) -> Optional[OCRBlock]:
+        """
+        Построить OCRBlock из ответа OCR для изображения
+        
+        Returns:
+            OCRBlock или None, если OCR не вернул блоков
+        """
+        # Если OCR вернул результаты
+        if ocr_response and ocr_response.blocks:
+            # Объединяем все блоки в один OCRBlock
+            first_block, combined_content = self._combine_blocks(ocr_response.blocks)
+            
+            # Создаем OCRBlock
+            return OCRBlock(
+                id=self._ocr_block_id("image", page_num, image_block),
+                bbox=image_block.bbox,  # Сохраняем оригинальный bbox
+                content=combined_content,
+                page_num=page_num,
+                type=first_block.type,
+                confidence=ocr_response.confidence_avg,
+                metadata={
+                    "source": "image_ocr",
+                    "original_format": image_block.format,
+                    "markdown": ocr_response.markdown,
+                    **first_block.metadata
+                }
+            )
+        
+        return None
+    
     def _process_drawing_ocr(self, drawing_block: DrawingBlock, page_num: int) -> Optional[OCRBlock]:
         """
         Обработка векторной графики через OCR
@@ -200,12 +623,11 @@ class StructurePreserver:
             # Если OCR вернул результаты
             if ocr_response and ocr_response.blocks:
                 # Объединяем все блоки в один OCRBlock
-                combined_content = "\n".join([b.content for b in ocr_response.blocks])
-                first_block = ocr_response.blocks[0]
+                first_block, combined_content = self._combine_blocks(ocr_response.blocks)
                 
                 # Создаем OCRBlock
                 ocr_block = OCRBlock(
-                    id=f"ocr_drawing_{page_num}_{id(drawing_block)}",
+                    id=self._ocr_block_id("drawing", page_num, drawing_block),
                     bbox=drawing_block.bbox,  # Сохраняем оригинальный bbox
                     content=combined_content,
                     page_num=page_num,
@@ -232,19 +654,11 @@ class StructurePreserver:
             traceback.print_exc()
             return None
     
-    def _get_position_key(self, block) -> tuple:
-        """
-        Ключ для сортировки блоков по позиции
-        
-        Args:
-            block: Любой блок с bbox и page_num
-        
-        Returns:
-            Кортеж (page, -y1, x0) для сортировки
-        """
-        # Отрицательный y1 потому что в PDF координаты снизу вверх,
-        # а нам нужно сверху вниз
-        return (block.page_num, -block.bbox.y1, block.bbox.x0)
+    def _warn_circuit_open(self, error: CircuitOpenError):
+        """Сообщить об открытом размыкателе (один раз, а не на каждое изображение)"""
+        if not self._circuit_warned:
+            self._circuit_warned = True
+            print(f"⚠️  {error} - изображения остаются без OCR")
     
     def get_statistics(self) -> dict:
         """Получить статистику обработки"""
@@ -257,8 +671,10 @@ class StructurePreserver:
             "total_drawings": 0,
             "ocr_processed": 0,
             "ocr_skipped": 0,
-            "ocr_errors": 0
+            "ocr_errors": 0,
+            "ocr_deduplicated": 0
         }
+        self._circuit_warned = False
     
     def __repr__(self) -> str:
         """Строковое представление"""
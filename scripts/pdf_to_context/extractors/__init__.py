@@ -4,9 +4,18 @@ Extractors для извлечения контента из PDF
 
 from .native_extractor import NativeExtractor
 from .ocr_client import OCRClient
+from .ocr_cache import OCRCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 from .hybrid_handler import HybridHandler
 
-__all__ = ["NativeExtractor", "OCRClient", "HybridHandler"]
+__all__ = [
+    "NativeExtractor",
+    "OCRClient",
+    "OCRCache",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "HybridHandler"
+]
 
 
 
@@ -0,0 +1,114 @@
+"""
+Circuit Breaker - быстрый отказ при недоступном OCR сервисе
+
+Если сервис лежит, каждый запрос тратит max_retries * timeout секунд,
+и документ из сотни изображений "зависает" на часы. После fail_max неудачных
+запросов подряд (неудача - все повторы запроса исчерпаны) размыкатель
+открывается и запросы сразу получают CircuitOpenError; через reset_timeout
+пропускается один пробный запрос (half-open): успех - размыкатель
+закрывается, ошибка - снова открывается.
+
+Принципы SOLID:
+- Single Responsibility: Только учет ошибок и решение "пускать ли запрос"
+- Open/Closed: Один экземпляр можно разделить между несколькими OCRClient
+"""
+
+import threading
+import time
+
+
+class CircuitOpenError(RuntimeError):
+    """Запрос отклонен: размыкатель открыт (сервис считается недоступным)"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для запросов к OCR сервису
+
+    Состояния:
+    - closed: запросы идут, ошибки подряд считаются
+    - open: запросы отклоняются до истечения reset_timeout
+    - half-open: пропускается один пробный запрос
+
+    Использование:
+    ```python
+    breaker = CircuitBreaker(fail_max=5, reset_timeout=30)
+    breaker.before_call()      # CircuitOpenError, если открыт
+    try:
+        result = do_request()
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    ```
+    """
+
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 30.0):
+        """
+        Инициализация
+
+        Args:
+            fail_max: Сколько неудачных запросов подряд открывают размыкатель
+            reset_timeout: Через сколько секунд пропустить пробный запрос
+        """
+        self.fail_max = max(1, fail_max)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None  # time.monotonic() открытия (None - закрыт)
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние: closed / open / half-open"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """
+        Проверить, можно ли выполнить запрос
+
+        Raises:
+            CircuitOpenError: Размыкатель открыт (или пробный запрос уже идет)
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    f"OCR сервис недоступен ({self._failures} ошибок подряд), "
+                    f"повтор через {max(remaining, 0):.0f}s"
+                )
+
+            # half-open: пропускаем один пробный запрос
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """Запрос успешен - закрыть размыкатель"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Запрос не удался (сервис недоступен / ошибка сервера)"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.fail_max:
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        """Принудительно закрыть размыкатель (например, после успешного health check)"""
+        self.record_success()
+
+    def __repr__(self) -> str:
+        """Строковое представление"""
+        return f"CircuitBreaker(state={self.state}, failures={self._failures}/{self.fail_max})"
@@ -16,7 +16,22 @@ Hybrid Handler - гибридная обработка (Native + OCR)
 """
 
 import fitz  # PyMuPDF
-from typing import List, Dict, Any
+from itertools import chain
+from typing import List, Dict, Any, Iterator, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    cKDTree = None
+    SCIPY_AVAILABLE = False
 
 from ..models.data_models import (
     TextBlock,
@@ -27,6 +42,7 @@ from ..models.data_models import (
     BBox,
     OCRMode
 )
+from ..utils.bbox_ops import BBoxArray, near_mask
 from .native_extractor import NativeExtractor
 from .ocr_client import OCRClient
 
@@ -45,6 +61,13 @@ class HybridHandler:
     - Маршрутизацию (это делает ContentRouter)
     """
     
+    # Пороги для слияния кластеров векторной графики
+    OVERLAP_THRESHOLD = 0.1  # 10% перекрытия
+    PROXIMITY_THRESHOLD = 20  # 20 пикселей близости
+    
+    # Сколько строк матрицы расстояний считать за раз (ограничение памяти)
+    PAIR_BLOCK_ROWS = 512
+    
     def __init__(self, 
                  native_extractor: NativeExtractor,
                  ocr_client: OCRClient,
@@ -63,6 +86,9 @@ class HybridHandler:
         self.ocr_client = ocr_client
         self.ocr_mode = ocr_mode
         self.min_graphic_area = min_graphic_area
+        
+        # Близость сравнивается по квадрату расстояния (без sqrt на каждую пару)
+        self._proximity_sq = self.PROXIMITY_THRESHOLD ** 2
     
     def process_page(self, page: fitz.Page, pdf_path: str = None) -> Dict[str, List]:
         """
@@ -142,8 +168,9 @@ class HybridHandler:
         regions = []
         
         # 1. Все растровые изображения значимы
-        for img_block in image_blocks:
-            if img_block.bbox.area() >= self.min_graphic_area:
+        image_keep = self._large_enough([b.bbox for b in image_blocks])
+        for img_block, keep in zip(image_blocks, image_keep):
+            if keep:
                 regions.append({
                     "bbox": img_block.bbox,
                     "type": "image",
@@ -154,10 +181,11 @@ class HybridHandler:
         # Простая эвристика: если много drawings близко друг к другу,
         # объединяем их в один регион (возможно диаграмма/схема)
         drawing_clusters = self._cluster_drawings(drawing_blocks)
+        cluster_bboxes = [self._merge_bboxes([d.bbox for d in cluster]) for cluster in drawing_clusters]
         
-        for cluster in drawing_clusters:
-            cluster_bbox = self._merge_bboxes([d.bbox for d in cluster])
-            if cluster_bbox.area() >= self.min_graphic_area:
+        cluster_keep = self._large_enough(cluster_bboxes)
+        for cluster, cluster_bbox, keep in zip(drawing_clusters, cluster_bboxes, cluster_keep):
+            if keep:
                 regions.append({
                     "bbox": cluster_bbox,
                     "type": "drawing",
@@ -166,12 +194,37 @@ class HybridHandler:
         
         return regions
     
+    def _large_enough(self, bboxes: List[BBox]) -> List[bool]:
+        """
+        Маска "площадь bbox >= min_graphic_area"
+        
+        С NumPy площади считаются одной векторной операцией по массиву
+        координат, без NumPy - через BBox.area().
+        
+        Args:
+            bboxes: Список bbox
+        
+        Returns:
+            Флаг для каждого bbox (в том же порядке)
+        """
+        if not NUMPY_AVAILABLE or not bboxes:
+            return [bbox.area() >= self.min_graphic_area for bbox in bboxes]
+        
+        return (BBoxArray.from_bboxes(bboxes).areas() >= self.min_graphic_area).tolist()
+    
     def _cluster_drawings(self, drawings: List[DrawingBlock]) -> List[List[DrawingBlock]]:
         """
         Кластеризация векторной графики по близости
         
-        Простая эвристика: если drawings перекрываются или близки,
-        группируем их в один кластер.
+        Простая эвристика: если bbox кластеров перекрываются или близки,
+        группируем их в один кластер. Перекрывающиеся bbox находятся на
+        расстоянии 0, поэтому достаточно проверки близости.
+        
+        Алгоритм: union-find по парам близких bbox (связные компоненты),
+        затем то же самое для bbox получившихся кластеров - пока кластеры
+        сливаются (bbox кластера больше bbox его элементов и может
+        оказаться рядом с соседним кластером). bbox нового кластера
+        собирается из bbox слившихся кластеров, а не из всех его drawings.
         
         Args:
             drawings: Список векторных блоков
@@ -183,44 +236,169 @@ class HybridHandler:
             return []
         
         # Начинаем с каждого drawing как отдельного кластера
-        clusters = [[d] for d in drawings]
+        groups = [[index] for index in range(len(drawings))]
+        boxes = [d.bbox for d in drawings]
         
-        # Пороги для слияния кластеров
-        OVERLAP_THRESHOLD = 0.1  # 10% перекрытия
-        PROXIMITY_THRESHOLD = 20  # 20 пикселей близости
+        # bbox кластеров одним массивом (с NumPy) - для слияния без объектов BBox
+        cluster_array = BBoxArray.from_bboxes(boxes) if NUMPY_AVAILABLE else None
         
-        merged = True
-        while merged:
-            merged = False
-            new_clusters = []
-            used = set()
+        while True:
+            labels = self._component_labels(boxes)
+            component_count = max(labels) + 1
+            if component_count == len(groups):
+                break  # Ни один кластер не слился
             
-            for i, cluster1 in enumerate(clusters):
-                if i in used:
-                    continue
-                
-                for j, cluster2 in enumerate(clusters[i + 1:], start=i + 1):
-                    if j in used:
-                        continue
-                    
-                    # Проверяем, нужно ли объединить кластеры
-                    bbox1 = self._merge_bboxes([d.bbox for d in cluster1])
-                    bbox2 = self._merge_bboxes([d.bbox for d in cluster2])
-                    
-                    if self._should_merge_bboxes(bbox1, bbox2, 
-                                                 OVERLAP_THRESHOLD, 
-                                                 PROXIMITY_THRESHOLD):
-                        # Объединяем кластеры
-                        cluster1.extend(cluster2)
-                        used.add(j)
-                        merged = True
-                
-                new_clusters.append(cluster1)
-                used.add(i)
+            merged: List[List[int]] = [[] for _ in range(component_count)]
+            for group, label in zip(groups, labels):
+                merged[label].extend(group)
+            
+            groups = merged
+            if cluster_array is not None:
+                cluster_array = cluster_array.merge_groups(labels, component_count)
+                boxes = [BBox(*row) for row in cluster_array.coords.tolist()]
+            else:
+                boxes = self._merge_by_label(boxes, labels, component_count)
+        
+        return [[drawings[index] for index in group] for group in groups]
+    
+    @staticmethod
+    def _merge_by_label(boxes: List[BBox], labels: List[int], count: int) -> List[BBox]:
+        """Охватывающий bbox каждой компоненты (без NumPy): min/max по bbox ее кластеров"""
+        merged: List[List[float]] = [None] * count
+        for box, label in zip(boxes, labels):
+            current = merged[label]
+            if current is None:
+                merged[label] = [box.x0, box.y0, box.x1, box.y1]
+            else:
+                current[0] = min(current[0], box.x0)
+                current[1] = min(current[1], box.y0)
+                current[2] = max(current[2], box.x1)
+                current[3] = max(current[3], box.y1)
+        return [BBox(*coords) for coords in merged]
+    
+    def _component_labels(self, boxes: List[BBox]) -> List[int]:
+        """
+        Связные компоненты графа "bbox близки" (union-find)
+        
+        Args:
+            boxes: Список bbox
+        
+        Returns:
+            Номер компоненты для каждого bbox (по порядку первого появления)
+        """
+        parent = list(range(len(boxes)))
+        
+        def find(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]  # Сжатие пути
+                index = parent[index]
+            return index
+        
+        for i, j in self._near_pairs(boxes):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+        
+        labels: Dict[int, int] = {}
+        return [labels.setdefault(find(index), len(labels)) for index in range(len(boxes))]
+    
+    def _near_pairs(self, boxes: List[BBox]) -> Iterator[Tuple[int, int]]:
+        """
+        Пары (i, j), i < j, bbox которых нужно объединить
+        
+        Со SciPy кандидаты ищутся KD-деревом по центрам bbox (только
+        соседние пары, а не все N x N), с NumPy расстояния считаются
+        блоками строк (near_mask: ядро Numba или векторно, чтобы не держать
+        в памяти всю матрицу), без NumPy - попарно.
+        
+        Без KD-дерева bbox сортируются по y0: для bbox i проверяются только
+        bbox, начинающиеся не ниже y1_i + PROXIMITY_THRESHOLD (остальные
+        заведомо дальше порога по Y) - на страницах "сверху вниз" это почти
+        линейно.
+        
+        Args:
+            boxes: Список bbox
+        
+        Yields:
+            Пары индексов
+        """
+        count = len(boxes)
+        
+        if not NUMPY_AVAILABLE:
+            order = sorted(range(count), key=lambda index: boxes[index].y0)
+            for position, i in enumerate(order):
+                band_end = boxes[i].y1 + self.PROXIMITY_THRESHOLD
+                for j in order[position + 1:]:
+                    if boxes[j].y0 > band_end:
+                        break  # Дальше по y0 - только более далекие bbox
+                    if self._should_merge_bboxes(boxes[i], boxes[j],
+                                                 self.OVERLAP_THRESHOLD,
+                                                 self.PROXIMITY_THRESHOLD):
+                        yield min(i, j), max(i, j)
+            return
+        
+        coords = np.array([(b.x0, b.y0, b.x1, b.y1) for b in boxes], dtype=np.float64)
+        x0, y0, x1, y1 = coords.T
+        
+        if SCIPY_AVAILABLE and count > 1:
+            yield from self._near_pairs_kdtree(x0, y0, x1, y1)
+            return
+        
+        order = np.argsort(y0, kind="stable")
+        coords = coords[order]
+        sorted_y0 = coords[:, 1]
+        
+        for start in range(0, count, self.PAIR_BLOCK_ROWS):
+            stop = min(start + self.PAIR_BLOCK_ROWS, count)
             
-            clusters = new_clusters
+            # Столбцы с y0 ниже полосы строк блока заведомо далеки
+            band_end = coords[start:stop, 3].max() + self.PROXIMITY_THRESHOLD
+            end = max(stop, int(np.searchsorted(sorted_y0, band_end, side="right")))
+            near = near_mask(coords[:end], start, stop, self.PROXIMITY_THRESHOLD)
+            
+            rows, columns = np.nonzero(near)
+            first = order[rows + start]
+            second = order[columns]
+            yield from zip(np.minimum(first, second).tolist(), np.maximum(first, second).tolist())
+    
+    def _near_pairs_kdtree(self, x0, y0, x1, y1) -> Iterator[Tuple[int, int]]:
+        """
+        Пары близких bbox через KD-дерево центров (SciPy)
+        
+        Если между краями bbox i и j не больше PROXIMITY_THRESHOLD, то между
+        центрами не больше PROXIMITY_THRESHOLD + r_i + r_j (r - половина
+        диагонали). Пара гарантированно находится запросом из большего bbox
+        с радиусом PROXIMITY_THRESHOLD + 2 * r, затем кандидаты проверяются
+        точно по расстоянию между краями.
+        
+        Args:
+            x0, y0, x1, y1: Массивы координат bbox
+        
+        Yields:
+            Пары индексов (i < j)
+        """
+        count = len(x0)
+        centers = np.column_stack(((x0 + x1) * 0.5, (y0 + y1) * 0.5))
+        radii = np.hypot(x1 - x0, y1 - y0) * 0.5
+        
+        neighbours = cKDTree(centers).query_ball_point(
+            centers, r=self.PROXIMITY_THRESHOLD + 2 * radii
+        )
+        lengths = np.fromiter(map(len, neighbours), dtype=np.intp, count=count)
+        first = np.repeat(np.arange(count), lengths)
+        second = np.fromiter(chain.from_iterable(neighbours), dtype=np.intp, count=int(lengths.sum()))
+        
+        # Пара может найтись с обеих сторон - оставляем уникальные i < j
+        i = np.minimum(first, second)
+        j = np.maximum(first, second)
+        keys = np.unique((i * count + j)[i != j])
+        i, j = keys // count, keys % count
+        
+        dx = np.maximum(0.0, np.maximum(x0[j] - x1[i], x0[i] - x1[j]))
+        dy = np.maximum(0.0, np.maximum(y0[j] - y1[i], y0[i] - y1[j]))
+        near = dx * dx + dy * dy <= self._proximity_sq
         
-        return clusters
+        yield from zip(i[near].tolist(), j[near].tolist())
     
     def _merge_bboxes(self, bboxes: List[BBox]) -> BBox:
         """
@@ -278,8 +456,8 @@ class HybridHandler:
         elif bbox2.y1 < bbox1.y0:
             dy = bbox1.y0 - bbox2.y1
         
-        distance = (dx ** 2 + dy ** 2) ** 0.5
-        return distance <= proximity_threshold
+        # Квадрат расстояния против квадрата порога - без sqrt
+        return dx * dx + dy * dy <= proximity_threshold * proximity_threshold
     
     def _get_prompt_for_region(self, region: Dict[str, Any]) -> str:
         """
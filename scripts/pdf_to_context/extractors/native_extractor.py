@@ -14,39 +14,30 @@ Native Extractor - нативное извлечение контента из P
 """
 
 import fitz  # PyMuPDF
-import sys
 import os
-import contextlib
-from typing import List, Optional, Dict, Any
+import dataclasses
+import hashlib
+import importlib.util
+import html
 import io
-from PIL import Image
-
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import List, Optional, Dict, Any, Iterator
 
-@contextlib.contextmanager
-def suppress_stderr():
-    """
-    Подавление stderr на уровне файловых дескрипторов.
-    Работает с низкоуровневыми C-библиотеками (PyMuPDF).
-    """
-    stderr_fd = sys.stderr.fileno()
-    # Сохраняем оригинальный stderr
-    with os.fdopen(os.dup(stderr_fd), 'wb') as old_stderr:
-        # Перенаправляем stderr в /dev/null
-        devnull_fd = os.open(os.devnull, os.O_WRONLY)
-        os.dup2(devnull_fd, stderr_fd)
-        os.close(devnull_fd)
-        try:
-            yield
-        finally:
-            # Восстанавливаем stderr
-            sys.stderr.flush()
-            os.dup2(old_stderr.fileno(), stderr_fd)
+from PIL import Image
 
 try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
+    import numpy as np
+    NUMPY_AVAILABLE = True
 except ImportError:
-    PDFPLUMBER_AVAILABLE = False
+    np = None
+    NUMPY_AVAILABLE = False
+
+# pdfplumber (с pdfminer) импортируется только при первой таблице: без таблиц
+# (extract_tables=False) не тратим время импорта и память.
+# None - еще не загружали, False - не установлен
+_pdfplumber = None
 
 from ..models.data_models import (
     TextBlock,
@@ -54,8 +45,73 @@ from ..models.data_models import (
     DrawingBlock,
     TableBlock,
     BBox,
-    ContentType
+    ContentType,
+    BlockSource
 )
+from ..utils.bbox_ops import BBoxArray
+from ..utils.stderr import suppress_stderr
+
+
+# Формат изображения по фильтру потока (get_images) - когда байты не извлекаются;
+# остальные потоки extract_image отдает как PNG
+_FILTER_FORMATS = {"DCTDecode": "jpeg", "JPXDecode": "jpx", "JBIG2Decode": "jb2"}
+
+
+# Флаги get_text("dict") без TEXT_PRESERVE_IMAGES: иначе в словарь попадают
+# декодированные байты всех изображений страницы (блоки type=1 не используются)
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def _cell_html(cell: Any) -> str:
+    """Текст ячейки таблицы для HTML (None/пустая - пустая строка; <, >, & экранируются)"""
+    return html.escape(str(cell), quote=False) if cell else ""
+
+
+def _load_pdfplumber():
+    """Модуль pdfplumber (ленивый импорт) или False, если он не установлен"""
+    global _pdfplumber
+    if _pdfplumber is None:
+        try:
+            import pdfplumber
+        except ImportError:
+            _pdfplumber = False
+        else:
+            _pdfplumber = pdfplumber
+    return _pdfplumber
+
+
+def _has_pdfplumber() -> bool:
+    """Установлен ли pdfplumber (без импорта самого модуля)"""
+    if _pdfplumber is None:
+        return importlib.util.find_spec("pdfplumber") is not None
+    return bool(_pdfplumber)
+
+
+# Состояние процесса пула (NativeExtractor.open_pool): документ и экстрактор
+# открываются/передаются один раз на процесс, а не на каждую страницу
+_worker_state: Dict[str, Any] = {}
+
+
+def _worker_init(pdf_path: str, extractor: "NativeExtractor"):
+    """Инициализатор процесса пула: открыть PDF один раз"""
+    _worker_state["pdf_path"] = pdf_path
+    _worker_state["doc"] = fitz.open(pdf_path)
+    _worker_state["extractor"] = extractor  # pdfplumber откроется при первой таблице
+
+
+def extract_page_in_worker(page_num: int) -> Dict[str, List]:
+    """
+    Извлечь страницу в процессе пула (задача для NativeExtractor.open_pool)
+    
+    Args:
+        page_num: Номер страницы (0-based)
+    
+    Returns:
+        Результат NativeExtractor.extract_page
+    """
+    extractor = _worker_state["extractor"]
+    page = _worker_state["doc"][page_num]
+    return extractor.extract_page(page, _worker_state["pdf_path"])
 
 
 class NativeExtractor:
@@ -72,14 +128,32 @@ class NativeExtractor:
     - OCR (это делает OCRClient)
     - Построение IR (это делает IRBuilder)
     - Анализ структуры (это делает StructureAnalyzer)
+    
+    Документ pdfplumber открывается один раз на документ (при первой
+    таблице) и закрывается при выходе из контекста:
+    ```python
+    with NativeExtractor() as extractor:
+        for page in doc:
+            extractor.extract_page(page, pdf_path)
+    ```
     """
     
+    CACHE_VERSION = 3  # Увеличить при изменении формата блоков (старые записи игнорируются)
+    HASH_CHUNK_SIZE = 1 << 20  # Чтение PDF для sha256 блоками по 1 МБ
+    # Процессов пула по умолчанию: каждый держит свой fitz-документ (и pdfplumber),
+    # на многоядерных хостах os.cpu_count() процессов - лишняя память
+    MAX_DEFAULT_WORKERS = 4
+    
     def __init__(self, extract_images: bool = True, 
                  extract_drawings: bool = True,
                  extract_tables: bool = True,
                  min_text_length: int = 1,
                  render_vectors_to_image: bool = False,
-                 vector_render_dpi: int = 300):
+                 vector_render_dpi: int = 300,
+                 cache_dir: Optional[str] = None,
+                 extract_image_bytes: bool = True,
+                 vector_png_compress_level: int = 1,
+                 min_drawing_size: float = 1.0):
         """
         Инициализация экстрактора
         
@@ -90,15 +164,42 @@ class NativeExtractor:
             min_text_length: Минимальная длина текста в блоке
             render_vectors_to_image: Рендерить векторную графику в PNG для OCR
             vector_render_dpi: DPI для рендеринга векторной графики (по умолчанию 300)
+            cache_dir: Каталог дискового кэша результатов extract_page (None - без кэша).
+                       Повторный запуск на том же PDF не извлекает страницы заново.
+            extract_image_bytes: Извлекать байты изображений (нужны для OCR).
+                                 False - только bbox, размеры и формат из get_images
+            vector_png_compress_level: Уровень сжатия PNG отрендеренной графики (0-9).
+                                       PNG живет только до OCR - по умолчанию 1:
+                                       кодирование в разы быстрее уровня 6 (zlib)
+            min_drawing_size: Векторные объекты меньше этого размера (pt) по обеим
+                              сторонам - точки/пылинки - отбрасываются сразу.
+                              Линии (нулевая толщина bbox) сохраняются
         """
         self.extract_images = extract_images
         self.extract_drawings = extract_drawings
-        self.extract_tables = extract_tables and PDFPLUMBER_AVAILABLE
+        self.extract_tables = extract_tables and _has_pdfplumber()
         self.min_text_length = min_text_length
         self.render_vectors_to_image = render_vectors_to_image
         self.vector_render_dpi = vector_render_dpi
+        self.extract_image_bytes = extract_image_bytes
+        self.vector_png_compress_level = vector_png_compress_level
+        self.min_drawing_size = min_drawing_size
+        
+        # (pdf_path, открытый pdfplumber.PDF) - документ разбирается один раз,
+        # а не на каждой странице
+        self._plumber = None
+        
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._doc_digests: Dict[tuple, str] = {}  # (path, mtime, size) → sha256
         
-        if extract_tables and not PDFPLUMBER_AVAILABLE:
+        # xref → (байты, формат) изображений текущего документа: логотип на
+        # каждой странице извлекается один раз, блоки делят один буфер bytes
+        self._xref_cache: Dict[int, tuple] = {}
+        self._xref_cache_doc = None  # (id, name) документа, к которому относится кэш
+        
+        if extract_tables and not self.extract_tables:
             print("⚠️  pdfplumber не установлен, таблицы не будут извлекаться")
     
     def extract_page(self, page: fitz.Page, 
@@ -113,8 +214,18 @@ class NativeExtractor:
         Returns:
             Dict с ключами: text_blocks, image_blocks, drawing_blocks, table_blocks
         """
-        page_num = page.number
-        
+        key = self._cache_key(page, pdf_path)
+        if key is not None:
+            result = self._cache_get(key)
+            if result is None:
+                result = self._extract_page(page, pdf_path)
+                self._cache_put(key, result)
+            return result
+        
+        return self._extract_page(page, pdf_path)
+    
+    def _extract_page(self, page: fitz.Page, pdf_path: Optional[str]) -> Dict[str, List]:
+        """Извлечение страницы без кэша"""
         result = {
             "text_blocks": [],
             "image_blocks": [],
@@ -122,23 +233,27 @@ class NativeExtractor:
             "table_blocks": []
         }
         
-        # 1. Извлечение текстовых блоков (подавляем предупреждения PyMuPDF)
+        # Предупреждения PyMuPDF подавляются один раз на страницу (внутри
+        # внешнего suppress_stderr() документа - без системных вызовов)
         with suppress_stderr():
-            result["text_blocks"] = self.extract_text_blocks(page)
-        
-        # 2. Извлечение изображений (подавляем предупреждения PyMuPDF)
-        if self.extract_images:
-            with suppress_stderr():
-                result["image_blocks"] = self.extract_image_blocks(page)
-        
-        # 3. Извлечение векторной графики (подавляем предупреждения PyMuPDF)
-        if self.extract_drawings:
-            with suppress_stderr():
+            # 0. Разбор страницы - один раз на каждый вид контента
+            text_dict, images, drawings = self._parse_page_once(page)
+            
+            # 1. Извлечение текстовых блоков
+            result["text_blocks"] = self.extract_text_blocks(page, text_dict=text_dict)
+            
+            # 2. Извлечение изображений
+            if self.extract_images:
+                result["image_blocks"] = self.extract_image_blocks(page, images=images)
+            
+            # 3. Извлечение векторной графики
+            if self.extract_drawings:
                 result["drawing_blocks"] = self.extract_drawing_blocks(
-                page,
-                render_to_image=self.render_vectors_to_image,
-                render_dpi=self.vector_render_dpi
-            )
+                    page,
+                    render_to_image=self.render_vectors_to_image,
+                    render_dpi=self.vector_render_dpi,
+                    drawings=drawings
+                )
         
         # 4. Извлечение таблиц
         if self.extract_tables and pdf_path:
@@ -146,7 +261,201 @@ class NativeExtractor:
         
         return result
     
-    def extract_text_blocks(self, page: fitz.Page) -> List[TextBlock]:
+    def _parse_page_once(self, page: fitz.Page) -> tuple:
+        """
+        Разобрать страницу для всех extract_*_blocks
+        
+        Returns:
+            (text_dict, images, drawings); выключенные виды контента - пустые списки
+        """
+        text_dict = page.get_text("dict", flags=TEXT_DICT_FLAGS)
+        images = page.get_images(full=True) if self.extract_images else []
+        drawings = page.get_drawings() if self.extract_drawings else []
+        return text_dict, images, drawings
+    
+    @classmethod
+    def default_workers(cls) -> int:
+        """Процессов пула по умолчанию: os.cpu_count(), но не больше MAX_DEFAULT_WORKERS"""
+        return min(cls.MAX_DEFAULT_WORKERS, os.cpu_count() or 1)
+    
+    def open_pool(self, pdf_path: str, workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        Пул процессов для параллельного извлечения страниц документа
+        
+        Каждый процесс один раз открывает PDF (fitz; pdfplumber - при первой таблице), затем
+        извлекает страницы по номерам: pool.submit(extract_page_in_worker, n).
+        
+        Args:
+            pdf_path: Путь к PDF файлу
+            workers: Количество процессов (по умолчанию default_workers())
+        
+        Returns:
+            ProcessPoolExecutor (использовать в with)
+        """
+        return ProcessPoolExecutor(
+            max_workers=workers or self.default_workers(),
+            initializer=_worker_init,
+            initargs=(pdf_path, self)
+        )
+    
+    def extract_document(self, pdf_path: str,
+                         workers: Optional[int] = None) -> Iterator[Dict[str, List]]:
+        """
+        Извлечь все страницы документа (в пуле процессов при workers > 1)
+        
+        Args:
+            pdf_path: Путь к PDF файлу
+            workers: Количество процессов (по умолчанию default_workers())
+        
+        Yields:
+            Результат extract_page для каждой страницы (в порядке страниц)
+        """
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            workers = min(workers or self.default_workers(), page_count)
+            
+            if workers <= 1:
+                with self, suppress_stderr():
+                    for page in doc:
+                        yield self.extract_page(page, pdf_path)
+                return
+        
+        with self.open_pool(pdf_path, workers) as pool:
+            yield from pool.map(extract_page_in_worker, range(page_count))
+    
+    def __enter__(self):
+        """Контекстный менеджер: закрывает открытый pdfplumber документ на выходе"""
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Закрыть документ pdfplumber"""
+        self.close()
+    
+    def close(self):
+        """Закрыть открытый документ pdfplumber (откроется снова при необходимости)"""
+        self._xref_cache = {}
+        self._xref_cache_doc = None
+        if self._plumber is not None:
+            self._plumber[1].close()
+            self._plumber = None
+    
+    def _plumber_pdf(self, pdf_path: str):
+        """Документ pdfplumber для pdf_path (открывается один раз)"""
+        if self._plumber is None or self._plumber[0] != pdf_path:
+            self.close()
+            self._plumber = (pdf_path, _load_pdfplumber().open(pdf_path))
+        return self._plumber[1]
+    
+    def __getstate__(self):
+        """Для пула процессов: открытый pdfplumber не передается"""
+        state = self.__dict__.copy()
+        state["_plumber"] = None
+        state["_doc_digests"] = {}
+        state["_xref_cache"] = {}
+        state["_xref_cache_doc"] = None
+        return state
+    
+    def _config_hash(self) -> str:
+        """Хэш настроек извлечения (другие настройки - другие записи кэша)"""
+        config = (
+            self.CACHE_VERSION, self.extract_images, self.extract_drawings,
+            self.extract_tables, self.min_text_length,
+            self.render_vectors_to_image, self.vector_render_dpi,
+            self.extract_image_bytes, self.vector_png_compress_level,
+            self.min_drawing_size
+        )
+        return hashlib.sha256(repr(config).encode()).hexdigest()[:12]
+    
+    def _cache_key(self, page: fitz.Page, pdf_path: Optional[str]) -> Optional[str]:
+        """
+        Ключ кэша страницы: sha256 файла + номер страницы + хэш настроек
+        
+        Returns:
+            Ключ или None (кэш выключен / документ не из файла)
+        """
+        if not self.cache_dir:
+            return None
+        
+        path = pdf_path or page.parent.name
+        if not path or not os.path.isfile(path):
+            return None
+        
+        stat = os.stat(path)
+        file_id = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._doc_digests.get(file_id)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            self._doc_digests[file_id] = digest
+        
+        return f"{digest}_{page.number}_{self._config_hash()}"
+    
+    @staticmethod
+    def _blocks_with_images(result: Dict[str, List]) -> List[tuple]:
+        """(ключ списка, индекс) блоков с image_data - их байты хранятся отдельно"""
+        return [
+            (list_key, index)
+            for list_key in ("image_blocks", "drawing_blocks")
+            for index, block in enumerate(result[list_key])
+            if block.image_data is not None
+        ]
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, List]]:
+        """Результат extract_page из дискового кэша или None"""
+        try:
+            with open(os.path.join(self.cache_dir, key + ".pkl"), "rb") as f:
+                result, image_refs = pickle.load(f)
+            
+            # Байты изображений - в файлах {key}_img{n}.bin рядом с записью
+            for sidecar_idx, (list_key, index) in enumerate(image_refs):
+                sidecar = os.path.join(self.cache_dir, f"{key}_img{sidecar_idx}.bin")
+                with open(sidecar, "rb") as f:
+                    result[list_key][index].image_data = f.read()
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+                ValueError, KeyError, IndexError):
+            return None  # Нет записи / запись неполная - извлекаем заново
+        
+        return result
+    
+    def _cache_put(self, key: str, result: Dict[str, List]):
+        """Сохранить результат extract_page в дисковый кэш"""
+        image_refs = self._blocks_with_images(result)
+        
+        # Pickle без байтов изображений: запись остается маленькой
+        stripped = {list_key: list(blocks) for list_key, blocks in result.items()}
+        for list_key, index in image_refs:
+            stripped[list_key][index] = dataclasses.replace(
+                stripped[list_key][index], image_data=None
+            )
+        
+        try:
+            # Сначала файлы изображений, запись .pkl - последней: запись без
+            # своих изображений не появляется
+            for sidecar_idx, (list_key, index) in enumerate(image_refs):
+                self._write_atomic(
+                    os.path.join(self.cache_dir, f"{key}_img{sidecar_idx}.bin"),
+                    result[list_key][index].image_data
+                )
+            self._write_atomic(
+                os.path.join(self.cache_dir, key + ".pkl"),
+                pickle.dumps((stripped, image_refs), protocol=pickle.HIGHEST_PROTOCOL)
+            )
+        except OSError as e:
+            print(f"⚠️  Не удалось записать кэш извлечения страницы: {e}")
+    
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        """Запись через временный файл: параллельные процессы не видят частичный файл"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def extract_text_blocks(self, page: fitz.Page,
+                            text_dict: Optional[Dict[str, Any]] = None) -> List[TextBlock]:
         """
         Извлечь текстовые блоки со страницы
         
@@ -155,6 +464,7 @@ class NativeExtractor:
         
         Args:
             page: Объект страницы
+            text_dict: Уже полученный page.get_text("dict") (None - получить)
         
         Returns:
             Список TextBlock
@@ -163,7 +473,8 @@ class NativeExtractor:
         page_num = page.number
         
         # Получаем структурированный текст
-        text_dict = page.get_text("dict")
+        if text_dict is None:
+            text_dict = page.get_text("dict", flags=TEXT_DICT_FLAGS)
         blocks = text_dict.get("blocks", [])
         
         for block_idx, block in enumerate(blocks):
@@ -178,32 +489,29 @@ class NativeExtractor:
             
             bbox = BBox(*bbox_tuple)
             
-            # Извлекаем текст из всех линий блока
-            lines = block.get("lines", [])
+            # Извлекаем текст из всех линий блока. PyMuPDF всегда заполняет
+            # text/size/font/flags спана - читаем напрямую, без .get() на каждый спан
             text_parts = []
-            font_sizes = []
-            font_names = []
-            is_bold = False
-            is_italic = False
+            append_text = text_parts.append
+            font_size_sum = 0.0
+            span_count = 0
+            font_counts: Dict[str, int] = {}  # Шрифт → число спанов (один проход)
+            all_flags = 0  # Объединение флагов всех спанов
             
-            for line in lines:
-                for span in line.get("spans", []):
-                    span_text = span.get("text", "")
-                    text_parts.append(span_text)
+            for line in block.get("lines", ()):
+                for span in line["spans"]:
+                    append_text(span["text"])
                     
                     # Информация о шрифте
-                    font_size = span.get("size", 0)
-                    font_name = span.get("font", "")
-                    flags = span.get("flags", 0)
-                    
-                    font_sizes.append(font_size)
-                    font_names.append(font_name)
-                    
-                    # Флаги: 16=bold, 2=italic (битовая маска)
-                    if flags & 16:
-                        is_bold = True
-                    if flags & 2:
-                        is_italic = True
+                    font_name = span["font"]
+                    font_size_sum += span["size"]
+                    span_count += 1
+                    font_counts[font_name] = font_counts.get(font_name, 0) + 1
+                    all_flags |= span["flags"]
+            
+            # Флаги: 16=bold, 2=italic (битовая маска) - хотя бы у одного спана
+            is_bold = bool(all_flags & 16)
+            is_italic = bool(all_flags & 2)
             
             # Собираем текст
             full_text = " ".join(text_parts).strip()
@@ -213,8 +521,8 @@ class NativeExtractor:
                 continue
             
             # Определяем преобладающий шрифт и размер
-            avg_font_size = sum(font_sizes) / len(font_sizes) if font_sizes else None
-            most_common_font = max(set(font_names), key=font_names.count) if font_names else None
+            avg_font_size = font_size_sum / span_count if span_count else None
+            most_common_font = max(font_counts.items(), key=itemgetter(1))[0] if font_counts else None
             
             text_block = TextBlock(
                 bbox=bbox,
@@ -231,12 +539,14 @@ class NativeExtractor:
         
         return text_blocks
     
-    def extract_image_blocks(self, page: fitz.Page) -> List[ImageBlock]:
+    def extract_image_blocks(self, page: fitz.Page,
+                             images: Optional[List[tuple]] = None) -> List[ImageBlock]:
         """
         Извлечь растровые изображения со страницы
         
         Args:
             page: Объект страницы
+            images: Уже полученный page.get_images(full=True) (None - получить)
         
         Returns:
             Список ImageBlock
@@ -245,83 +555,105 @@ class NativeExtractor:
         page_num = page.number
         
         # Получаем список изображений
-        images = page.get_images(full=True)
+        if images is None:
+            images = page.get_images(full=True)
+        
+        # xref уникальны только внутри документа - другой документ, другой кэш
+        doc = page.parent
+        doc_id = (id(doc), doc.name)
+        if self._xref_cache_doc != doc_id:
+            self._xref_cache = {}
+            self._xref_cache_doc = doc_id
         
         # Debug ВЫКЛЮЧЕН для уменьшения вывода
         # if page_num < 30 and len(images) > 0:
         #     print(f"  [DEBUG] Страница {page_num+1}: найдено {len(images)} изображений через get_images()")
         
+        # 1. Кандидаты: реальные размеры изображения уже есть в get_images
+        # (индексы 2, 3) - маленькие отсекаем до get_image_rects (он декодирует
+        # изображение для поиска на странице)
+        candidates = []  # (img_idx, img_info, первый rect)
         for img_idx, img_info in enumerate(images):
-            xref = img_info[0]
+            if img_info[2] < 100 or img_info[3] < 100:
+                continue
             
             try:
                 # Получаем bbox изображения (используем get_image_rects вместо get_image_bbox)
-                rects = page.get_image_rects(xref)
-                if not rects or len(rects) == 0:
-                    # if page_num < 30:
-                    #     print(f"  [DEBUG] Страница {page_num+1}: изображение #{img_idx} xref={xref} - НЕТ bbox!")
-                    continue
-                
+                rects = page.get_image_rects(img_info[0])
+            except Exception:
+                continue
+            
+            if rects:
                 # Берем первый rect (изображение может встречаться несколько раз на странице)
-                bbox_rect = rects[0]
-                
-                bbox = BBox(bbox_rect.x0, bbox_rect.y0, bbox_rect.x1, bbox_rect.y1)
-                area = (bbox.x1 - bbox.x0) * (bbox.y1 - bbox.y0)
-                
-                # Фильтруем маленькие изображения (логотипы, иконки)
-                # Минимальный размер: 100x100 пикселей (10000 px²)
-                if area < 10000:
-                    continue
-                
-                # Извлекаем данные изображения
-                base_image = page.parent.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]  # png, jpeg, etc.
-                
-                # Определяем размеры и проверяем валидность
-                try:
-                    pil_image = Image.open(io.BytesIO(image_bytes))
-                    width, height = pil_image.size
-                    
-                    # Двойная проверка размера по реальным размерам изображения
-                    if width < 100 or height < 100:
+                candidates.append((img_idx, img_info, rects[0]))
+        
+        # 2. Фильтруем маленькие изображения (логотипы, иконки) по площади на
+        # странице одной векторной операцией. Минимум: 100x100 (10000 px²)
+        keep = self._min_area_mask([rect for _, _, rect in candidates], 10000)
+        
+        for (img_idx, img_info, bbox_rect), large in zip(candidates, keep):
+            if not large:
+                continue
+            
+            xref = img_info[0]
+            width, height = img_info[2], img_info[3]
+            
+            try:
+                if self.extract_image_bytes:
+                    cached = self._xref_cache.get(xref)
+                    if cached is None:
+                        # Извлекаем данные изображения (поврежденные - исключение / пустые байты)
+                        base_image = doc.extract_image(xref)
+                        cached = (base_image["image"], base_image["ext"])  # ext: png, jpeg, etc.
+                        self._xref_cache[xref] = cached
+                    image_bytes, image_ext = cached
+                    if not image_bytes:
                         continue
-                        
-                except Exception as e:
-                    # Изображение повреждено или в неподдерживаемом формате
-                    continue
-                    
-                width, height = pil_image.size
-                
-                image_block = ImageBlock(
-                    bbox=bbox,
-                    image_data=image_bytes,
-                    format=image_ext,
-                    page_num=page_num,
-                    width=width,
-                    height=height,
-                    xref=xref,
-                    needs_ocr=True,  # Флаг для StructurePreserver
-                    metadata={"img_idx": img_idx}
-                )
-                
-                image_blocks.append(image_block)
-                
-                # Debug ВЫКЛЮЧЕН
-                # if page_num < 30:
-                #     print(f"  [DEBUG] ✅ ImageBlock создан: стр={page_num+1}, xref={xref}, area={area:.0f}px², размер={width}x{height}, формат={image_ext}")
-                
-            except Exception as e:
+                else:
+                    image_bytes = None
+                    image_ext = _FILTER_FORMATS.get(img_info[8], "png")
+            except Exception:
                 # Некоторые изображения могут не извлекаться (встроенные шрифты и т.д.)
-                # if page_num < 30:
-                #     print(f"  [DEBUG] ❌ Ошибка при создании ImageBlock: стр={page_num+1}, xref={xref}, error={e}")
                 continue
+            
+            image_block = ImageBlock(
+                bbox=BBox(bbox_rect.x0, bbox_rect.y0, bbox_rect.x1, bbox_rect.y1),
+                image_data=image_bytes,
+                format=image_ext,
+                page_num=page_num,
+                width=width,
+                height=height,
+                xref=xref,
+                needs_ocr=True,  # Флаг для StructurePreserver
+                metadata={"img_idx": img_idx}
+            )
+            
+            image_blocks.append(image_block)
         
         return image_blocks
     
+    @staticmethod
+    def _min_area_mask(rects: List[Any], min_area: float) -> List[bool]:
+        """
+        Маска "площадь прямоугольника >= min_area"
+        
+        С NumPy площади считаются одной операцией по массиву координат.
+        
+        Args:
+            rects: Прямоугольники с атрибутами x0, y0, x1, y1 (fitz.Rect, BBox)
+            min_area: Минимальная площадь
+        
+        Returns:
+            Флаг для каждого прямоугольника (в том же порядке)
+        """
+        if not NUMPY_AVAILABLE or not rects:
+            return [(r.x1 - r.x0) * (r.y1 - r.y0) >= min_area for r in rects]
+        return (BBoxArray.from_bboxes(rects).areas() >= min_area).tolist()
+    
     def extract_drawing_blocks(self, page: fitz.Page,
                               render_to_image: bool = False,
-                              render_dpi: int = 300) -> List[DrawingBlock]:
+                              render_dpi: int = 300,
+                              drawings: Optional[List[Dict[str, Any]]] = None) -> List[DrawingBlock]:
         """
         Извлечь векторную графику со страницы
         
@@ -332,6 +664,7 @@ class NativeExtractor:
             page: Объект страницы
             render_to_image: Рендерить векторные блоки в PNG для OCR
             render_dpi: DPI для рендеринга (по умолчанию 300 для качества)
+            drawings: Уже полученный page.get_drawings() (None - получить)
         
         Returns:
             Список DrawingBlock
@@ -340,16 +673,25 @@ class NativeExtractor:
         page_num = page.number
         
         # Получаем все векторные объекты
-        drawings = page.get_drawings()
+        if drawings is None:
+            drawings = page.get_drawings()
+        
+        min_size = self.min_drawing_size
         
         for draw_idx, drawing in enumerate(drawings):
             rect_tuple = drawing.get("rect")
             if not rect_tuple:
                 continue
             
-            bbox = BBox(*rect_tuple)
+            # Точки (меньше min_size по обеим сторонам) отбрасываем до создания
+            # объектов - на графиках их тысячи
+            x0, y0, x1, y1 = rect_tuple
+            if x1 - x0 < min_size and y1 - y0 < min_size:
+                continue
+            
+            bbox = BBox(x0, y0, x1, y1)
             
-            # Сохраняем векторные данные
+            # Сохраняем векторные данные (items - ссылка на список PyMuPDF, без копии)
             drawing_data = {
                 "type": drawing.get("type"),  # "l" (line), "re" (rect), "c" (curve)
                 "items": drawing.get("items", []),
@@ -358,31 +700,89 @@ class NativeExtractor:
                 "fill": drawing.get("fill")
             }
             
-            # Рендерим в изображение если требуется
-            image_data = None
-            needs_ocr = False
-            
-            if render_to_image:
-                image_data = self._render_region_to_image(page, bbox, dpi=render_dpi)
-                needs_ocr = True if image_data else False
-                
-                # Отладочный вывод отключен
-                # if page_num == 53:  # Индекс 53 = страница 54
-                #     print(f"  [DEBUG] Векторный блок #{draw_idx}: area={bbox.area():.0f}px², rendered={image_data is not None}, needs_ocr={needs_ocr}")
-            
             drawing_block = DrawingBlock(
                 bbox=bbox,
                 drawing_data=drawing_data,
                 page_num=page_num,
-                image_data=image_data,
-                needs_ocr=needs_ocr,
                 metadata={"draw_idx": draw_idx}
             )
             
             drawing_blocks.append(drawing_block)
         
+        # Рендерим в изображения если требуется (все блоки страницы - за один рендер)
+        if render_to_image and drawing_blocks:
+            images = self._render_regions_to_images(
+                page, [block.bbox for block in drawing_blocks], dpi=render_dpi
+            )
+            for drawing_block, image_data in zip(drawing_blocks, images):
+                drawing_block.image_data = image_data
+                drawing_block.needs_ocr = image_data is not None
+        
         return drawing_blocks
     
+    def _render_regions_to_images(self, page: fitz.Page, bboxes: List[BBox],
+                                  dpi: int = 300) -> List[Optional[bytes]]:
+        """
+        Рендерить несколько областей страницы в PNG за один рендер
+        
+        Страница рендерится один раз (в пределах общего bbox всех областей),
+        области вырезаются из массива пикселей и кодируются в PNG через PIL
+        (один переиспользуемый буфер). Без NumPy, для одной области или
+        повернутой страницы - _render_region_to_image для каждой области.
+        
+        Args:
+            page: Объект страницы
+            bboxes: Области для рендеринга
+            dpi: DPI для рендеринга
+        
+        Returns:
+            PNG байты (или None) для каждой области, в том же порядке
+        """
+        if not NUMPY_AVAILABLE or len(bboxes) < 2 or page.rotation:
+            return [self._render_region_to_image(page, bbox, dpi=dpi) for bbox in bboxes]
+        
+        # Те же критерии валидности, что и в _render_region_to_image
+        valid = [
+            bbox.x1 - bbox.x0 >= 1 and bbox.y1 - bbox.y0 >= 1
+            for bbox in bboxes
+        ]
+        images: List[Optional[bytes]] = [None] * len(bboxes)
+        if not any(valid):
+            return images
+        
+        try:
+            boxes = BBoxArray.from_bboxes(bboxes)
+            clip_rect = fitz.Rect(*boxes.merge_all(np.flatnonzero(valid)))
+            pix = page.get_pixmap(dpi=dpi, clip=clip_rect, alpha=False, colorspace=fitz.csRGB)
+            pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+            pixels = pixels[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+        except Exception as e:
+            print(f"⚠️  Ошибка рендеринга векторной графики: {e}")
+            return images
+        
+        # Пиксельные границы областей - округление как у MuPDF (fz_round_rect)
+        # при рендере каждой области отдельно
+        coords = boxes.coords * (dpi / 72)
+        low = np.floor(coords[:, :2] + 0.001).astype(int)
+        high = np.ceil(coords[:, 2:] - 0.001).astype(int)
+        x0, x1 = (np.clip(v - pix.x, 0, pix.width) for v in (low[:, 0], high[:, 0]))
+        y0, y1 = (np.clip(v - pix.y, 0, pix.height) for v in (low[:, 1], high[:, 1]))
+        
+        buffer = io.BytesIO()
+        for index in np.flatnonzero(valid).tolist():
+            if x1[index] <= x0[index] or y1[index] <= y0[index]:
+                continue  # Область вне страницы
+            
+            region = pixels[y0[index]:y1[index], x0[index]:x1[index]]
+            buffer.seek(0)
+            buffer.truncate()
+            Image.fromarray(region, "RGB").save(
+                buffer, format="PNG", compress_level=self.vector_png_compress_level
+            )
+            images[index] = buffer.getvalue()
+        
+        return images
+    
     def _render_region_to_image(self, page: fitz.Page, bbox: BBox, dpi: int = 300) -> Optional[bytes]:
         """
         Рендерить область страницы в PNG изображение
@@ -404,18 +804,17 @@ class NativeExtractor:
             if clip_rect.is_empty or clip_rect.width < 1 or clip_rect.height < 1:
                 return None
             
-            # Рассчитываем zoom для требуемого DPI
-            # Стандартное разрешение PDF = 72 DPI
-            zoom = dpi / 72.0
-            mat = fitz.Matrix(zoom, zoom)
-            
-            # Рендерим область в pixmap
-            pix = page.get_pixmap(matrix=mat, clip=clip_rect)
-            
-            # Конвертируем в PNG bytes
-            png_bytes = pix.tobytes("png")
+            # Рендерим область в pixmap сразу в нужном DPI
+            # alpha=False + RGB: OCR не нужен канал прозрачности
+            pix = page.get_pixmap(dpi=dpi, clip=clip_rect, alpha=False, colorspace=fitz.csRGB)
             
-            return png_bytes
+            # Конвертируем в PNG bytes (через PIL - со своим уровнем сжатия;
+            # pix.tobytes("png") всегда сжимает с уровнем zlib по умолчанию)
+            buffer = io.BytesIO()
+            Image.frombytes("RGB", (pix.width, pix.height), pix.samples).save(
+                buffer, format="PNG", compress_level=self.vector_png_compress_level
+            )
+            return buffer.getvalue()
         
         except Exception as e:
             # Логируем ошибку, но не падаем
@@ -433,17 +832,31 @@ class NativeExtractor:
         Returns:
             Список TableBlock
         """
-        if not PDFPLUMBER_AVAILABLE:
+        return self.extract_page_tables(page.number, pdf_path)
+    
+    def extract_page_tables(self, page_num: int, pdf_path: str) -> List[TableBlock]:
+        """
+        Извлечь таблицы страницы по номеру (используя pdfplumber)
+        
+        Документ pdfplumber открывается при первом вызове и переиспользуется
+        для следующих страниц (закрывается close() / выходом из контекста).
+        
+        Args:
+            page_num: Номер страницы (0-based)
+            pdf_path: Путь к PDF файлу
+        
+        Returns:
+            Список TableBlock
+        """
+        if not _load_pdfplumber():
             return []
         
         table_blocks = []
-        page_num = page.number
         
         try:
-            # Открываем PDF через pdfplumber
-            with pdfplumber.open(pdf_path) as pdf:
-                plumber_page = pdf.pages[page_num]
-                
+            plumber_page = self._plumber_pdf(pdf_path).pages[page_num]
+            
+            try:
                 # Извлекаем таблицы
                 tables = plumber_page.find_tables()
                 
@@ -470,11 +883,14 @@ class NativeExtractor:
                         cols=cols,
                         page_num=page_num,
                         data=table_data,
-                        source="native",
+                        source=BlockSource.NATIVE,
                         metadata={"table_idx": table_idx}
                     )
                     
                     table_blocks.append(table_block)
+            finally:
+                # Разобранные объекты страницы больше не нужны
+                plumber_page.close()
         
         except Exception as e:
             # pdfplumber может падать на некоторых PDF
@@ -495,28 +911,21 @@ class NativeExtractor:
         if not table_data:
             return ""
         
-        html_parts = ["<table>"]
-        
-        # Первая строка как заголовок
-        html_parts.append("<thead><tr>")
-        for cell in table_data[0]:
-            cell_text = str(cell) if cell else ""
-            html_parts.append(f"<th>{cell_text}</th>")
-        html_parts.append("</tr></thead>")
-        
-        # Остальные строки
-        html_parts.append("<tbody>")
-        for row in table_data[1:]:
-            html_parts.append("<tr>")
-            for cell in row:
-                cell_text = str(cell) if cell else ""
-                html_parts.append(f"<td>{cell_text}</td>")
-            html_parts.append("</tr>")
-        html_parts.append("</tbody>")
-        
-        html_parts.append("</table>")
-        
-        return "".join(html_parts)
+        # Шаблон строки на каждую ширину: одна format() на строку вместо
+        # отдельной f-строки на каждую ячейку
+        templates: Dict[tuple, str] = {}
+        
+        def row_html(row: List[str], cell_tag: str) -> str:
+            template = templates.get((len(row), cell_tag))
+            if template is None:
+                template = "<tr>" + f"<{cell_tag}>{{}}</{cell_tag}>" * len(row) + "</tr>"
+                templates[(len(row), cell_tag)] = template
+            return template.format(*map(_cell_html, row))
+        
+        # Первая строка как заголовок, остальные - тело
+        header = row_html(table_data[0], "th")
+        body = "".join([row_html(row, "td") for row in table_data[1:]])
+        return f"<table><thead>{header}</thead><tbody>{body}</tbody></table>"
     
     def __repr__(self) -> str:
         """Строковое представление"""
@@ -0,0 +1,197 @@
+"""
+OCR Cache - кэш ответов OCR по содержимому изображения
+
+Одинаковые изображения (логотипы, шаблонные схемы, повторные прогоны
+одного документа) распознаются один раз. Ключ - SHA-256 байтов изображения
+плюс параметры распознавания, поэтому кэш не зависит от имени файла и страницы.
+
+Хранится "сырой" ответ сервиса (JSON-совместимый), а не OCRResponse:
+номер страницы и bbox подставляются при разборе ответа для текущего вызова.
+
+Принципы SOLID:
+- Single Responsibility: Только хранение и поиск ответов OCR
+- Open/Closed: Бэкенд хранения (память / каталог) прозрачен для OCRClient
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Union
+
+
+class OCRCache:
+    """
+    Content-addressed кэш ответов OCR
+    
+    Уровни:
+    1. Память процесса (LRU на max_entries записей)
+    2. Каталог на диске (опционально) - переживает перезапуски
+    
+    Использование:
+    ```python
+    cache = OCRCache(cache_dir=".ocr_cache")
+    client = OCRClient(cache=cache)
+    ```
+    """
+    
+    DEFAULT_TTL = 30 * 24 * 3600  # 30 дней: ключ по содержимому не "протухает" сам
+    DEFAULT_MAX_ENTRIES = 1024
+    
+    def __init__(self,
+                 cache_dir: Optional[Union[str, Path]] = None,
+                 ttl: Optional[float] = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Инициализация
+        
+        Args:
+            cache_dir: Каталог для хранения на диске (None - только память)
+            ttl: Время жизни записи в секундах (None - бессрочно)
+            max_entries: Сколько записей держать в памяти (давно не использованные
+                         вытесняются; на диске они остаются)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key → (timestamp, payload), LRU
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def make_key(image_data: bytes, backend: str, **params) -> str:
+        """
+        Ключ кэша
+        
+        Args:
+            image_data: Байты изображения
+            backend: Идентификатор OCR бэкенда (URL сервиса / название OCRService)
+            **params: Параметры распознавания (prompt_type, base_size, ...)
+        
+        Returns:
+            Строковый ключ
+        """
+        digest = hashlib.sha256(image_data).hexdigest()
+        options = ":".join(f"{name}={params[name]}" for name in sorted(params))
+        return f"{digest}:{backend}:{options}"
+    
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Получить ответ из кэша
+        
+        Args:
+            key: Ключ (make_key)
+        
+        Returns:
+            Сохраненный ответ или None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        
+        if entry is None and self.cache_dir:
+            entry = self._read_file(key)
+            if entry is not None:
+                self._remember(key, entry)
+        
+        if entry is not None and self._expired(entry[0]):
+            self._remove(key)
+            entry = None
+        
+        with self._lock:
+            self._stats["hits" if entry is not None else "misses"] += 1
+        
+        return entry[1] if entry is not None else None
+    
+    def put(self, key: str, payload: Any):
+        """
+        Сохранить ответ в кэш
+        
+        Args:
+            key: Ключ (make_key)
+            payload: JSON-совместимый ответ OCR
+        """
+        entry = (time.time(), payload)
+        self._remember(key, entry)
+        
+        if self.cache_dir:
+            self._write_file(key, entry)
+    
+    def _remember(self, key: str, entry: tuple):
+        """Положить запись в память, вытеснив самую давнюю сверх max_entries"""
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+    
+    def clear(self):
+        """Очистить кэш (память и диск)"""
+        with self._lock:
+            self._memory.clear()
+        
+        if self.cache_dir:
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+    
+    def get_statistics(self) -> dict:
+        """Статистика попаданий"""
+        with self._lock:
+            return {**self._stats, "entries": len(self._memory)}
+    
+    def _expired(self, timestamp: float) -> bool:
+        return self.ttl is not None and time.time() - timestamp > self.ttl
+    
+    def _path(self, key: str) -> Path:
+        # Имя файла - хэш ключа (ключ содержит ':' и параметры)
+        return self.cache_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+    
+    def _read_file(self, key: str) -> Optional[tuple]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return (data["timestamp"], data["payload"])
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _write_file(self, key: str, entry: tuple):
+        # Атомарная запись: временный файл + os.replace; при любой ошибке
+        # временный файл удаляется, ошибка записи не прерывает OCR
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        except OSError as e:
+            print(f"⚠️  Не удалось записать OCR кэш: {e}")
+            return
+        
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"timestamp": entry[0], "payload": entry[1]}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException as e:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            if not isinstance(e, (OSError, TypeError, ValueError)):
+                raise
+            print(f"⚠️  Не удалось записать OCR кэш: {e}")
+    
+    def _remove(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.cache_dir:
+            self._path(key).unlink(missing_ok=True)
+    
+    def __repr__(self) -> str:
+        """Строковое представление"""
+        location = str(self.cache_dir) if self.cache_dir else "memory"
+        return f"OCRCache({location}, entries={len(self._memory)})"
@@ -12,8 +12,15 @@ OCR Client - универсальный клиент для OCR сервисов
 """
 
 import requests
-import base64
-from typing import Optional, Dict, Any, List
+from requests.adapters import HTTPAdapter
+import hashlib
+import json
+import queue
+import random
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
 import io
 from PIL import Image
 import fitz  # PyMuPDF
@@ -23,8 +30,11 @@ from ..models.data_models import (
     OCRResponse,
     OCRBlock,
     BBox,
-    ContentType
+    ContentType,
+    BlockSource
 )
+from .ocr_cache import OCRCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 
 # Опциональный импорт новой архитектуры
 try:
@@ -32,6 +42,23 @@ try:
 except ImportError:
     OCRService = None
 
+# Опциональный быстрый JSON парсер (в 2-3 раза быстрее json на вложенных ответах)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_WORD_RE = re.compile(r"\S+")
+
+# Значение типа из ответа сервиса → ContentType (без try/except на каждый блок)
+_TYPE_MAP = {content_type.value: content_type for content_type in ContentType}
+
+
+def _count_words(text: str) -> int:
+    """Число слов без построения списка (как len(text.split()))"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
 
 class OCRClient:
     """
@@ -39,7 +66,7 @@ class OCRClient:
     
     Ответственность:
     - HTTP запросы к OCR сервису
-    - Конвертация изображений в base64
+    - Отправка изображений (multipart/form-data)
     - Парсинг ответов OCR
     - Обработка ошибок и retry логика
     
@@ -61,11 +88,30 @@ class OCRClient:
         "Include any text labels, legends, and structural information."
     )
     
+    # Промпты OCRService по prompt_type (новая архитектура)
+    SERVICE_PROMPTS = {
+        'ocr_simple': '<image>\n<|grounding|>OCR this image.',
+        'parse_figure': '<image>\nParse the figure.',
+        'bpmn': '<image>\n<|grounding|>Parse this BPMN diagram.',
+        'default': '<image>\nExtract all text from this image.'
+    }
+    
+    # Retry: экспоненциальная задержка с jitter (секунды)
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30.0
+    BACKOFF_JITTER = 0.25
+    
     def __init__(self, 
                  ocr_service: Optional['OCRService'] = None,
                  base_url: str = "http://localhost:8000",
                  timeout: int = 120,
-                 max_retries: int = 3):
+                 max_retries: int = 3,
+                 max_concurrency: int = 8,
+                 render_format: str = "png",
+                 jpeg_quality: int = 85,
+                 cache: Optional[OCRCache] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 warmup: bool = False):
         """
         Инициализация OCR клиента
         
@@ -74,12 +120,40 @@ class OCRClient:
             base_url: URL базового адреса OCR микросервиса (для legacy mode)
             timeout: Таймаут HTTP запросов (секунды)
             max_retries: Максимальное количество попыток при ошибках
+            max_concurrency: Сколько keep-alive соединений держать в пуле
+                            (должно быть не меньше числа параллельных запросов)
+            render_format: Формат отрендеренных страниц/областей ("png" или "jpeg").
+                          JPEG кодируется в разы быстрее PNG и весит меньше,
+                          что заметно для сканов; PNG - без потерь (векторные схемы)
+            jpeg_quality: Качество JPEG (для render_format="jpeg")
+            cache: Кэш ответов OCR по содержимому изображения (None - без кэша)
+            circuit_breaker: Размыкатель для быстрого отказа при недоступном сервисе
+                            (None - собственный CircuitBreaker() с настройками по умолчанию;
+                            можно передать общий для нескольких клиентов)
+            warmup: Сразу отправить прогревочный запрос (см. warmup())
         """
+        if render_format not in ("png", "jpeg"):
+            raise ValueError(f"Неподдерживаемый render_format: {render_format}")
+        
         self.ocr_service = ocr_service  # Новая архитектура
         self.base_url = base_url.rstrip('/')  # Legacy
         self.timeout = timeout
         self.max_retries = max_retries
+        self.render_format = render_format
+        self.jpeg_quality = jpeg_quality
+        self.cache = cache
+        self.breaker = circuit_breaker or CircuitBreaker()
         self._session = requests.Session()
+        
+        # Пул соединений под параллельные запросы (StructurePreserver):
+        # иначе соединения сверх пула закрываются и каждый запрос платит за TCP handshake
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._batch_supported = True  # Сбрасывается, если сервис не знает /ocr/figure_batch
+        
+        if warmup:
+            self.warmup()
     
     def ocr_page(self, page: fitz.Page, 
                  mode: OCRMode = OCRMode.BASE,
@@ -95,26 +169,116 @@ class OCRClient:
         Returns:
             OCRResponse: Результат OCR с Markdown и блоками
         """
-        # Рендерим страницу в изображение
-        pix = page.get_pixmap(dpi=150)  # 150 DPI для баланса качества/размера
-        img_bytes = pix.tobytes("png")
-        
-        # Кодируем в base64
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        
-        # Формируем запрос
-        payload = {
-            "image": img_base64,
-            "mode": mode.value,
-            "prompt": prompt or self.PROMPT_LAYOUT_MARKDOWN,
-            "page_id": page.number
+        img_bytes = self._render_page(page)
+        return self._ocr_rendered_page(img_bytes, page.number, mode, prompt)
+    
+    def ocr_pages(self, pages: Iterable[fitz.Page],
+                  mode: OCRMode = OCRMode.BASE,
+                  prompt: Optional[str] = None,
+                  prefetch: int = 4) -> Iterator[OCRResponse]:
+        """
+        OCR нескольких страниц с опережающим рендерингом
+        
+        Рендеринг (CPU) выполняется в отдельном потоке и складывается в
+        ограниченную очередь, пока текущая страница обрабатывается OCR
+        сервисом. Время на страницу ≈ max(рендер, OCR) вместо суммы.
+        
+        Args:
+            pages: Страницы PyMuPDF (итерируются в потоке рендеринга)
+            mode: Режим OCR
+            prompt: Кастомный промпт
+            prefetch: Сколько отрендеренных страниц держать в памяти
+        
+        Yields:
+            OCRResponse для каждой страницы в исходном порядке
+        
+        Note:
+            PyMuPDF не потокобезопасен: пока генератор не исчерпан,
+            документ нельзя использовать из других потоков.
+        """
+        rendered: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+        done = object()
+        
+        def put(item) -> bool:
+            # Не блокируемся навсегда, если потребитель прекратил чтение
+            while not stop.is_set():
+                try:
+                    rendered.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def producer():
+            try:
+                for page in pages:
+                    if not put((page.number, self._render_page(page))):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(done)
+        
+        thread = threading.Thread(target=producer, name="ocr-page-render", daemon=True)
+        thread.start()
+        
+        try:
+            while True:
+                item = rendered.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                page_number, img_bytes = item
+                yield self._ocr_rendered_page(img_bytes, page_number, mode, prompt)
+        finally:
+            stop.set()
+            thread.join()
+    
+    def _render_page(self, page: fitz.Page) -> bytes:
+        """Рендеринг страницы в изображение (render_format) для OCR"""
+        # alpha=False + RGB: без лишнего канала прозрачности, PNG кодируется быстрее
+        pix = page.get_pixmap(dpi=150, alpha=False, colorspace=fitz.csRGB)  # 150 DPI для баланса качества/размера
+        return self._encode_pixmap(pix)
+    
+    def _encode_pixmap(self, pix: fitz.Pixmap) -> bytes:
+        """Кодирование pixmap в render_format"""
+        if self.render_format == "jpeg":
+            return pix.tobytes("jpeg", jpg_quality=self.jpeg_quality)
+        return pix.tobytes("png")
+    
+    @staticmethod
+    def _upload_file(name: str, image_data: bytes) -> Tuple[str, bytes, str]:
+        """
+        Кортеж файла для multipart с MIME типом по содержимому
+        
+        Args:
+            name: Имя файла без расширения
+            image_data: Байты PNG или JPEG
+        """
+        if image_data[:3] == b"\xff\xd8\xff":
+            return (f"{name}.jpg", image_data, "image/jpeg")
+        return (f"{name}.png", image_data, "image/png")
+    
+    def _ocr_rendered_page(self, img_bytes: bytes, page_number: int,
+                           mode: OCRMode, prompt: Optional[str]) -> OCRResponse:
+        """OCR уже отрендеренной страницы"""
+        # Байты изображения уходят как есть (multipart), без base64 (+33% к размеру)
+        files = {
+            'file': self._upload_file('page', img_bytes)
+        }
+        data = {
+            'mode': mode.value,
+            'prompt': prompt or self.PROMPT_LAYOUT_MARKDOWN,
+            'page_id': page_number
         }
         
         # Отправляем запрос
-        response_data = self._make_request("/ocr/page", payload)
+        response_data = self._post_with_retry("/ocr/page", files=files, data=data)
         
         # Парсим ответ
-        return self._parse_ocr_response(response_data, page.number)
+        return self._parse_ocr_response(response_data, page_number)
     
     def ocr_image(self, image_data: bytes, 
                   page_num: int,
@@ -152,13 +316,25 @@ class OCRClient:
                 prompt_type=prompt_type
             )
         
+        # Повторяющиеся изображения (логотипы, шаблоны) берем из кэша
+        cache_key = None
+        if self.cache:
+            cache_key = OCRCache.make_key(
+                image_data, self.base_url,
+                prompt_type=prompt_type,
+                base_size=base_size,
+                image_size=image_size,
+                crop_mode=crop_mode
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return self._parse_ocr_response(cached, page_num)
+        
         # LEGACY: HTTP к DeepSeek-OCR микросервису
         # Новый API использует multipart/form-data вместо JSON
-        url = f"{self.base_url}/ocr/figure"
-        
-        # Подготавливаем файл
+        # Байты передаются напрямую: в отличие от BytesIO их можно переотправить при retry
         files = {
-            'file': ('image.png', io.BytesIO(image_data), 'image/png')
+            'file': self._upload_file('image', image_data)
         }
         
         # Параметры для form-data
@@ -169,49 +345,111 @@ class OCRClient:
             'crop_mode': crop_mode
         }
         
-        last_error = None
-        for attempt in range(self.max_retries):
-            try:
-                response = self._session.post(
-                    url,
-                    files=files,
-                    data=data,
-                    timeout=self.timeout
-                )
-                
-                # Проверяем статус
-                response.raise_for_status()
-                
-                # Парсим JSON ответ
-                response_data = response.json()
-                
-                # Парсим ответ
-                return self._parse_ocr_response(response_data, page_num)
+        response_data = self._post_with_retry("/ocr/figure", files=files, data=data)
+        if cache_key:
+            self.cache.put(cache_key, response_data)
+        return self._parse_ocr_response(response_data, page_num)
+    
+    def ocr_figures_batch(self, items: List[Tuple[bytes, Optional[BBox], int]],
+                          prompt_type: str = "default",
+                          base_size: int = 1024,
+                          image_size: int = 1024) -> List[Optional[OCRResponse]]:
+        """
+        Пакетный OCR нескольких изображений одним HTTP запросом
+        
+        Экономит HTTP round-trip на каждое изображение. Инференс на сервисе
+        по-прежнему по одному изображению (model.infer не принимает пакет),
+        выигрыш - в накладных расходах запросов. Если сервис не поддерживает
+        /ocr/figure_batch (или используется OCRService), изображения
+        обрабатываются по одному.
+        
+        Args:
+            items: Список (image_data, bbox, page_num)
+            prompt_type: Тип системного промпта (общий для пакета)
+            base_size: Базовое разрешение
+            image_size: Размер окна
+        
+        Returns:
+            OCRResponse для каждого элемента (None при ошибке) в исходном порядке
+        """
+        if not items:
+            return []
+        
+        if not self.ocr_service and self._batch_supported:
+            responses: List[Optional[OCRResponse]] = [None] * len(items)
+            cache_keys: List[Optional[str]] = [None] * len(items)
+            pending = []  # индексы, которых нет в кэше
             
-            except requests.exceptions.Timeout as e:
-                last_error = f"Timeout после {self.timeout}s"
-                continue
+            for index, (image_data, _, page_num) in enumerate(items):
+                if self.cache:
+                    cache_keys[index] = OCRCache.make_key(
+                        image_data, self.base_url,
+                        prompt_type=prompt_type,
+                        base_size=base_size,
+                        image_size=image_size,
+                        crop_mode=False
+                    )
+                    cached = self.cache.get(cache_keys[index])
+                    if cached is not None:
+                        responses[index] = self._parse_ocr_response(cached, page_num)
+                        continue
+                pending.append(index)
             
-            except requests.exceptions.ConnectionError as e:
-                last_error = f"Connection error: {e}"
-                continue
+            if not pending:
+                return responses
             
-            except requests.exceptions.HTTPError as e:
-                status_code = e.response.status_code
-                if status_code >= 500:
-                    last_error = f"Server error {status_code}"
-                    continue
-                else:
-                    raise RuntimeError(f"OCR request failed: {e}")
+            files = [
+                ('files', self._upload_file(f'image_{index}', items[index][0]))
+                for index in pending
+            ]
+            data = {
+                'prompt_type': prompt_type,
+                'base_size': base_size,
+                'image_size': image_size,
+                'crop_mode': False
+            }
             
+            try:
+                response_data = self._post_with_retry("/ocr/figure_batch", files=files, data=data)
+            except RuntimeError as e:
+                cause = e.__cause__
+                if not (isinstance(cause, requests.exceptions.HTTPError)
+                        and cause.response is not None
+                        and cause.response.status_code in (404, 405)):
+                    raise
+                # Старая версия сервиса - запоминаем и переходим на одиночные запросы
+                self._batch_supported = False
+            else:
+                results = response_data.get("results", [])
+                errors = response_data.get("errors", [])
+                for position, index in enumerate(pending):
+                    page_num = items[index][2]
+                    result = results[position] if position < len(results) else None
+                    if result is None:
+                        error = errors[position] if position < len(errors) else "нет результата"
+                        print(f"⚠️  OCR error for image on page {page_num}: {error}")
+                        continue
+                    if cache_keys[index]:
+                        self.cache.put(cache_keys[index], result)
+                    responses[index] = self._parse_ocr_response(result, page_num)
+                return responses
+        
+        # Fallback: по одному изображению
+        responses = []
+        for image_data, bbox, page_num in items:
+            try:
+                responses.append(self.ocr_figure(
+                    image_data, page_num, bbox,
+                    prompt_type=prompt_type,
+                    base_size=base_size,
+                    image_size=image_size
+                ))
+            except CircuitOpenError:
+                raise
             except Exception as e:
-                last_error = f"Unexpected error: {e}"
-                continue
-        
-        raise RuntimeError(
-            f"OCR request failed after {self.max_retries} attempts. "
-            f"Last error: {last_error}"
-        )
+                print(f"⚠️  OCR error for image on page {page_num}: {e}")
+                responses.append(None)
+        return responses
     
     def ocr_region(self, page: fitz.Page, bbox: BBox,
                    mode: OCRMode = OCRMode.BASE,
@@ -230,8 +468,8 @@ class OCRClient:
         """
         # Вырезаем область страницы
         rect = fitz.Rect(*bbox.to_tuple())
-        pix = page.get_pixmap(clip=rect, dpi=150)
-        img_bytes = pix.tobytes("png")
+        pix = page.get_pixmap(clip=rect, dpi=150, alpha=False, colorspace=fitz.csRGB)
+        img_bytes = self._encode_pixmap(pix)
         
         return self.ocr_image(
             image_data=img_bytes,
@@ -241,66 +479,118 @@ class OCRClient:
             prompt=prompt
         )
     
-    def _make_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def _post_with_retry(self, endpoint: str, **request_kwargs) -> Dict[str, Any]:
         """
-        Выполнить HTTP запрос к OCR сервису с retry логикой
+        POST запрос к OCR сервису с retry логикой
         
         Args:
-            endpoint: Endpoint API (например "/ocr/page")
-            payload: JSON payload
+            endpoint: Endpoint API (например "/ocr/figure")
+            **request_kwargs: Аргументы requests (json / files + data / headers)
         
         Returns:
             Dict с ответом сервера
         
         Raises:
+            CircuitOpenError: Размыкатель открыт - сервис считается недоступным
             RuntimeError: При ошибке после всех попыток
         """
         url = f"{self.base_url}{endpoint}"
         last_error = None
         
+        # Сервис недоступен - отказываем сразу, не дожидаясь таймаутов.
+        # Размыкатель считает запросы, а не попытки: проверка - один раз
+        # перед первой попыткой, ошибка - только после исчерпания повторов
+        self.breaker.before_call()
+        
         for attempt in range(self.max_retries):
+            response = None
             try:
                 response = self._session.post(
                     url,
-                    json=payload,
                     timeout=self.timeout,
-                    headers={"Content-Type": "application/json"}
+                    **request_kwargs
                 )
                 
                 # Проверяем статус
                 response.raise_for_status()
                 
-                # Парсим JSON
-                return response.json()
+                # Парсим JSON прямо из байтов ответа
+                result = _json_loads(response.content)
             
-            except requests.exceptions.Timeout as e:
-                last_error = f"Timeout после {self.timeout}s"
-                continue
-            
-            except requests.exceptions.ConnectionError as e:
-                last_error = f"Connection error: {e}"
-                continue
+            except Exception as e:
+                if not self._should_retry(e):
+                    # Client error - retry бесполезен (но сервис отвечает)
+                    self.breaker.record_success()
+                    raise RuntimeError(f"OCR request failed: {e}") from e
+                last_error = self._describe_error(e)
             
-            except requests.exceptions.HTTPError as e:
-                status_code = e.response.status_code
-                if status_code >= 500:
-                    # Server error - можно retry
-                    last_error = f"Server error {status_code}"
-                    continue
-                else:
-                    # Client error - retry бесполезен
-                    raise RuntimeError(f"OCR request failed: {e}")
+            else:
+                self.breaker.record_success()
+                return result
             
-            except Exception as e:
-                last_error = f"Unexpected error: {e}"
-                continue
+            # Пауза перед следующей попыткой (после последней - не ждем)
+            if attempt + 1 < self.max_retries:
+                time.sleep(self._backoff(attempt, response))
         
         # Если все попытки исчерпаны
+        self.breaker.record_failure()
         raise RuntimeError(
             f"OCR request failed after {self.max_retries} attempts. "
             f"Last error: {last_error}"
         )
     
+    @staticmethod
+    def _should_retry(error: Exception) -> bool:
+        """
+        Имеет ли смысл повторять запрос после ошибки
+        
+        Повторяем: таймауты, ошибки соединения, 429 (rate limit), 5xx,
+        прочие неожиданные ошибки. Не повторяем: остальные 4xx.
+        """
+        if isinstance(error, requests.exceptions.HTTPError):
+            status_code = error.response.status_code if error.response is not None else 0
+            return status_code == 429 or status_code >= 500
+        return True
+    
+    def _describe_error(self, error: Exception) -> str:
+        """Краткое описание ошибки для итогового сообщения"""
+        if isinstance(error, requests.exceptions.Timeout):
+            return f"Timeout после {self.timeout}s"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return f"Connection error: {error}"
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            status_code = error.response.status_code
+            if status_code == 429:
+                return "Rate limit (429)"
+            return f"Server error {status_code}"
+        return f"Unexpected error: {error}"
+    
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """
+        Задержка перед повторной попыткой
+        
+        Учитывает заголовок Retry-After (в секундах), иначе
+        min(BACKOFF_MAX, BACKOFF_BASE * 2^attempt) + случайный jitter,
+        чтобы параллельные клиенты не повторяли запросы синхронно.
+        
+        Args:
+            attempt: Номер неудавшейся попытки (с 0)
+            response: Ответ сервера (None если ответа не было)
+        
+        Returns:
+            Задержка в секундах
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(self.BACKOFF_MAX, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass  # HTTP-date формат - используем экспоненциальную задержку
+        
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** attempt))
+        return delay + random.uniform(0, self.BACKOFF_JITTER)
+    
     def _parse_ocr_response(self, response_data: Dict[str, Any], 
                            page_num: int) -> OCRResponse:
         """
@@ -346,22 +636,15 @@ class OCRClient:
             bbox_data = block_data.get("bbox", {})
             confidence = block_data.get("confidence", 1.0)
             
-            # Парсим bbox (может быть dict или tuple)
+            # Парсим bbox (может быть dict или list/tuple [x0, y0, x1, y1])
             if isinstance(bbox_data, dict):
-                bbox = BBox(
-                    x0=bbox_data.get("x0", 0),
-                    y0=bbox_data.get("y0", 0),
-                    x1=bbox_data.get("x1", 0),
-                    y1=bbox_data.get("y1", 0)
-                )
+                get = bbox_data.get
+                bbox = BBox(get("x0", 0), get("y0", 0), get("x1", 0), get("y1", 0))
             else:
                 bbox = BBox(*bbox_data)
             
-            # Парсим тип контента
-            try:
-                content_type = ContentType(type_str)
-            except ValueError:
-                content_type = ContentType.PARAGRAPH
+            # Парсим тип контента (неизвестный тип → PARAGRAPH)
+            content_type = _TYPE_MAP.get(type_str, ContentType.PARAGRAPH)
             
             ocr_block = OCRBlock(
                 id=block_id,
@@ -370,7 +653,7 @@ class OCRClient:
                 bbox=bbox,
                 page_num=page_num,
                 confidence=confidence,
-                source="ocr",
+                source=BlockSource.OCR,
                 metadata=block_data.get("metadata", {})
             )
             
@@ -381,8 +664,8 @@ class OCRClient:
         avg_confidence = sum(confidences) / len(confidences) if confidences else 1.0
         
         # Оценка токенов из raw_output
-        vision_tokens = len(raw_output.split()) // 2  # примерная оценка
-        text_tokens = len(markdown.split())
+        vision_tokens = _count_words(raw_output) // 2  # примерная оценка
+        text_tokens = _count_words(markdown)
         
         return OCRResponse(
             markdown=markdown,
@@ -436,9 +719,50 @@ class OCRClient:
                 f"{self.base_url}/health",
                 timeout=5
             )
-            return response.status_code == 200
         except Exception:
             return False
+        
+        if response.status_code != 200:
+            return False
+        
+        # Сервис снова доступен - не ждем reset_timeout
+        self.breaker.reset()
+        return True
+    
+    def warmup(self) -> bool:
+        """
+        Прогревочный запрос на маленьком синтетическом изображении
+        
+        Первый запрос к модели платит за инициализацию (компиляция ядер,
+        выделение KV-кэша), а первый HTTP запрос - за установку соединения.
+        Прогрев переносит эти затраты на старт, до первой реальной страницы.
+        Кэш не используется: результат прогрева не нужен.
+        
+        Returns:
+            bool: True если прогрев прошел успешно
+        """
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+        image_data = buffer.getvalue()
+        
+        try:
+            if self.ocr_service:
+                self.ocr_service.process_image(image_data, self.SERVICE_PROMPTS['ocr_simple'])
+            else:
+                self._post_with_retry(
+                    "/ocr/figure",
+                    files={'file': self._upload_file('warmup', image_data)},
+                    data={
+                        'prompt_type': 'ocr_simple',
+                        'base_size': 1024,
+                        'image_size': 1024,
+                        'crop_mode': False
+                    }
+                )
+            return True
+        except Exception as e:
+            print(f"⚠️  Прогрев OCR не удался: {e}")
+            return False
     
     def _ocr_figure_via_service(self, 
                                 image_data: bytes,
@@ -458,21 +782,33 @@ class OCRClient:
             OCRResponse
         """
         # Формируем промпт из промпт-типа
-        prompt_map = {
-            'ocr_simple': '<image>\n<|grounding|>OCR this image.',
-            'parse_figure': '<image>\nParse the figure.',
-            'bpmn': '<image>\n<|grounding|>Parse this BPMN diagram.',
-            'default': '<image>\nExtract all text from this image.'
-        }
-        prompt = prompt_map.get(prompt_type, prompt_map['default'])
+        prompt = self.SERVICE_PROMPTS.get(prompt_type, self.SERVICE_PROMPTS['default'])
         
         # Обработка через OCRService
         try:
-            markdown_text = self.ocr_service.process_image(image_data, prompt)
+            cache_key = None
+            markdown_text = None
+            if self.cache:
+                cache_key = OCRCache.make_key(
+                    image_data, self.ocr_service.get_service_name(),
+                    prompt=prompt
+                )
+                markdown_text = self.cache.get(cache_key)
+            
+            if markdown_text is None:
+                self.breaker.before_call()
+                try:
+                    markdown_text = self.ocr_service.process_image(image_data, prompt)
+                except Exception:
+                    self.breaker.record_failure()
+                    raise
+                self.breaker.record_success()
+                if cache_key:
+                    self.cache.put(cache_key, markdown_text)
             
             # Создаем OCRResponse (упрощенный, без блоков)
             ocr_block = OCRBlock(
-                id=f"ocr_{page_num}_{id(image_data)}",
+                id=f"ocr_{page_num}_{hashlib.blake2b(image_data, digest_size=8).hexdigest()}",
                 type=ContentType.TEXT,  # OCR распознает текст
                 content=markdown_text,
                 bbox=bbox or BBox(0, 0, 0, 0),
@@ -485,11 +821,13 @@ class OCRClient:
                 blocks=[ocr_block],
                 page_id=page_num,
                 vision_tokens_used=0,  # Не применимо для PaddleOCR
-                text_tokens_generated=len(markdown_text.split()),  # Примерное число токенов
+                text_tokens_generated=_count_words(markdown_text),  # Примерное число токенов
                 mode=OCRMode.BASE,  # Базовый режим
                 confidence_avg=0.9  # Фиктивный confidence
             )
         
+        except CircuitOpenError:
+            raise
         except Exception as e:
             raise RuntimeError(f"OCR через {self.ocr_service.get_service_name()} не удался: {e}")
     
@@ -77,7 +77,7 @@ class PDFExtractor(BaseExtractor):
         if self.enable_ocr and self.ocr_client:
             self.structure_preserver = StructurePreserver(
                 ocr_client=self.ocr_client,
-                min_image_area=min_image_area
+                min_area=min_image_area
             )
         else:
             self.structure_preserver = None
@@ -102,8 +102,8 @@ class PDFExtractor(BaseExtractor):
         
         pages_data = []
         
-        # Открываем PDF
-        with PDFParser(file_path) as parser:
+        # Открываем PDF (pdfplumber документ NativeExtractor - один на файл)
+        with PDFParser(file_path) as parser, self.native_extractor:
             total_pages = parser.get_total_pages()
             self._stats["pages_processed"] = total_pages
             
@@ -2,11 +2,12 @@
 IR (Intermediate Representation) модули
 """
 
-from .models import IR, IRBlock, IRRelation
+from .models import IR, IRBlock, IRRelation, RelationType
+from .image_store import ImageStore
 from .builder import IRBuilder
 from .structure_analyzer import StructureAnalyzer
 
-__all__ = ["IR", "IRBlock", "IRRelation", "IRBuilder", "StructureAnalyzer"]
+__all__ = ["IR", "IRBlock", "IRRelation", "RelationType", "ImageStore", "IRBuilder", "StructureAnalyzer"]
 
 
 
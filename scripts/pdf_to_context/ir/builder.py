@@ -7,7 +7,7 @@ IR Builder - построение промежуточного представ
 
 В единое промежуточное представление (IR) с:
 - Унифицированными блоками (IRBlock)
-- Связями между блоками (IRRelation)
+- Порядком чтения блоков (и связями IRRelation)
 - Метаданными документа
 
 Принципы SOLID:
@@ -25,9 +25,12 @@ from ..models.data_models import (
     TableBlock,
     OCRBlock,
     ContentType,
+    BlockSource,
     BBox
 )
-from .models import IR, IRBlock, IRRelation, DocumentMetadata
+from .models import IR, IRBlock, DocumentMetadata
+from .image_store import ImageStore
+from ..utils.block_order import sort_reading_order
 
 
 class IRBuilder:
@@ -36,7 +39,7 @@ class IRBuilder:
     
     Ответственность:
     - Конвертация блоков из разных источников в IRBlock
-    - Определение связей между блоками (reading order)
+    - Определение порядка чтения блоков
     - Сборка итогового IR объекта
     
     Не отвечает за:
@@ -45,9 +48,33 @@ class IRBuilder:
     - Форматирование вывода (это делает MarkdownFormatter)
     """
     
-    def __init__(self):
-        """Инициализация builder"""
+    def __init__(self, keep_image_data: bool = False):
+        """
+        Инициализация builder
+        
+        Args:
+            keep_image_data: Сохранять байты изображений в IR.image_store
+                             (для форматеров, встраивающих изображения через
+                             IR.get_image_data / get_image_data_uri). По умолчанию
+                             IR хранит только xref изображения и не держит байты.
+                             Байты должны быть извлечены: NativeExtractor(extract_image_bytes=True)
+                             (PDFToContextPipeline(keep_image_data=True) включает это сам)
+        """
+        self.keep_image_data = keep_image_data
         self._block_counter = 0
+        # Соль ID - одна на builder (uuid4 на каждый блок - лишний системный вызов)
+        self._id_salt = uuid.uuid4().hex[:8]
+        
+        # Ключ page_data → конвертер в IRBlock (порядок = порядок блоков в IR).
+        # ❌ drawing_blocks не конвертируются: векторная графика не нужна в MD -
+        # это только рамки, линии, декор (_convert_drawing_block)
+        self._converters = (
+            ("text_blocks", self._convert_text_block),       # Native блоки
+            ("image_blocks", self._convert_image_block),
+            ("table_blocks", self._convert_table_block),
+            ("ocr_blocks", self._convert_ocr_block),         # OCR блоки
+        )
+        self._image_store = ImageStore()  # ID блока → байты (IR.image_store)
     
     def build_ir(self, 
                  extracted_data: List[Dict[str, Any]],
@@ -71,49 +98,31 @@ class IRBuilder:
             IR: Промежуточное представление документа
         """
         all_blocks = []
+        self._image_store = ImageStore()
         
-        # Конвертируем все блоки из всех страниц
+        # Конвертируем все блоки из всех страниц (один проход по таблице конвертеров)
+        converters = self._converters
         for page_data in extracted_data:
-            # Native блоки
-            for text_block in page_data.get("text_blocks", []):
-                ir_block = self._convert_text_block(text_block)
-                all_blocks.append(ir_block)
-            
-            for image_block in page_data.get("image_blocks", []):
-                ir_block = self._convert_image_block(image_block)
-                all_blocks.append(ir_block)
-            
-            # ❌ Векторная графика не нужна в MD - это только рамки, линии, декор
-            # for drawing_block in page_data.get("drawing_blocks", []):
-            #     ir_block = self._convert_drawing_block(drawing_block)
-            #     all_blocks.append(ir_block)
-            
-            for table_block in page_data.get("table_blocks", []):
-                ir_block = self._convert_table_block(table_block)
-                all_blocks.append(ir_block)
-            
-            # OCR блоки
-            for ocr_block in page_data.get("ocr_blocks", []):
-                ir_block = self._convert_ocr_block(ocr_block)
-                all_blocks.append(ir_block)
+            for key, convert in converters:
+                blocks = page_data.get(key)
+                if blocks:
+                    all_blocks.extend(map(convert, blocks))
         
-        # Определяем связи (reading order)
-        relations = self._build_relations(all_blocks)
+        # Порядок чтения (список ID вместо N-1 связей reading_order)
+        reading_order = self._build_reading_order(all_blocks)
         
         # Обновляем статистику в метаданных
-        document_metadata.processing_stats = {
-            "total_blocks": len(all_blocks),
-            "native_blocks": len([b for b in all_blocks if b.source == "native"]),
-            "ocr_blocks": len([b for b in all_blocks if b.source == "ocr"]),
-            "blocks_by_type": self._count_by_type(all_blocks)
-        }
+        document_metadata.processing_stats = self._count_blocks(all_blocks)
         
         # Создаем IR
         ir = IR(
             blocks=all_blocks,
-            relations=relations,
-            document_metadata=document_metadata
+            relations=[],  # Других связей, кроме порядка чтения, пока нет
+            document_metadata=document_metadata,
+            image_store=self._image_store,
+            reading_order=reading_order
         )
+        self._image_store = ImageStore()
         
         return ir
     
@@ -121,21 +130,23 @@ class IRBuilder:
         """Конвертация TextBlock в IRBlock"""
         block_id = self._generate_id("text")
         
+        # Копия metadata исходного блока: IR не меняет extracted_data
+        # (ключи самого блока, как и раньше, важнее)
+        metadata = {**text_block.metadata}
+        metadata.setdefault("font_name", text_block.font_name)
+        metadata.setdefault("font_size", text_block.font_size)
+        metadata.setdefault("is_bold", text_block.is_bold)
+        metadata.setdefault("is_italic", text_block.is_italic)
+        
         return IRBlock(
             id=block_id,
             type=text_block.type,
             content=text_block.text,
             page=text_block.page_num + 1,  # Переводим в 1-based индексацию
             bbox=text_block.bbox,
-            source="native",
+            source=BlockSource.NATIVE,
             confidence=None,
-            metadata={
-                "font_name": text_block.font_name,
-                "font_size": text_block.font_size,
-                "is_bold": text_block.is_bold,
-                "is_italic": text_block.is_italic,
-                **text_block.metadata
-            }
+            metadata=metadata
         )
     
     def _convert_image_block(self, image_block: ImageBlock) -> IRBlock:
@@ -146,21 +157,33 @@ class IRBuilder:
         # ✅ Используем текстовый placeholder
         content = f"[Изображение: {image_block.format.upper()}, {image_block.width}x{image_block.height}px]"
         
+        # Байты - в IR.image_store по ссылке (base64 только по запросу форматера);
+        # без keep_image_data IR их не держит - изображение доступно по xref
+        image_ref = None
+        if self.keep_image_data and image_block.image_data:
+            # Исходные bytes заменяются видом на копию в хранилище - изображение
+            # в памяти одно (ImageBlock живет в extracted_data до конца build_ir)
+            image_block.image_data = self._image_store.add(block_id, image_block.image_data)
+            image_ref = f"image://{block_id}"
+        
+        # Копия metadata исходного блока: IR не меняет extracted_data
+        # (ключи самого блока, как и раньше, важнее)
+        metadata = {**image_block.metadata}
+        metadata.setdefault("format", image_block.format)
+        metadata.setdefault("width", image_block.width)
+        metadata.setdefault("height", image_block.height)
+        metadata.setdefault("xref", image_block.xref)
+        metadata["image_ref"] = image_ref  # Ссылка относится к этому IR - всегда новая
+        
         return IRBlock(
             id=block_id,
             type=ContentType.IMAGE,
             content=content,
             page=image_block.page_num + 1,
             bbox=image_block.bbox,
-            source="native",
+            source=BlockSource.NATIVE,
             confidence=None,
-            metadata={
-                "format": image_block.format,
-                "width": image_block.width,
-                "height": image_block.height,
-                "xref": image_block.xref,
-                **image_block.metadata
-            }
+            metadata=metadata
         )
     
     def _convert_drawing_block(self, drawing_block: DrawingBlock) -> IRBlock:
@@ -171,18 +194,20 @@ class IRBuilder:
         drawing_data = drawing_block.drawing_data
         content = f"[Векторная графика: {drawing_data.get('type', 'unknown')}]"
         
+        # Копия metadata исходного блока: IR не меняет extracted_data
+        # (ключи самого блока, как и раньше, важнее)
+        metadata = {**drawing_block.metadata}
+        metadata.setdefault("drawing_data", drawing_data)
+        
         return IRBlock(
             id=block_id,
             type=ContentType.VECTOR,
             content=content,
             page=drawing_block.page_num + 1,
             bbox=drawing_block.bbox,
-            source="native",
+            source=BlockSource.NATIVE,
             confidence=None,
-            metadata={
-                "drawing_data": drawing_data,
-                **drawing_block.metadata
-            }
+            metadata=metadata
         )
     
     def _convert_table_block(self, table_block: TableBlock) -> IRBlock:
@@ -192,6 +217,13 @@ class IRBuilder:
         # Для таблиц content = HTML или Markdown table
         content = table_block.html
         
+        # Копия metadata исходного блока: IR не меняет extracted_data
+        # (ключи самого блока, как и раньше, важнее)
+        metadata = {**table_block.metadata}
+        metadata.setdefault("rows", table_block.rows)
+        metadata.setdefault("cols", table_block.cols)
+        metadata.setdefault("data", table_block.data)
+        
         return IRBlock(
             id=block_id,
             type=ContentType.TABLE,
@@ -200,12 +232,7 @@ class IRBuilder:
             bbox=table_block.bbox,
             source=table_block.source,
             confidence=None,
-            metadata={
-                "rows": table_block.rows,
-                "cols": table_block.cols,
-                "data": table_block.data,
-                **table_block.metadata
-            }
+            metadata=metadata
         )
     
     def _convert_ocr_block(self, ocr_block: OCRBlock) -> IRBlock:
@@ -219,48 +246,29 @@ class IRBuilder:
             content=ocr_block.content,
             page=ocr_block.page_num + 1,
             bbox=ocr_block.bbox,
-            source="ocr",
+            source=BlockSource.OCR,
             confidence=ocr_block.confidence,
             metadata=ocr_block.metadata
         )
     
-    def _build_relations(self, blocks: List[IRBlock]) -> List[IRRelation]:
+    def _build_reading_order(self, blocks: List[IRBlock]) -> List[str]:
         """
-        Построить связи между блоками
+        Построить порядок чтения блоков
         
-        Основная связь: reading_order (порядок чтения)
         Определяется сортировкой по: страница → Y (сверху вниз) → X (слева направо)
         
         Args:
             blocks: Список IRBlock
         
         Returns:
-            Список IRRelation
+            Список ID блоков в порядке чтения (связи reading_order - пары соседей)
         """
-        relations = []
-        
-        # Сортируем блоки в порядке чтения
-        sorted_blocks = sorted(blocks, key=lambda b: b.get_position_key())
-        
-        # Создаем связи reading_order между последовательными блоками
-        for i in range(len(sorted_blocks) - 1):
-            current = sorted_blocks[i]
-            next_block = sorted_blocks[i + 1]
-            
-            relation = IRRelation(
-                type="reading_order",
-                from_id=current.id,
-                to_id=next_block.id,
-                metadata={"sequence": i}
-            )
-            relations.append(relation)
-        
-        # TODO: В будущем можно добавить другие типы связей:
-        # - caption_of: связь подписи с рисунком/таблицей
-        # - nested_in: вложенность элементов
-        # - reference: ссылки между элементами
-        
-        return relations
+        return [block.id for block in sort_reading_order(blocks, page_attr="page")]
+    
+    # TODO: В будущем можно добавить связи в IR.relations:
+    # - caption_of: связь подписи с рисунком/таблицей
+    # - nested_in: вложенность элементов
+    # - reference: ссылки между элементами
     
     def _generate_id(self, prefix: str) -> str:
         """
@@ -273,25 +281,35 @@ class IRBuilder:
             Уникальный ID
         """
         self._block_counter += 1
-        # Формат: prefix_counter_uuid_short
-        short_uuid = str(uuid.uuid4())[:8]
-        return f"{prefix}_{self._block_counter}_{short_uuid}"
+        # Формат: prefix_counter_salt (счетчик уникален внутри builder,
+        # соль - между разными builder)
+        return f"{prefix}_{self._block_counter}_{self._id_salt}"
     
-    def _count_by_type(self, blocks: List[IRBlock]) -> Dict[str, int]:
+    def _count_blocks(self, blocks: List[IRBlock]) -> Dict[str, Any]:
         """
-        Подсчет блоков по типам
+        Подсчет блоков по источникам и типам (один проход)
         
         Args:
             blocks: Список блоков
         
         Returns:
-            Словарь {type: count}
+            Словарь {total_blocks, native_blocks, ocr_blocks, blocks_by_type: {type: count}}
         """
-        counts = {}
+        by_source = {BlockSource.NATIVE: 0, BlockSource.OCR: 0}
+        by_type = {}
         for block in blocks:
+            source = block.source
+            if source in by_source:
+                by_source[source] += 1
             type_name = block.type.value
-            counts[type_name] = counts.get(type_name, 0) + 1
-        return counts
+            by_type[type_name] = by_type.get(type_name, 0) + 1
+        
+        return {
+            "total_blocks": len(blocks),
+            "native_blocks": by_source[BlockSource.NATIVE],
+            "ocr_blocks": by_source[BlockSource.OCR],
+            "blocks_by_type": by_type
+        }
     
     def __repr__(self) -> str:
         """Строковое представление"""
@@ -0,0 +1,128 @@
+"""
+Image Store - байты изображений IR в общем буфере
+
+Вместо отдельного объекта bytes на каждый блок изображения байты
+складываются в общие bytearray-чанки, блок хранит только (чанк, смещение,
+длина). Чанки растут по мере заполнения (первый - INITIAL_CHUNK_SIZE, каждый
+следующий вдвое больше, до chunk_size): документ с одним логотипом не
+выделяет мегабайты. Одинаковые изображения (логотип в колонтитуле
+каждой страницы - после пула процессов это разные объекты bytes) хранятся
+один раз: дубликаты находятся по хэшу содержимого. Память изображений
+документа = сумма уникальных изображений.
+
+Принципы:
+- Single Responsibility: Только хранение байтов изображений
+- Zero-copy: чтение возвращает memoryview на общий буфер
+"""
+
+import hashlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class ImageStore:
+    """
+    Хранилище байтов изображений: ID блока → memoryview
+
+    Использование:
+    ```python
+    store = ImageStore()
+    view = store.add("image_1_ab12cd34", png_bytes)  # Исходные bytes можно отпустить
+    view = store.get("image_1_ab12cd34")   # memoryview, без копии
+    data = bytes(view)                      # копия, если нужен bytes
+    ```
+    """
+
+    CHUNK_SIZE = 8 << 20  # 8 МБ - предел роста; изображение больше чанка получает свой буфер
+    INITIAL_CHUNK_SIZE = 64 << 10  # Первый чанк (64 КБ)
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            chunk_size: Размер чанка общего буфера (байт)
+        """
+        self.chunk_size = chunk_size
+        self._chunks: List[bytearray] = []
+        self._current: Optional[int] = None  # Индекс чанка, куда пишутся новые изображения
+        self._used = 0  # Занято в текущем чанке
+        self._next_capacity = min(self.INITIAL_CHUNK_SIZE, chunk_size)  # Размер следующего чанка
+        self._slots: Dict[str, Tuple[int, int, int]] = {}  # ID → (чанк, смещение, длина)
+        self._by_digest: Dict[bytes, Tuple[int, int, int]] = {}  # Хэш → слот
+
+    def add(self, block_id: str, data) -> memoryview:
+        """
+        Сохранить байты изображения блока
+
+        Args:
+            block_id: ID блока изображения
+            data: bytes / bytearray / memoryview
+
+        Returns:
+            memoryview на сохраненную копию - ею можно заменить исходные
+            bytes, чтобы не держать изображение в памяти дважды
+        """
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        slot = self._by_digest.get(digest)
+        if slot is None:
+            slot = self._write(data)
+            self._by_digest[digest] = slot
+        self._slots[block_id] = slot
+        return self._view(slot)
+
+    def _write(self, data) -> Tuple[int, int, int]:
+        """Скопировать байты в буфер (размер чанков не меняется - memoryview остаются валидными)"""
+        length = len(data)
+
+        if length > self.chunk_size:
+            # Большое изображение - отдельный буфер точного размера
+            self._chunks.append(bytearray(data))
+            return (len(self._chunks) - 1, 0, length)
+
+        if self._current is None or self._used + length > len(self._chunks[self._current]):
+            # Новый чанк: вдвое больше предыдущего (не меньше изображения, не больше chunk_size).
+            # Старый не расширяется - на него могут ссылаться выданные memoryview
+            capacity = max(self._next_capacity, length)
+            self._next_capacity = min(capacity * 2, self.chunk_size)
+            self._chunks.append(bytearray(capacity))
+            self._current = len(self._chunks) - 1
+            self._used = 0
+
+        offset = self._used
+        self._chunks[self._current][offset:offset + length] = data
+        self._used += length
+        return (self._current, offset, length)
+
+    def get(self, block_id: str, default=None) -> Optional[memoryview]:
+        """memoryview на байты изображения блока (default, если нет)"""
+        slot = self._slots.get(block_id)
+        if slot is None:
+            return default
+        return self._view(slot)
+
+    def _view(self, slot: Tuple[int, int, int]) -> memoryview:
+        """memoryview на слот общего буфера"""
+        index, offset, length = slot
+        return memoryview(self._chunks[index])[offset:offset + length]
+
+    def __getitem__(self, block_id: str) -> memoryview:
+        view = self.get(block_id)
+        if view is None:
+            raise KeyError(block_id)
+        return view
+
+    def __contains__(self, block_id: object) -> bool:
+        return block_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    @property
+    def unique_count(self) -> int:
+        """Количество различных изображений"""
+        return len(self._by_digest)
+
+    def __repr__(self) -> str:
+        """Строковое представление"""
+        return f"ImageStore(images={len(self)}, unique={self.unique_count})"
@@ -11,18 +11,32 @@ IR (Intermediate Representation) Models
 - Удобство для дальнейшей обработки (BPMN, Markdown, etc.)
 """
 
+import base64
+import bisect
+import json
+import sys
+from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any, Tuple
+from enum import Enum
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Tuple, TextIO
 from datetime import datetime
 
-from ..models.data_models import BBox, ContentType
+from ..models.data_models import BBox, ContentType, BlockSource
+from ..utils.bbox_ops import BBoxArray, NUMPY_AVAILABLE, overlapping_pairs
+from ..utils.block_order import sort_reading_order
+from .image_store import ImageStore
+
+
+# Блоков в IR - тысячи: __slots__ вместо __dict__ в несколько раз уменьшает
+# объект и ускоряет доступ к атрибутам (dataclass(slots=True) - Python 3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 
 # ============================================================================
 # IR Block - единый блок контента
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class IRBlock:
     """
     Блок в промежуточном представлении (IR)
@@ -34,25 +48,36 @@ class IRBlock:
     Attributes:
         id: Уникальный идентификатор блока
         type: Тип контента (heading, paragraph, table, image, etc.)
-        content: Содержимое (текст, HTML, markdown, или base64 для изображений)
+        content: Содержимое (текст, HTML, markdown; для изображений - текстовое описание)
         page: Номер страницы (начиная с 1)
         bbox: Координаты на странице
         source: Источник данных ("native" | "ocr")
         confidence: Уверенность (для OCR: 0.0-1.0, для native: None)
         metadata: Дополнительные данные (font_size, colors, etc.)
+        heading_level: Уровень заголовка (StructureAnalyzer)
+        list_id: ID списка, к которому относится элемент (StructureAnalyzer)
+        list_type: "ordered" | "unordered" (StructureAnalyzer)
+        parent_heading: ID родительского заголовка (StructureAnalyzer)
+    
+    Поля структуры читаются на каждый блок при форматировании, поэтому это
+    атрибуты, а не ключи metadata.
     """
     id: str
     type: ContentType
     content: str
     page: int
     bbox: BBox
-    source: str  # "native" | "ocr"
+    source: BlockSource
     confidence: Optional[float] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
+    heading_level: Optional[int] = None
+    list_id: Optional[str] = None
+    list_type: Optional[str] = None
+    parent_heading: Optional[str] = None
     
     def is_from_ocr(self) -> bool:
         """Проверка: блок из OCR"""
-        return self.source == "ocr"
+        return self.source == BlockSource.OCR
     
     def is_high_confidence(self, threshold: float = 0.9) -> bool:
         """Проверка высокой уверенности"""
@@ -69,7 +94,15 @@ class IRBlock:
 # IR Relation - связи между блоками
 # ============================================================================
 
-@dataclass
+class RelationType(str, Enum):
+    """Типы связей между блоками (члены - общие объекты-строки, как у BlockSource)"""
+    READING_ORDER = "reading_order"  # Порядок чтения (следующий блок)
+    CAPTION_OF = "caption_of"        # Подпись к элементу (рисунку, таблице)
+    NESTED_IN = "nested_in"          # Вложенность (элемент внутри другого)
+    REFERENCE = "reference"          # Ссылка (см. рис. 1, табл. 2)
+
+
+@dataclass(**_SLOTS)
 class IRRelation:
     """
     Связь между блоками в IR
@@ -80,7 +113,7 @@ class IRRelation:
     - nested_in: Вложенность (элемент внутри другого)
     - reference: Ссылка (см. рис. 1, табл. 2)
     """
-    type: str  # reading_order, caption_of, nested_in, reference
+    type: RelationType
     from_id: str
     to_id: str
     metadata: Dict[str, Any] = field(default_factory=dict)
@@ -90,7 +123,7 @@ class IRRelation:
 # Document Metadata
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class DocumentMetadata:
     """Метаданные всего документа"""
     title: Optional[str] = None
@@ -149,48 +182,221 @@ class IR:
     - Генерации Markdown
     - Построения BPMN (в будущем)
     - Других форматов вывода
+    
+    Байты изображений хранятся не в блоках, а в image_store (ID блока →
+    memoryview на общий буфер, одинаковые изображения - один раз);
+    блок ссылается на них через metadata["image_ref"] = "image://<id>".
+    image_store заполняется только при IRBuilder(keep_image_data=True),
+    иначе он пуст, а изображение блока доступно по metadata["xref"].
+    
+    Порядок чтения - список ID блоков reading_order (а не N-1 объектов
+    IRRelation); связи reading_order для get_relations_* строятся по запросу.
+    
+    Индексы (по ID, странице, типу, источнику, связям) строятся при создании;
+    после изменения blocks / relations / reading_order или block.type
+    (StructureAnalyzer) нужно вызвать reindex().
     """
     blocks: List[IRBlock]
     relations: List[IRRelation]
     document_metadata: DocumentMetadata
+    image_store: ImageStore = field(default_factory=ImageStore)
+    reading_order: List[str] = field(default_factory=list)
     
     def __post_init__(self):
         """Валидация и индексация после создания"""
         self._index_blocks()
     
+    def reindex(self):
+        """Перестроить индексы после изменения blocks / relations / reading_order"""
+        self._index_blocks()
+    
     def _index_blocks(self):
-        """Создание индекса блоков по ID"""
+        """Создание индексов блоков (по ID, странице, типу, источнику) и связей (по from_id / to_id)"""
         self._blocks_by_id = {block.id: block for block in self.blocks}
-        self._blocks_by_page = {}
+        blocks_by_page: Dict[int, List[IRBlock]] = defaultdict(list)
+        self._blocks_by_type: Dict[ContentType, List[IRBlock]] = defaultdict(list)
+        native_blocks: List[IRBlock] = []
+        ocr_blocks: List[IRBlock] = []
+        self._blocks_by_source = {BlockSource.NATIVE: native_blocks, BlockSource.OCR: ocr_blocks}
+        ocr = BlockSource.OCR
         for block in self.blocks:
-            if block.page not in self._blocks_by_page:
-                self._blocks_by_page[block.page] = []
-            self._blocks_by_page[block.page].append(block)
+            blocks_by_page[block.page].append(block)
+            self._blocks_by_type[block.type].append(block)
+            (ocr_blocks if block.source == ocr else native_blocks).append(block)
+        # Кортежи: get_blocks_by_page отдает их без копии, и вызывающий код
+        # не может случайно изменить индекс (append/sort)
+        self._blocks_by_page: Dict[int, Tuple[IRBlock, ...]] = {
+            page: tuple(page_blocks) for page, page_blocks in blocks_by_page.items()
+        }
+        self._order_positions = None  # ID → позиция в reading_order (лениво)
+        self._sorted_blocks = None  # Блоки, отсортированные по позиции (лениво)
+        self._sorted_pages = None  # Номера страниц _sorted_blocks (для bisect)
+        self._page_bbox_arrays: Dict[int, BBoxArray] = {}  # Страница → bbox блоков (лениво)
+        
+        # Списки смежности: get_relations_* без просмотра всех связей
+        self._relations_by_from = defaultdict(list)
+        self._relations_by_to = defaultdict(list)
+        for relation in self.relations:
+            self._relations_by_from[relation.from_id].append(relation)
+            self._relations_by_to[relation.to_id].append(relation)
     
     def get_block(self, block_id: str) -> Optional[IRBlock]:
         """Получить блок по ID"""
         return self._blocks_by_id.get(block_id)
     
-    def get_blocks_by_page(self, page: int) -> List[IRBlock]:
-        """Получить все блоки на странице"""
-        return self._blocks_by_page.get(page, [])
+    def get_image_data(self, block_id: str) -> Optional[memoryview]:
+        """Байты изображения блока без копии (None, если изображение не сохранено)"""
+        return self.image_store.get(block_id)
+    
+    def get_image_data_uri(self, block_id: str) -> Optional[str]:
+        """
+        data: URI изображения блока (base64 кодируется только здесь, по запросу)
+        
+        Args:
+            block_id: ID блока изображения
+        
+        Returns:
+            "data:image/<format>;base64,..." или None
+        """
+        data = self.image_store.get(block_id)
+        if data is None:
+            return None
+        
+        block = self._blocks_by_id.get(block_id)
+        image_format = (block.metadata.get("format") if block else None) or "png"
+        encoded = base64.b64encode(data).decode("ascii")
+        return f"data:image/{image_format};base64,{encoded}"
+    
+    def get_blocks_by_page(self, page: int) -> Sequence[IRBlock]:
+        """Получить все блоки на странице (неизменяемый кортеж, без копии)"""
+        return self._blocks_by_page.get(page, ())
+    
+    def get_page_bbox_array(self, page: int) -> BBoxArray:
+        """
+        bbox блоков страницы одним массивом (N, 4) в порядке get_blocks_by_page
+        
+        Требует NumPy; массив строится один раз на страницу.
+        """
+        bbox_array = self._page_bbox_arrays.get(page)
+        if bbox_array is None:
+            bbox_array = BBoxArray.from_bboxes(b.bbox for b in self.get_blocks_by_page(page))
+            self._page_bbox_arrays[page] = bbox_array
+        return bbox_array
+    
+    def overlap_area_matrix(self, page: int):
+        """
+        Площади попарных перекрытий блоков страницы
+        
+        Для анализа раскладки: одна векторная операция вместо N² вызовов
+        BBox.overlap_area(). Порядок строк/столбцов - get_blocks_by_page(page).
+        
+        Returns:
+            Массив NumPy (N, N) (0 - не перекрываются); без NumPy - список списков
+        """
+        if not NUMPY_AVAILABLE:
+            blocks = self.get_blocks_by_page(page)
+            return [[a.bbox.overlap_area(b.bbox) for b in blocks] for a in blocks]
+        
+        bbox_array = self.get_page_bbox_array(page)
+        return bbox_array.pairwise_overlap_area(bbox_array)
+    
+    def find_overlapping_pairs(self, page: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Пары ID блоков, bbox которых перекрываются (площадь > 0)
+        
+        В отличие от overlap_area_matrix не строит матрицу N x N: sweep по X
+        (ядро Numba, если установлена) - годится для страниц с тысячами блоков.
+        
+        Args:
+            page: Номер страницы (None - все страницы; блоки разных страниц
+                  не сравниваются)
+        
+        Returns:
+            Список (ID первого блока, ID второго блока) в порядке get_blocks_by_page
+        """
+        pages = list(self._blocks_by_page) if page is None else [page]
+        pairs: List[Tuple[str, str]] = []
+        
+        for page_num in pages:
+            blocks = self.get_blocks_by_page(page_num)
+            if not NUMPY_AVAILABLE:
+                pairs.extend(
+                    (a.id, b.id)
+                    for i, a in enumerate(blocks)
+                    for b in blocks[i + 1:]
+                    if a.bbox.overlap_area(b.bbox) > 0
+                )
+                continue
+            
+            first, second = overlapping_pairs(self.get_page_bbox_array(page_num).coords)
+            pairs.extend(
+                (blocks[i].id, blocks[j].id)
+                for i, j in sorted(zip(first.tolist(), second.tolist()))
+            )
+        
+        return pairs
     
     def get_blocks_by_type(self, content_type: ContentType) -> List[IRBlock]:
         """Получить все блоки заданного типа"""
-        return [b for b in self.blocks if b.type == content_type]
+        return list(self._blocks_by_type.get(content_type, ()))
     
     def get_reading_order(self) -> List[IRBlock]:
         """Получить блоки в порядке чтения"""
-        # Сортируем по странице, затем по Y (сверху вниз), затем по X
-        return sorted(self.blocks, key=lambda b: b.get_position_key())
+        if self.reading_order and len(self.reading_order) == len(self.blocks):
+            blocks_by_id = self._blocks_by_id
+            return [blocks_by_id[block_id] for block_id in self.reading_order]
+        
+        # Сортируем по странице, затем по Y (сверху вниз), затем по X -
+        # один раз, повторные вызовы получают копию готового порядка
+        return list(self._positional_order())
+    
+    def _positional_order(self) -> List[IRBlock]:
+        """Блоки, отсортированные по (page, -y1, x0) - строится один раз"""
+        if self._sorted_blocks is None:
+            self._sorted_blocks = sort_reading_order(self.blocks, page_attr="page")
+            self._sorted_pages = [block.page for block in self._sorted_blocks]
+        return self._sorted_blocks
+    
+    def get_blocks_in_page_range(self, first_page: int, last_page: int) -> List[IRBlock]:
+        """
+        Блоки страниц first_page..last_page (включительно) в позиционном порядке
+        
+        Границы диапазона ищутся bisect по отсортированным номерам страниц:
+        O(log N + k) вместо обхода страниц и склейки списков.
+        """
+        blocks = self._positional_order()
+        start = bisect.bisect_left(self._sorted_pages, first_page)
+        stop = bisect.bisect_right(self._sorted_pages, last_page, lo=start)
+        return blocks[start:stop]
+    
+    def iter_reading_order_pairs(self) -> Iterator[Tuple[str, str]]:
+        """Пары (ID блока, ID следующего блока) в порядке чтения"""
+        return zip(self.reading_order, self.reading_order[1:])
+    
+    def _reading_order_relation(self, position: int) -> IRRelation:
+        """Связь reading_order от блока на позиции position к следующему"""
+        return IRRelation(
+            type=RelationType.READING_ORDER,
+            from_id=self.reading_order[position],
+            to_id=self.reading_order[position + 1],
+            metadata={"sequence": position}
+        )
+    
+    def _reading_order_position(self, block_id: str) -> Optional[int]:
+        """Позиция блока в reading_order (None - блока там нет)"""
+        if self._order_positions is None:
+            self._order_positions = {
+                block_id: position for position, block_id in enumerate(self.reading_order)
+            }
+        return self._order_positions.get(block_id)
     
     def get_ocr_blocks(self) -> List[IRBlock]:
         """Получить все блоки из OCR"""
-        return [b for b in self.blocks if b.is_from_ocr()]
+        return list(self._blocks_by_source[BlockSource.OCR])
     
     def get_native_blocks(self) -> List[IRBlock]:
         """Получить все native блоки"""
-        return [b for b in self.blocks if not b.is_from_ocr()]
+        return list(self._blocks_by_source[BlockSource.NATIVE])
     
     def get_low_confidence_blocks(self, threshold: float = 0.9) -> List[IRBlock]:
         """Получить блоки с низкой уверенностью"""
@@ -198,61 +404,139 @@ class IR:
     
     def get_relations_from(self, block_id: str) -> List[IRRelation]:
         """Получить все связи, исходящие от блока"""
-        return [r for r in self.relations if r.from_id == block_id]
+        relations = list(self._relations_by_from.get(block_id, ()))
+        position = self._reading_order_position(block_id)
+        if position is not None and position + 1 < len(self.reading_order):
+            relations.append(self._reading_order_relation(position))
+        return relations
     
     def get_relations_to(self, block_id: str) -> List[IRRelation]:
         """Получить все связи, входящие в блок"""
-        return [r for r in self.relations if r.to_id == block_id]
+        relations = list(self._relations_by_to.get(block_id, ()))
+        position = self._reading_order_position(block_id)
+        if position:  # У первого блока входящей связи нет
+            relations.append(self._reading_order_relation(position - 1))
+        return relations
     
-    def get_statistics(self) -> Dict[str, Any]:
-        """Получить статистику по IR"""
-        stats = {
+    def get_statistics(self, confidence_threshold: float = 0.9) -> Dict[str, Any]:
+        """Получить статистику по IR (один проход по блокам)"""
+        blocks_by_type: Dict[str, int] = {}
+        ocr_count = 0
+        low_confidence_count = 0
+        ocr = BlockSource.OCR
+        
+        for block in self.blocks:
+            type_name = block.type.value
+            blocks_by_type[type_name] = blocks_by_type.get(type_name, 0) + 1
+            if block.source == ocr:
+                ocr_count += 1
+            confidence = block.confidence
+            if confidence is not None and confidence < confidence_threshold:
+                low_confidence_count += 1
+        
+        return {
             "total_blocks": len(self.blocks),
-            "total_relations": len(self.relations),
+            "total_relations": len(self.relations) + max(len(self.reading_order) - 1, 0),
             "pages": self.document_metadata.total_pages,
-            "blocks_by_type": {},
+            "blocks_by_type": blocks_by_type,
             "blocks_by_source": {
-                "native": len(self.get_native_blocks()),
-                "ocr": len(self.get_ocr_blocks())
+                "native": len(self.blocks) - ocr_count,
+                "ocr": ocr_count
             },
-            "low_confidence_blocks": len(self.get_low_confidence_blocks())
+            "low_confidence_blocks": low_confidence_count
         }
-        
-        # Подсчет блоков по типам
-        for block in self.blocks:
-            type_name = block.type.value
-            stats["blocks_by_type"][type_name] = stats["blocks_by_type"].get(type_name, 0) + 1
-        
-        return stats
     
     def to_dict(self) -> Dict[str, Any]:
         """Преобразование в словарь (для JSON экспорта)"""
+        result = self._to_shallow_dict()
+        result["blocks"] = [_block_to_dict(b) for b in self.blocks]
+        result["relations"] = [_relation_to_dict(r) for r in result["relations"]]
+        return result
+    
+    def _to_shallow_dict(self) -> Dict[str, Any]:
+        """Словарь верхнего уровня; blocks / relations - сами объекты IR"""
         return {
             "document_metadata": self.document_metadata.to_dict(),
             "statistics": self.get_statistics(),
-            "blocks": [
-                {
-                    "id": b.id,
-                    "type": b.type.value,
-                    "content": b.content,
-                    "page": b.page,
-                    "bbox": b.bbox.to_tuple(),
-                    "source": b.source,
-                    "confidence": b.confidence,
-                    "metadata": b.metadata
-                }
-                for b in self.blocks
-            ],
-            "relations": [
-                {
-                    "type": r.type,
-                    "from": r.from_id,
-                    "to": r.to_id,
-                    "metadata": r.metadata
-                }
-                for r in self.relations
-            ]
+            "blocks": self.blocks,
+            "relations": self._export_relations(),
+            "reading_order": self.reading_order
         }
+    
+    def _export_relations(self) -> List[IRRelation]:
+        """
+        Связи для JSON экспорта: цепочка reading_order + self.relations
+        
+        Формат "relations" прежний (связи reading_order с metadata.sequence
+        в нем, как до хранения порядка списком ID); "reading_order" -
+        дополнительный ключ.
+        """
+        relations = [self._reading_order_relation(i) for i in range(len(self.reading_order) - 1)]
+        relations.extend(self.relations)
+        return relations
+    
+    def stream_json(self, fp: TextIO, **kwargs) -> None:
+        """
+        Записать IR в JSON (тот же формат, что json.dump(ir.to_dict()))
+        
+        Словарь каждого блока/связи создается энкодером по ходу записи и
+        сразу освобождается - полные списки словарей, как в to_dict(), не строятся.
+        
+        Args:
+            fp: Текстовый файл для записи
+            **kwargs: Параметры json.dump (indent, ensure_ascii, ...)
+        """
+        kwargs.setdefault("ensure_ascii", False)
+        json.dump(self._to_shallow_dict(), fp, cls=_IRJSONEncoder, **kwargs)
+
+
+# ============================================================================
+# JSON экспорт
+# ============================================================================
+
+def _block_to_dict(b: IRBlock) -> Dict[str, Any]:
+    """Словарь блока для JSON экспорта"""
+    return {
+        "id": b.id,
+        "type": b.type.value,
+        "content": b.content,
+        "page": b.page,
+        "bbox": b.bbox.to_tuple(),
+        "source": b.source,
+        "confidence": b.confidence,
+        "metadata": b.metadata,
+        "heading_level": b.heading_level,
+        "list_id": b.list_id,
+        "list_type": b.list_type,
+        "parent_heading": b.parent_heading
+    }
+
+
+def _relation_to_dict(r: IRRelation) -> Dict[str, Any]:
+    """Словарь связи для JSON экспорта"""
+    return {
+        "type": r.type,
+        "from": r.from_id,
+        "to": r.to_id,
+        "metadata": r.metadata
+    }
+
+
+class _IRJSONEncoder(json.JSONEncoder):
+    """JSONEncoder, сериализующий объекты IR по одному во время записи"""
+    
+    def default(self, o):
+        if isinstance(o, IRBlock):
+            return _block_to_dict(o)
+        if isinstance(o, IRRelation):
+            return _relation_to_dict(o)
+        if isinstance(o, BBox):
+            return o.to_tuple()
+        if isinstance(o, Enum):
+            return o.value
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
 
 
 
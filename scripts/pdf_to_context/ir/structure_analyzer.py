@@ -15,7 +15,9 @@ Structure Analyzer - анализ структуры документа в IR
 """
 
 import re
-from typing import List, Dict, Any, Optional, Set
+import weakref
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Set, Tuple
 from collections import defaultdict
 
 from .models import IR, IRBlock, IRRelation
@@ -38,208 +40,152 @@ class StructureAnalyzer:
     - Форматирование (это делает MarkdownFormatter)
     """
     
-    # Паттерны для идентификации структуры
+    # Паттерны для идентификации структуры (компилируются один раз).
+    # Нумерованный заголовок - одно регулярное выражение на все уровни:
+    # "1. Заголовок" → 1, "1.1 Заголовок" → 2 (группа 1), "1.1.1 Заголовок" → 3 (группа 2)
+    NUMBERED_HEADING_PATTERN = re.compile(r'^\d+\.(?:\s|(\d+)(\.\d+)?\s)')
+    
+    # Остальные заголовки: (паттерн, уровень)
     HEADING_PATTERNS = [
-        r'^\d+\.\s+',  # "1. Заголовок"
-        r'^\d+\.\d+\s+',  # "1.1 Заголовок"
-        r'^[A-ZА-Я][A-ZА-Я\s]+$',  # "ЗАГОЛОВОК ЗАГЛАВНЫМИ"
-        r'^Глава\s+\d+',  # "Глава 1"
-        r'^Раздел\s+\d+',  # "Раздел 1"
-        r'^Приложение\s+[A-ZА-Я\d]',  # "Приложение А"
+        (re.compile(r'^[A-ZА-Я][A-ZА-Я\s]+$'), 1),  # "ЗАГОЛОВОК ЗАГЛАВНЫМИ"
+        (re.compile(r'^Глава\s+\d+'), 1),  # "Глава 1"
+        (re.compile(r'^Раздел\s+\d+'), 1),  # "Раздел 1"
+        (re.compile(r'^Приложение\s+[A-ZА-Я\d]'), 1),  # "Приложение А"
     ]
     
+    # Типы блоков для проверок "in" (хэш-поиск вместо перебора атрибутов ContentType)
+    _TEXT_TYPES = frozenset({ContentType.TEXT, ContentType.PARAGRAPH})
+    _TEXT_OR_HEADING_TYPES = frozenset({ContentType.TEXT, ContentType.PARAGRAPH, ContentType.HEADING})
+    
+    # Списки: (паттерн, тип списка)
     LIST_PATTERNS = [
-        r'^[-•·]\s+',  # Маркированный список
-        r'^\d+\)\s+',  # Нумерованный список "1) "
-        r'^[а-я]\)\s+',  # Буквенный список "а) "
-        r'^[ivxlcdm]+\)\s+',  # Римские цифры "i) "
+        (re.compile(r'^[-•·]\s+'), "unordered"),  # Маркированный список
+        (re.compile(r'^\d+\)\s+'), "ordered"),  # Нумерованный список "1) "
+        (re.compile(r'^[а-я]\)\s+'), "unordered"),  # Буквенный список "а) "
+        (re.compile(r'^[ivxlcdm]+\)\s+'), "unordered"),  # Римские цифры "i) "
     ]
     
+    # Классификация по началу текста кэшируется: в документе тысячи абзацев
+    # с одинаковыми маркерами ("- ", "1) "). Паттерны нумерации и списков
+    # привязаны к началу строки и не содержат "$", поэтому префикса длиной
+    # CLASSIFY_PREFIX_LEN достаточно (маркеры короче)
+    CLASSIFY_PREFIX_LEN = 16
+    CLASSIFY_CACHE_SIZE = 4096
+    
     def __init__(self):
         """Инициализация анализатора"""
-        pass
+        # Кэши на экземпляр - учитывают паттерны подклассов
+        self._list_type_of_prefix = lru_cache(maxsize=self.CLASSIFY_CACHE_SIZE)(self._match_list_type)
+        self._numbered_level_of_prefix = lru_cache(maxsize=self.CLASSIFY_CACHE_SIZE)(
+            self._match_numbered_level
+        )
+        
+        # Разделы последнего проанализированного IR: (weakref на IR, разделы) -
+        # get_sections после analyze() не проходит документ заново
+        self._sections_cache: Optional[tuple] = None
     
     def analyze(self, ir: IR) -> IR:
         """
         Анализировать структуру IR и обогатить метаданными
         
+        Заголовки, списки, иерархия, оглавление и разделы определяются за
+        один проход по блокам (плюс предварительный проход для среднего
+        размера шрифта).
+        
         Args:
             ir: Промежуточное представление
         
         Returns:
             IR: Обогащенное IR с улучшенной типизацией и метаданными
         """
-        # 1. Определение заголовков
-        self._identify_headings(ir)
-        
-        # 2. Идентификация списков
-        self._identify_lists(ir)
-        
-        # 3. Построение иерархии
-        self._build_hierarchy(ir)
-        
-        # 4. Определение оглавления (TOC)
-        toc = self._build_toc(ir)
+        toc, sections = self._single_pass(ir)
         ir.document_metadata.processing_stats["toc"] = toc
+        self._sections_cache = (weakref.ref(ir), sections)
+        
+        # Типы блоков изменились - обновляем индексы IR (get_blocks_by_type)
+        ir.reindex()
         
         return ir
     
-    def _identify_headings(self, ir: IR):
+    def _single_pass(self, ir: IR) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
-        Идентификация заголовков и определение их уровней
+        Один проход по блокам: заголовки, списки, иерархия, TOC, разделы
         
-        Эвристики:
-        - Размер шрифта (больше среднего → заголовок)
-        - Жирный шрифт + короткий текст
-        - Паттерны нумерации ("1.", "1.1", etc.)
-        - Текст заглавными буквами
+        Для каждого блока по порядку:
+        1. Заголовок? (эвристики _heading_level)
+        2. Элемент списка? (только TEXT/PARAGRAPH, которые не стали заголовками)
+        3. Родительский заголовок (стек заголовков)
+        4. Запись оглавления / новый раздел или блок текущего раздела
         
-        Модифицирует блоки в IR in-place.
-        """
-        # Вычисляем средний размер шрифта для текстовых блоков
-        font_sizes = []
-        for block in ir.blocks:
-            if block.type in [ContentType.TEXT, ContentType.PARAGRAPH]:
-                font_size = block.metadata.get("font_size")
-                if font_size:
-                    font_sizes.append(font_size)
+        Решения для блока зависят только от предыдущих блоков, поэтому
+        результат совпадает с последовательными проходами.
         
-        avg_font_size = sum(font_sizes) / len(font_sizes) if font_sizes else 12.0
-        large_font_threshold = avg_font_size * 1.2  # 20% больше среднего
+        Проход намеренно последовательный: re и доступ к атрибутам не
+        отпускают GIL (потоки не ускоряют), а работа на блок - микросекунды,
+        что меньше стоимости передачи блоков в пул процессов.
         
-        for block in ir.blocks:
-            # Только для текстовых блоков
-            if block.type not in [ContentType.TEXT, ContentType.PARAGRAPH, ContentType.HEADING]:
-                continue
-            
-            text = block.content.strip()
-            font_size = block.metadata.get("font_size", avg_font_size)
-            is_bold = block.metadata.get("is_bold", False)
-            
-            # Проверяем эвристики
-            is_heading = False
-            heading_level = 1
-            
-            # Эвристика 1: Паттерны заголовков
-            for pattern in self.HEADING_PATTERNS:
-                if re.match(pattern, text):
-                    is_heading = True
-                    # Определяем уровень по глубине нумерации
-                    if re.match(r'^\d+\.\d+\.\d+', text):
-                        heading_level = 3
-                    elif re.match(r'^\d+\.\d+', text):
-                        heading_level = 2
-                    elif re.match(r'^\d+\.', text):
-                        heading_level = 1
-                    break
-            
-            # Эвристика 2: Большой шрифт
-            if font_size > large_font_threshold:
-                is_heading = True
-                # Уровень зависит от размера
-                if font_size > avg_font_size * 1.5:
-                    heading_level = 1
-                elif font_size > avg_font_size * 1.3:
-                    heading_level = 2
-                else:
-                    heading_level = 3
-            
-            # Эвристика 3: Жирный + короткий текст
-            if is_bold and len(text) < 100:
-                is_heading = True
-                heading_level = min(heading_level, 2)  # Не выше H2
-            
-            # Обновляем тип блока
-            if is_heading:
-                block.type = ContentType.HEADING
-                block.metadata["heading_level"] = heading_level
-                block.metadata["original_type"] = "heading"
-    
-    def _identify_lists(self, ir: IR):
-        """
-        Идентификация списков в документе
+        Модифицирует блоки в IR in-place.
         
-        Группирует последовательные блоки, начинающиеся с маркеров списка.
+        Returns:
+            (toc, sections)
         """
+        avg_font_size = self._average_font_size(ir)
+        large_font_threshold = avg_font_size * 1.2  # 20% больше среднего
+        
+        toc: List[Dict[str, Any]] = []
+        sections: List[Dict[str, Any]] = []
+        current_section = None
+        heading_stack = []  # Стек заголовков (level, block_id)
         list_id_counter = 0
         current_list_id = None
         
-        for i, block in enumerate(ir.blocks):
-            if block.type not in [ContentType.TEXT, ContentType.PARAGRAPH]:
-                current_list_id = None
-                continue
-            
-            text = block.content.strip()
+        text_types = self._TEXT_TYPES
+        text_or_heading_types = self._TEXT_OR_HEADING_TYPES
+        
+        for block in ir.blocks:
+            metadata = block.metadata
             
-            # Проверяем паттерны списка
-            is_list_item = False
-            list_type = None
+            # Текст очищается один раз на блок - и только у текстовых блоков
+            # (заголовки, списки и TOC берутся только из них)
+            text = block.content.strip() if block.type in text_or_heading_types else None
             
-            for pattern in self.LIST_PATTERNS:
-                if re.match(pattern, text):
-                    is_list_item = True
-                    if pattern.startswith(r'^\d+'):
-                        list_type = "ordered"
-                    else:
-                        list_type = "unordered"
-                    break
+            # 1. Заголовки
+            if text is not None:
+                heading_level = self._heading_level(block, text, avg_font_size, large_font_threshold)
+                if heading_level is not None:
+                    block.type = ContentType.HEADING
+                    block.heading_level = heading_level
+                    metadata["original_type"] = "heading"
             
-            if is_list_item:
-                # Если это первый элемент нового списка
-                if current_list_id is None:
-                    list_id_counter += 1
-                    current_list_id = f"list_{list_id_counter}"
-                
-                # Помечаем блок как элемент списка
-                block.type = ContentType.LIST
-                block.metadata["list_id"] = current_list_id
-                block.metadata["list_type"] = list_type
-                block.metadata["original_type"] = "list_item"
+            # 2. Списки: последовательные блоки с маркерами - один список
+            if block.type in text_types:
+                list_type = self._list_type(text)
+                if list_type is not None:
+                    # Если это первый элемент нового списка
+                    if current_list_id is None:
+                        list_id_counter += 1
+                        current_list_id = f"list_{list_id_counter}"
+                    
+                    block.type = ContentType.LIST
+                    block.list_id = current_list_id
+                    block.list_type = list_type
+                    metadata["original_type"] = "list_item"
+                else:
+                    # Список закончился
+                    current_list_id = None
             else:
-                # Список закончился
                 current_list_id = None
-    
-    def _build_hierarchy(self, ir: IR):
-        """
-        Построение иерархии документа
-        
-        Определяет родительские и дочерние элементы для заголовков.
-        """
-        heading_stack = []  # Стек заголовков (level, block_id)
-        
-        for block in ir.blocks:
+            
+            # 3-4. Иерархия, оглавление, разделы
             if block.type == ContentType.HEADING:
-                level = block.metadata.get("heading_level", 1)
+                level = block.heading_level or 1
                 
                 # Находим родительский заголовок
-                parent_id = None
                 while heading_stack and heading_stack[-1][0] >= level:
                     heading_stack.pop()
-                
                 if heading_stack:
-                    parent_id = heading_stack[-1][1]
-                    block.metadata["parent_heading"] = parent_id
-                
-                # Добавляем в стек
+                    block.parent_heading = heading_stack[-1][1]
                 heading_stack.append((level, block.id))
-            
-            # Для всех блоков запоминаем текущий родительский заголовок
-            if heading_stack and block.type != ContentType.HEADING:
-                block.metadata["parent_heading"] = heading_stack[-1][1]
-    
-    def _build_toc(self, ir: IR) -> List[Dict[str, Any]]:
-        """
-        Построение оглавления (Table of Contents)
-        
-        Returns:
-            Список элементов TOC
-        """
-        toc = []
-        
-        for block in ir.blocks:
-            if block.type == ContentType.HEADING:
-                level = block.metadata.get("heading_level", 1)
-                text = block.content.strip()
                 
                 toc.append({
                     "level": level,
@@ -247,19 +193,131 @@ class StructureAnalyzer:
                     "block_id": block.id,
                     "page": block.page
                 })
+                
+                # Начинаем новую секцию
+                if current_section:
+                    sections.append(current_section)
+                current_section = {
+                    "heading": text,
+                    "heading_block_id": block.id,
+                    "level": level,
+                    "page": block.page,
+                    "blocks": []
+                }
+            else:
+                # Для всех блоков запоминаем текущий родительский заголовок
+                if heading_stack:
+                    block.parent_heading = heading_stack[-1][1]
+                if current_section:
+                    current_section["blocks"].append(block)
+        
+        # Добавляем последнюю секцию
+        if current_section:
+            sections.append(current_section)
+        
+        return toc, sections
+    
+    def _average_font_size(self, ir: IR) -> float:
+        """Средний размер шрифта текстовых блоков (12.0, если данных нет)"""
+        # Сумма и количество вместо списка размеров на весь документ
+        total = 0.0
+        count = 0
+        text_types = self._TEXT_TYPES
+        for block in ir.blocks:
+            if block.type in text_types:
+                font_size = block.metadata.get("font_size")
+                if font_size:
+                    total += font_size
+                    count += 1
         
-        return toc
+        return total / count if count else 12.0
+    
+    def _heading_level(self, block: IRBlock, text: str, avg_font_size: float,
+                       large_font_threshold: float) -> Optional[int]:
+        """
+        Уровень заголовка для блока (None - не заголовок)
+        
+        text - block.content без пробелов по краям (очищается вызывающим кодом).
+        
+        Эвристики:
+        - Паттерны нумерации ("1.", "1.1", etc.), текст заглавными буквами
+        - Размер шрифта (больше среднего → заголовок)
+        - Жирный шрифт + короткий текст
+        """
+        font_size = block.metadata.get("font_size", avg_font_size)
+        is_bold = block.metadata.get("is_bold", False)
+        
+        is_heading = False
+        heading_level = 1
+        
+        # Эвристика 1: Паттерны заголовков
+        numbered_level = self._numbered_level_of_prefix(text[:self.CLASSIFY_PREFIX_LEN])
+        if numbered_level is not None:
+            is_heading = True
+            heading_level = numbered_level
+        else:
+            for pattern, level in self.HEADING_PATTERNS:
+                if pattern.match(text):
+                    is_heading = True
+                    heading_level = level
+                    break
+        
+        # Эвристика 2: Большой шрифт
+        if font_size > large_font_threshold:
+            is_heading = True
+            # Уровень зависит от размера
+            if font_size > avg_font_size * 1.5:
+                heading_level = 1
+            elif font_size > avg_font_size * 1.3:
+                heading_level = 2
+            else:
+                heading_level = 3
+        
+        # Эвристика 3: Жирный + короткий текст
+        if is_bold and len(text) < 100:
+            is_heading = True
+            heading_level = min(heading_level, 2)  # Не выше H2
+        
+        return heading_level if is_heading else None
+    
+    def _list_type(self, text: str) -> Optional[str]:
+        """Тип списка по маркеру в начале текста (None - не элемент списка)"""
+        return self._list_type_of_prefix(text[:self.CLASSIFY_PREFIX_LEN])
+    
+    def _match_list_type(self, prefix: str) -> Optional[str]:
+        """Тип списка по паттернам (кэшируется в _list_type_of_prefix)"""
+        for pattern, list_type in self.LIST_PATTERNS:
+            if pattern.match(prefix):
+                return list_type
+        return None
+    
+    def _match_numbered_level(self, prefix: str) -> Optional[int]:
+        """
+        Уровень нумерованного заголовка (кэшируется в _numbered_level_of_prefix)
+        
+        Уровень - по сработавшим группам, одним сопоставлением.
+        """
+        numbered = self.NUMBERED_HEADING_PATTERN.match(prefix)
+        if numbered is None:
+            return None
+        return 3 if numbered.group(2) else 2 if numbered.group(1) else 1
     
     def get_sections(self, ir: IR) -> List[Dict[str, Any]]:
         """
         Получить список разделов документа
         
+        Для IR, только что обработанного analyze(), возвращаются разделы,
+        собранные тем же проходом.
+        
         Args:
             ir: Промежуточное представление
         
         Returns:
             Список разделов с блоками
         """
+        if self._sections_cache is not None and self._sections_cache[0]() is ir:
+            return list(self._sections_cache[1])
+        
         sections = []
         current_section = None
         
@@ -272,7 +330,7 @@ class StructureAnalyzer:
                 current_section = {
                     "heading": block.content.strip(),
                     "heading_block_id": block.id,
-                    "level": block.metadata.get("heading_level", 1),
+                    "level": block.heading_level or 1,
                     "page": block.page,
                     "blocks": []
                 }
@@ -300,7 +358,7 @@ class StructureAnalyzer:
         
         for block in ir.blocks:
             if block.type == ContentType.LIST:
-                list_id = block.metadata.get("list_id")
+                list_id = block.list_id
                 if list_id:
                     lists[list_id].append(block)
         
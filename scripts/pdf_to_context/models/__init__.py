@@ -17,6 +17,7 @@ from .data_models import (
     OCRMode,
     LayoutType,
     ContentType,
+    BlockSource,
 )
 
 __all__ = [
@@ -32,6 +33,7 @@ __all__ = [
     "OCRMode",
     "LayoutType",
     "ContentType",
+    "BlockSource",
 ]
 
 
@@ -10,11 +10,17 @@ Data Models для PDF to Context Extraction
 - Liskov Substitution: Все блоки наследуют общий интерфейс
 """
 
+import sys
 from dataclasses import dataclass, field
-from typing import Tuple, Optional, Dict, Any, List
+from typing import Tuple, Optional, Dict, Any, List, Union, Callable
 from enum import Enum
 
 
+# Блоков и bbox на документ - десятки тысяч: __slots__ вместо __dict__
+# уменьшает объект в 2-3 раза (dataclass(slots=True) - Python 3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
 # ============================================================================
 # Enums для типизации
 # ============================================================================
@@ -50,6 +56,17 @@ class OCRMode(str, Enum):
     GUNDAM = "Gundam"  # Dynamic tiles (для газет/постеров)
 
 
+class BlockSource(str, Enum):
+    """
+    Источник блока
+    
+    Члены - общие объекты-строки: сравнение с ними (в т.ч. с "ocr")
+    проходит по идентичности, а не побайтово.
+    """
+    NATIVE = "native"  # Извлечен из PDF (PyMuPDF, pdfplumber)
+    OCR = "ocr"        # Распознан DeepSeek-OCR
+
+
 class RouteDecision(str, Enum):
     """Решение о маршрутизации контента"""
     NATIVE = "native"    # Извлечь нативно
@@ -61,7 +78,7 @@ class RouteDecision(str, Enum):
 # Базовые модели
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class BBox:
     """
     Bounding Box - координаты элемента на странице
@@ -95,11 +112,13 @@ class BBox:
     
     def overlap_area(self, other: 'BBox') -> float:
         """Площадь пересечения с другим bbox"""
-        if not self.overlaps(other):
-            return 0.0
-        
+        # Пересечение по X считается сразу: без отдельного вызова overlaps()
         x_overlap = min(self.x1, other.x1) - max(self.x0, other.x0)
+        if x_overlap <= 0:
+            return 0.0
         y_overlap = min(self.y1, other.y1) - max(self.y0, other.y0)
+        if y_overlap <= 0:
+            return 0.0
         return x_overlap * y_overlap
 
 
@@ -107,7 +126,7 @@ class BBox:
 # Блоки контента (для native extraction)
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class TextBlock:
     """Текстовый блок (из native PDF)"""
     bbox: BBox
@@ -128,11 +147,11 @@ class TextBlock:
             self.type = ContentType.PARAGRAPH
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ImageBlock:
     """Растровое изображение (из PDF)"""
     bbox: BBox
-    image_data: bytes
+    image_data: Optional[bytes]  # None - байты не извлекались (только размеры)
     format: str  # 'png', 'jpeg', etc.
     page_num: int
     type: ContentType = ContentType.IMAGE
@@ -143,7 +162,7 @@ class ImageBlock:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class DrawingBlock:
     """Векторная графика (линии, фигуры, формулы)"""
     bbox: BBox
@@ -155,7 +174,7 @@ class DrawingBlock:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class TableBlock:
     """Таблица (из pdfplumber или OCR)"""
     bbox: BBox
@@ -165,7 +184,7 @@ class TableBlock:
     page_num: int
     type: ContentType = ContentType.TABLE
     data: Optional[List[List[str]]] = None  # Табличные данные
-    source: str = "native"  # "native" | "ocr"
+    source: BlockSource = BlockSource.NATIVE
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
@@ -173,7 +192,7 @@ class TableBlock:
 # OCR модели
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class OCRBlock:
     """Блок из OCR (DeepSeek-OCR результат)"""
     id: str
@@ -182,11 +201,11 @@ class OCRBlock:
     bbox: BBox
     page_num: int
     confidence: float  # 0.0 - 1.0
-    source: str = "ocr"
+    source: BlockSource = BlockSource.OCR
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class OCRResponse:
     """Ответ от DeepSeek-OCR микросервиса"""
     markdown: str
@@ -202,7 +221,7 @@ class OCRResponse:
 # Метаданные страницы
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class PageMetadata:
     """Метаданные страницы PDF"""
     page_num: int
@@ -222,13 +241,22 @@ class PageMetadata:
 # Вспомогательные модели
 # ============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class RouteDecisionInfo:
     """Информация о решении маршрутизации"""
     decision: RouteDecision
     ocr_mode: Optional[OCRMode] = None
-    reason: str = ""
+    # Строка или функция, строящая ее по требованию (форматирование
+    # обоснования не нужно, пока его никто не читает)
+    reason: Union[str, Callable[[], str]] = ""
     metadata: PageMetadata = None
+    
+    @property
+    def reason_str(self) -> str:
+        """Обоснование решения (строится при первом обращении)"""
+        if callable(self.reason):
+            self.reason = self.reason()
+        return self.reason
 
 
 
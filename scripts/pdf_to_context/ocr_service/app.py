@@ -7,23 +7,33 @@ FastAPI микросервис для DeepSeek-OCR
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
 import torch
 from transformers import AutoModel, AutoTokenizer
 import base64
 import io
-from PIL import Image
+from PIL import Image, ImageOps
 import os
 import uvicorn
 import tempfile
 import logging
+import sys
+
+try:
+    from .modes import DEEPSEEK_MODES, INFER_KEYS
+except ImportError:  # Запуск как скрипт: python app.py
+    from modes import DEEPSEEK_MODES, INFER_KEYS
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Настройки CUDA
-os.environ["CUDA_VISIBLE_DEVICES"] = '0'
+# Настройки CUDA: по умолчанию GPU 0, но уважаем значение, заданное вызывающим
+# (например, CUDA_VISIBLE_DEVICES=1 для запуска второго экземпляра сервиса на другой GPU)
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "0")
 
 app = FastAPI(title="DeepSeek-OCR Service", version="1.0.0")
 
@@ -32,6 +42,30 @@ model = None
 tokenizer = None
 model_loaded = False
 
+# Микро-батчинг: запросы, пришедшие в пределах BATCH_MAX_WAIT_MS, собираются
+# в пакет (до BATCH_MAX_SIZE), группируются по параметрам инференса и
+# выполняются в одном потоке GPU - в полете всегда один вызов модели,
+# а event loop не блокируется инференсом и продолжает принимать запросы
+BATCH_MAX_SIZE = int(os.environ.get("OCR_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("OCR_BATCH_MAX_WAIT_MS", "20"))
+
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_worker: Optional[asyncio.Task] = None
+_gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-gpu")
+
+# Изображения, декодированные в памяти: ключ, переданный в model.infer как
+# image_file → PIL Image (см. _install_image_loader). Доступ только из потока GPU
+_preloaded_images: Dict[str, Image.Image] = {}
+_memory_images = False  # load_image модели подменен - временные файлы не нужны
+_output_dir: Optional[str] = None  # output_path для model.infer (один на процесс)
+
+# torch.compile (экспериментально, по умолчанию выключен): компиляция со
+# статическими формами и CUDA graphs. Без crop_mode форма входа определяется
+# base_size; в crop_mode число тайлов зависит от пропорций изображения, и
+# каждая новая раскладка тайлов компилируется при первом запросе.
+# Прогрев при старте - режимы MODE_SIZES (crop - на одной раскладке)
+TORCH_COMPILE = os.environ.get("OCR_TORCH_COMPILE", "0") == "1"
+
 
 class BBox(BaseModel):
     x0: float
@@ -55,6 +89,11 @@ class OCRResponse(BaseModel):
     raw_output: str
 
 
+class OCRBatchResponse(BaseModel):
+    results: List[Optional[OCRResponse]]
+    errors: List[Optional[str]]
+
+
 def load_model():
     """Загрузка модели DeepSeek-OCR"""
     global model, tokenizer, model_loaded
@@ -82,17 +121,26 @@ def load_model():
             attn_impl = 'eager'
             logger.warning("   ⚠️ flash-attn не установлен, используем eager attention (медленнее)")
         
-        model = AutoModel.from_pretrained(
-            model_name,
-            _attn_implementation=attn_impl,
-            torch_dtype=torch.bfloat16,  # Указываем dtype сразу
-            device_map="cuda",  # Загружаем сразу на GPU
-            trust_remote_code=True,
-            use_safetensors=True,
-            low_cpu_mem_usage=True  # Оптимизация памяти
-        )
+        try:
+            model = _load_model_dispatched(model_name, attn_impl)
+        except Exception as e:
+            logger.warning(f"   ⚠️ Загрузка через accelerate не удалась ({e}), используем from_pretrained")
+            model = AutoModel.from_pretrained(
+                model_name,
+                _attn_implementation=attn_impl,
+                torch_dtype=torch.bfloat16,  # Указываем dtype сразу
+                device_map="cuda",  # Загружаем сразу на GPU
+                trust_remote_code=True,
+                use_safetensors=True,
+                low_cpu_mem_usage=True  # Оптимизация памяти
+            )
         model = model.eval()  # Только eval, уже на GPU и в bfloat16
         
+        _install_image_loader()
+        
+        if TORCH_COMPILE:
+            _compile_model()
+        
         model_loaded = True
         logger.info("✅ DeepSeek-OCR успешно загружен!")
         
@@ -101,10 +149,162 @@ def load_model():
         raise
 
 
+def _load_model_dispatched(model_name: str, attn_impl: str):
+    """
+    Загрузка модели без промежуточной копии весов в RAM
+    
+    Модель создается на meta-устройстве (init_empty_weights - параметры без
+    памяти и без инициализации), затем shard'ы safetensors по одному
+    загружаются сразу на GPU (load_checkpoint_and_dispatch). Пиковая память
+    хоста при старте - около одного shard'а вместо всей модели.
+    
+    Raises:
+        ImportError: accelerate / huggingface_hub не установлены
+    """
+    from accelerate import init_empty_weights, load_checkpoint_and_dispatch
+    from huggingface_hub import snapshot_download
+    from transformers import AutoConfig
+    
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
+    config._attn_implementation = attn_impl
+    
+    with init_empty_weights():
+        empty_model = AutoModel.from_config(config, trust_remote_code=True)
+    empty_model.tie_weights()
+    
+    # Только веса и конфиги (код модели уже загружен AutoConfig)
+    checkpoint_dir = snapshot_download(model_name, allow_patterns=["*.safetensors", "*.json"])
+    
+    logger.info("   Загрузка весов на GPU по shard'ам (accelerate)...")
+    return load_checkpoint_and_dispatch(
+        empty_model,
+        checkpoint=checkpoint_dir,
+        device_map={"": 0},  # Вся модель на видимую GPU 0 (см. CUDA_VISIBLE_DEVICES)
+        dtype=torch.bfloat16,
+        no_split_module_classes=["DeepseekOCRBlock"]
+    )
+
+
+def _install_image_loader():
+    """
+    Подмена load_image в модуле модели на чтение из _preloaded_images
+    
+    model.infer принимает только путь (image_file) и открывает его через
+    load_image своего модуля (trust_remote_code). Подмена позволяет передать
+    изображение, уже декодированное из байтов запроса: без записи на диск и
+    повторного декодирования. Неизвестный ключ уходит в исходный load_image.
+    """
+    global _memory_images
+    
+    module = sys.modules.get(type(model).__module__)
+    original = getattr(module, "load_image", None)
+    if original is None:
+        logger.warning("   ⚠️ load_image модели не найден, изображения передаются через временные файлы")
+        return
+    
+    def load_image(image_path):
+        image = _preloaded_images.get(image_path)
+        return image if image is not None else original(image_path)
+    
+    module.load_image = load_image
+    _memory_images = True
+
+
+def _decode_image(image_data: bytes) -> Image.Image:
+    """Декодирование байтов изображения (как load_image модели: с учетом EXIF)"""
+    image = Image.open(io.BytesIO(image_data))
+    image = ImageOps.exif_transpose(image)
+    image.load()
+    return image
+
+
+def _compile_model():
+    """
+    torch.compile горячих подмодулей и прогрев
+    
+    Vision-энкодеры (SAM + CLIP) получают вход формы, заданной режимом
+    (и раскладкой тайлов в crop_mode) - mode="reduce-overhead" (CUDA graphs),
+    dynamic=False. Языковая модель
+    компилируется только со статическим KV-кэшем (cache_implementation="static"):
+    CUDA graph не захватывает растущий динамический кэш. model.infer не
+    принимает past_key_values, поэтому статический кэш включается через
+    generation_config - generate создает StaticCache сам.
+    
+    Если компиляция или прогрев не удались - исходные модули возвращаются
+    на место, сервис работает в eager режиме.
+    """
+    if not hasattr(torch, "compile"):
+        logger.warning("   ⚠️ torch.compile недоступен (torch < 2.0), eager режим")
+        return
+    
+    inner = getattr(model, "model", model)
+    originals = []  # (объект, атрибут, исходное значение) для отката
+    
+    for name in ("sam_model", "vision_model"):
+        module = getattr(inner, name, None)
+        if module is not None:
+            originals.append((inner, name, module))
+            setattr(inner, name, torch.compile(module, mode="reduce-overhead", fullgraph=False, dynamic=False))
+    
+    if getattr(model, "_supports_static_cache", False):
+        originals.append((model.generation_config, "cache_implementation", model.generation_config.cache_implementation))
+        originals.append((model, "forward", model.forward))
+        model.generation_config.cache_implementation = "static"
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", dynamic=False)
+    else:
+        logger.warning("   ⚠️ Модель не поддерживает статический KV-кэш, языковая модель остается eager")
+    
+    if not originals:
+        return
+    
+    logger.info(f"   Компиляция и прогрев ({', '.join(MODE_SIZES)})...")
+    try:
+        # В потоке GPU: CUDA graphs reduce-overhead привязаны к потоку,
+        # прогрев в потоке старта не переиспользовался бы запросами
+        _gpu_executor.submit(_warmup).result()
+    except Exception as e:
+        logger.warning(f"   ⚠️ torch.compile не удался ({e}), eager режим")
+        for obj, attr, value in reversed(originals):
+            setattr(obj, attr, value)
+        return
+    
+    logger.info("   ✅ torch.compile: прогрев завершен")
+
+
+def _warmup():
+    """Прогревочный инференс для каждого режима MODE_SIZES (поток GPU)"""
+    with torch.inference_mode():
+        for sizes in MODE_SIZES.values():
+            base_size = sizes["base_size"]
+            # crop_mode: изображение 2:1 - в прогреве участвуют тайлы
+            width = base_size * 2 if sizes["crop_mode"] else base_size
+            _run_ocr(_warmup_image(width, base_size), "<image>\nFree OCR.", **sizes)
+
+
+def _warmup_image(width: int, height: int) -> bytes:
+    """Белое PNG width x height для прогрева"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Загрузка модели при старте сервиса"""
+    """Загрузка модели и запуск обработчика пакетов при старте сервиса"""
+    global _batch_queue
     load_model()
+    
+    _batch_queue = asyncio.Queue()
+    _start_batch_worker()
+    logger.info(f"✅ Микро-батчинг: до {BATCH_MAX_SIZE} запросов, окно {BATCH_MAX_WAIT_MS:.0f} мс")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка обработчика пакетов"""
+    if _batch_worker is not None:
+        _batch_worker.cancel()
+    _gpu_executor.shutdown(wait=False)
 
 
 @app.get("/")
@@ -132,6 +332,363 @@ async def health_check():
     }
 
 
+def _resolve_prompt(prompt_type: str, custom_prompt: Optional[str]) -> str:
+    """Промпт для модели: custom_prompt или по типу"""
+    if custom_prompt:
+        logger.info(f"   Используется custom_prompt")
+        return custom_prompt
+    
+    from .prompts import OCRPrompts
+    logger.info(f"   Используется prompt_type: {prompt_type}")
+    return OCRPrompts.get_prompt_by_type(prompt_type)
+
+
+def _run_ocr(
+    image_data: bytes,
+    prompt: str,
+    base_size: int,
+    image_size: int,
+    crop_mode: bool
+) -> OCRResponse:
+    """
+    Распознавание одного изображения через DeepSeek-OCR
+    
+    Общая часть для /ocr/figure и /ocr/figure_batch.
+    
+    Args:
+        image_data: Байты изображения (PNG/JPEG)
+        prompt: Промпт для модели
+        base_size: Базовый размер для обработки
+        image_size: Размер изображения
+        crop_mode: Режим обрезки
+    
+    Returns:
+        OCRResponse с распознанными блоками и markdown
+    """
+    global _output_dir
+    
+    if _memory_images:
+        # Декодируем один раз; model.infer получает ключ вместо пути к файлу
+        image_key = f"memory://{id(image_data)}"
+        _preloaded_images[image_key] = _decode_image(image_data)
+        temp_path = None
+    else:
+        # Модель требует путь к файлу
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
+            tmp_file.write(image_data)
+            image_key = temp_path = tmp_file.name
+    
+    if _output_dir is None:
+        # save_results=False - infer только создает папку, ничего не пишет
+        _output_dir = tempfile.mkdtemp(prefix="deepseek_ocr_")
+    
+    try:
+        # Обработка через DeepSeek-OCR
+        logger.info(f"📄 Обработка изображения ({len(image_data)} байт)")
+        logger.info(f"🔍 Prompt: {prompt[:100]}...")
+        
+        # КРИТИЧНО: Захватываем stdout, т.к. model.infer() печатает результат туда
+        from io import StringIO
+        
+        old_stdout = sys.stdout
+        sys.stdout = captured_output = StringIO()
+        
+        try:
+            res = model.infer(
+                tokenizer,
+                prompt=prompt,
+                image_file=image_key,
+                output_path=_output_dir,
+                base_size=base_size,
+                image_size=image_size,
+                crop_mode=crop_mode,
+                save_results=False,  # Не сохраняем файлы
+                test_compress=False
+            )
+        finally:
+            sys.stdout = old_stdout
+            captured_stdout = captured_output.getvalue()
+        
+        logger.info(f"🔍 Тип результата: {type(res)}")
+        logger.info(f"🔍 Результат (первые 500 символов): {str(res)[:500]}")
+        
+        # ВАЖНО: model.infer() печатает результат в stdout, а не возвращает!
+        raw_output = ""
+        if captured_stdout and len(captured_stdout) > 100:
+            logger.info("✅ Используем captured stdout как результат")
+            raw_output = captured_stdout
+        elif res is not None and str(res) != "None":
+            logger.info("✅ Используем return value как результат")
+            raw_output = res if isinstance(res, str) else str(res)
+        elif captured_stdout:
+            logger.info("⚠️ Return пустой, используем stdout (даже если короткий)")
+            raw_output = captured_stdout
+        else:
+            logger.warning("⚠️ И return и stdout пусты!")
+            raw_output = ""
+        
+        logger.info(f"🔍 raw_output (первые 500 символов):\n{'='*21}\n{raw_output[:500]}\n{'='*21}")
+        
+        # Извлекаем markdown (упрощенный парсинг)
+        markdown_text = ""
+        blocks = []
+        
+        # Парсим вывод модели
+        lines = raw_output.split('\n')
+        current_block = None
+        block_counter = 0
+        i = 0
+        
+        while i < len(lines):
+            line = lines[i]
+            
+            # Детектируем ref и det теги (для ocr_simple)
+            if '<|ref|>' in line:
+                # Сохраняем предыдущий блок
+                if current_block and current_block['content'].strip():
+                    blocks.append(current_block)
+                
+                # Извлекаем текст элемента из <|ref|>...<|/ref|>
+                ref_text = line.split('<|ref|>')[1].split('<|/ref|>')[0]
+                
+                # Извлекаем bbox если есть
+                bbox_data = [0, 0, 100, 100]  # default
+                if '<|det|>' in line:
+                    det_str = line.split('<|det|>')[1].split('<|/det|>')[0]
+                    try:
+                        import ast
+                        bbox_list = ast.literal_eval(det_str)
+                        if bbox_list and len(bbox_list) > 0:
+                            bbox_data = bbox_list[0]
+                    except:
+                        pass
+                
+                current_block = {
+                    'id': f'ocr_block_{block_counter}',
+                    'type': 'text',  # Для ocr_simple всегда text
+                    'content': ref_text,  # ИСПРАВЛЕНО: Текст элемента из <|ref|>
+                    'bbox': {
+                        'x0': float(bbox_data[0]),
+                        'y0': float(bbox_data[1]),
+                        'x1': float(bbox_data[2]),
+                        'y1': float(bbox_data[3])
+                    },
+                    'confidence': 1.0,
+                    'metadata': {}
+                }
+                block_counter += 1
+                markdown_text += ref_text + '\n'
+                
+                # Добавляем блок сразу (каждый элемент - отдельный блок)
+                blocks.append(current_block)
+                current_block = None
+            
+            elif current_block and not line.startswith('<|') and not line.startswith('===') and line.strip():
+                # Добавляем контент к текущему блоку (текст на следующих строках)
+                if current_block['content']:
+                    current_block['content'] += '\n'
+                current_block['content'] += line.strip()
+                markdown_text += line.strip() + '\n'
+            
+            i += 1
+        
+        # Добавляем последний блок
+        if current_block and current_block['content'].strip():
+            blocks.append(current_block)
+        
+        # Если нет структурированных блоков, но есть raw_output,
+        # создаем один блок с описанием (для parse_figure, describe)
+        if not blocks and raw_output.strip():
+            # Фильтруем служебные сообщения (BASE:, NO PATCHES, ===)
+            clean_lines = []
+            for line in raw_output.split('\n'):
+                line_stripped = line.strip()
+                if (line_stripped and 
+                    not line_stripped.startswith('===') and 
+                    not line_stripped.startswith('BASE:') and 
+                    not line_stripped.startswith('NO PATCHES')):
+                    clean_lines.append(line_stripped)
+            
+            description = '\n'.join(clean_lines).strip()
+            
+            if description:
+                blocks.append({
+                    'id': 'ocr_block_description',
+                    'type': 'text',
+                    'content': description,
+                    'bbox': {'x0': 0, 'y0': 0, 'x1': 100, 'y1': 100},
+                    'confidence': 0.8
+                })
+                markdown_text = description
+        
+        logger.info(f"✅ Распознано {len(blocks)} блоков")
+        
+        return OCRResponse(
+            blocks=[OCRBlock(**block) for block in blocks],
+            markdown=markdown_text.strip(),
+            raw_output=raw_output
+        )
+
+    finally:
+        _preloaded_images.pop(image_key, None)
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@dataclass
+class _OCRJob:
+    """Запрос в очереди микро-батчинга"""
+    future: asyncio.Future
+    image_data: bytes
+    prompt: str
+    base_size: int
+    image_size: int
+    crop_mode: bool
+    
+    @property
+    def group_key(self) -> Tuple[str, int, int, bool]:
+        """Ключ группы: одинаковые параметры инференса (форма тензоров совпадает, кроме тайлов crop_mode)"""
+        return (self.prompt, self.base_size, self.image_size, self.crop_mode)
+
+
+async def _submit_ocr(
+    image_data: bytes,
+    prompt: str,
+    base_size: int,
+    image_size: int,
+    crop_mode: bool
+) -> OCRResponse:
+    """
+    Поставить изображение в очередь микро-батчинга и дождаться результата
+    
+    Raises:
+        RuntimeError: Обработчик пакетов не запущен (сервис останавливается)
+        Исключение _run_ocr для этого изображения
+    """
+    if _batch_worker is None or _batch_worker.done():
+        raise RuntimeError("OCR batch worker is not running")
+    
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put(_OCRJob(future, image_data, prompt, base_size, image_size, crop_mode))
+    return await future
+
+
+def _start_batch_worker():
+    """Запустить обработчик пакетов (под надзором _on_batch_worker_done)"""
+    global _batch_worker
+    _batch_worker = asyncio.create_task(_batch_worker_loop())
+    _batch_worker.add_done_callback(_on_batch_worker_done)
+
+
+def _on_batch_worker_done(task: asyncio.Task):
+    """
+    Надзор за обработчиком пакетов
+    
+    Упал с исключением - логируем и перезапускаем (очередь продолжает
+    обрабатываться). Отменен (остановка сервиса) - запросы в очереди
+    завершаются ошибкой, а не ждут вечно.
+    """
+    if task.cancelled():
+        _fail_queued_jobs(RuntimeError("OCR service is shutting down"))
+        return
+    
+    error = task.exception()
+    logger.error(f"❌ Обработчик пакетов упал: {error!r}, перезапуск")
+    _start_batch_worker()
+
+
+def _fail_queued_jobs(error: Exception):
+    """Завершить ошибкой все запросы, оставшиеся в очереди"""
+    while True:
+        try:
+            job = _batch_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+async def _batch_worker_loop():
+    """
+    Фоновая задача: собирает пакеты из очереди и выполняет их в потоке GPU
+    
+    Пакет - первый запрос плюс все, что пришло за BATCH_MAX_WAIT_MS
+    (не больше BATCH_MAX_SIZE). Группы с одинаковыми параметрами инференса
+    выполняются одним вызовом _run_ocr_group.
+    """
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        jobs = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_MAX_WAIT_MS / 1000
+        while len(jobs) < BATCH_MAX_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            await _run_batch(jobs)
+        finally:
+            # Исключение (или отмена) посреди пакета - запросы не должны зависнуть
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("OCR batch aborted"))
+
+
+async def _run_batch(jobs: List[_OCRJob]):
+    """Выполнить пакет: группы с одинаковыми параметрами - в потоке GPU"""
+    loop = asyncio.get_running_loop()
+    
+    groups: Dict[Tuple[str, int, int, bool], List[_OCRJob]] = {}
+    for job in jobs:
+        groups.setdefault(job.group_key, []).append(job)
+    
+    for group in groups.values():
+        try:
+            outcomes = await loop.run_in_executor(_gpu_executor, _run_ocr_group, group)
+        except Exception as e:
+            outcomes = [(None, e)] * len(group)
+        
+        for job, (result, error) in zip(group, outcomes):
+            if job.future.done():
+                continue  # Клиент отключился - запрос отменен
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+    
+    if len(jobs) > 1:
+        logger.info(f"📦 Пакет: {len(jobs)} запросов, групп: {len(groups)}")
+
+
+def _run_ocr_group(jobs: List[_OCRJob]) -> List[Tuple[Optional[OCRResponse], Optional[Exception]]]:
+    """
+    Выполнить группу запросов с одинаковыми параметрами (поток GPU)
+    
+    model.infer DeepSeek-OCR принимает одно изображение, поэтому группа
+    выполняется подряд под одним inference_mode: без переключений между
+    режимами (base_size / image_size / crop_mode) и без конкуренции за GPU.
+    
+    Returns:
+        (результат, None) или (None, исключение) для каждого запроса
+    """
+    outcomes: List[Tuple[Optional[OCRResponse], Optional[Exception]]] = []
+    with torch.inference_mode():
+        for job in jobs:
+            try:
+                outcomes.append((
+                    _run_ocr(job.image_data, job.prompt, job.base_size, job.image_size, job.crop_mode),
+                    None
+                ))
+            except Exception as e:
+                outcomes.append((None, e))
+    return outcomes
+
+
 @app.post("/ocr/figure", response_model=OCRResponse)
 async def ocr_figure(
     file: UploadFile = File(...),
@@ -161,182 +718,115 @@ async def ocr_figure(
     try:
         # Читаем изображение
         image_data = await file.read()
+        prompt = _resolve_prompt(prompt_type, custom_prompt)
+        return await _submit_ocr(image_data, prompt, base_size, image_size, crop_mode)
+    
+    except Exception as e:
+        logger.error(f"❌ Ошибка OCR: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Режимы DeepSeek-OCR → параметры infer (из общей таблицы modes.DEEPSEEK_MODES)
+MODE_SIZES = {
+    mode: {key: config[key] for key in INFER_KEYS}
+    for mode, config in DEEPSEEK_MODES.items()
+}
+
+
+@app.post("/ocr/page", response_model=OCRResponse)
+async def ocr_page(
+    file: UploadFile = File(...),
+    mode: str = Form("Base"),
+    prompt: str = Form(None),
+    page_id: int = Form(0)
+):
+    """
+    OCR всей страницы
+    
+    Args:
+        file: Отрендеренная страница (PNG/JPEG), передается как есть без base64
+        mode: Режим DeepSeek-OCR (Tiny/Small/Base/Large/Gundam)
+        prompt: Кастомный промпт (по умолчанию - конвертация документа в markdown)
+        page_id: Номер страницы (для логирования)
+    
+    Returns:
+        OCRResponse с распознанными блоками и markdown
+    """
+    if not model_loaded:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    sizes = MODE_SIZES.get(mode)
+    if sizes is None:
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    
+    try:
+        image_data = await file.read()
         
-        # Сохраняем во временный файл (модель требует путь к файлу)
-        # DeepSeek-OCR имеет собственный internal parser, не нужна проверка PIL
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-            tmp_file.write(image_data)
-            temp_path = tmp_file.name
-        
-        try:
-            # Создаем временную папку для результатов
-            with tempfile.TemporaryDirectory() as tmp_output:
-                # Получаем промпт
-                if custom_prompt:
-                    prompt = custom_prompt
-                    logger.info(f"   Используется custom_prompt")
-                else:
-                    from .prompts import OCRPrompts
-                    prompt = OCRPrompts.get_prompt_by_type(prompt_type)
-                    logger.info(f"   Используется prompt_type: {prompt_type}")
-                
-                # Обработка через DeepSeek-OCR
-                logger.info(f"📄 Обработка изображения ({len(image_data)} байт)")
-                logger.info(f"🔍 Prompt: {prompt[:100]}...")
-                
-                # КРИТИЧНО: Захватываем stdout, т.к. model.infer() печатает результат туда
-                import sys
-                from io import StringIO
-                
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = StringIO()
-                
-                try:
-                    res = model.infer(
-                        tokenizer,
-                        prompt=prompt,
-                        image_file=temp_path,
-                        output_path=tmp_output,
-                        base_size=base_size,
-                        image_size=image_size,
-                        crop_mode=crop_mode,
-                        save_results=False,  # Не сохраняем файлы
-                        test_compress=False
-                    )
-                finally:
-                    sys.stdout = old_stdout
-                    captured_stdout = captured_output.getvalue()
-                
-                logger.info(f"🔍 Тип результата: {type(res)}")
-                logger.info(f"🔍 Результат (первые 500 символов): {str(res)[:500]}")
-                
-                # ВАЖНО: model.infer() печатает результат в stdout, а не возвращает!
-                raw_output = ""
-                if captured_stdout and len(captured_stdout) > 100:
-                    logger.info("✅ Используем captured stdout как результат")
-                    raw_output = captured_stdout
-                elif res is not None and str(res) != "None":
-                    logger.info("✅ Используем return value как результат")
-                    raw_output = res if isinstance(res, str) else str(res)
-                elif captured_stdout:
-                    logger.info("⚠️ Return пустой, используем stdout (даже если короткий)")
-                    raw_output = captured_stdout
-                else:
-                    logger.warning("⚠️ И return и stdout пусты!")
-                    raw_output = ""
-                
-                logger.info(f"🔍 raw_output (первые 500 символов):\n{'='*21}\n{raw_output[:500]}\n{'='*21}")
-                
-                # Извлекаем markdown (упрощенный парсинг)
-                markdown_text = ""
-                blocks = []
-                
-                # Парсим вывод модели
-                lines = raw_output.split('\n')
-                current_block = None
-                block_counter = 0
-                i = 0
-                
-                while i < len(lines):
-                    line = lines[i]
-                    
-                    # Детектируем ref и det теги (для ocr_simple)
-                    if '<|ref|>' in line:
-                        # Сохраняем предыдущий блок
-                        if current_block and current_block['content'].strip():
-                            blocks.append(current_block)
-                        
-                        # Извлекаем текст элемента из <|ref|>...<|/ref|>
-                        ref_text = line.split('<|ref|>')[1].split('<|/ref|>')[0]
-                        
-                        # Извлекаем bbox если есть
-                        bbox_data = [0, 0, 100, 100]  # default
-                        if '<|det|>' in line:
-                            det_str = line.split('<|det|>')[1].split('<|/det|>')[0]
-                            try:
-                                import ast
-                                bbox_list = ast.literal_eval(det_str)
-                                if bbox_list and len(bbox_list) > 0:
-                                    bbox_data = bbox_list[0]
-                            except:
-                                pass
-                        
-                        current_block = {
-                            'id': f'ocr_block_{block_counter}',
-                            'type': 'text',  # Для ocr_simple всегда text
-                            'content': ref_text,  # ИСПРАВЛЕНО: Текст элемента из <|ref|>
-                            'bbox': {
-                                'x0': float(bbox_data[0]),
-                                'y0': float(bbox_data[1]),
-                                'x1': float(bbox_data[2]),
-                                'y1': float(bbox_data[3])
-                            },
-                            'confidence': 1.0,
-                            'metadata': {}
-                        }
-                        block_counter += 1
-                        markdown_text += ref_text + '\n'
-                        
-                        # Добавляем блок сразу (каждый элемент - отдельный блок)
-                        blocks.append(current_block)
-                        current_block = None
-                    
-                    elif current_block and not line.startswith('<|') and not line.startswith('===') and line.strip():
-                        # Добавляем контент к текущему блоку (текст на следующих строках)
-                        if current_block['content']:
-                            current_block['content'] += '\n'
-                        current_block['content'] += line.strip()
-                        markdown_text += line.strip() + '\n'
-                    
-                    i += 1
-                
-                # Добавляем последний блок
-                if current_block and current_block['content'].strip():
-                    blocks.append(current_block)
-                
-                # Если нет структурированных блоков, но есть raw_output,
-                # создаем один блок с описанием (для parse_figure, describe)
-                if not blocks and raw_output.strip():
-                    # Фильтруем служебные сообщения (BASE:, NO PATCHES, ===)
-                    clean_lines = []
-                    for line in raw_output.split('\n'):
-                        line_stripped = line.strip()
-                        if (line_stripped and 
-                            not line_stripped.startswith('===') and 
-                            not line_stripped.startswith('BASE:') and 
-                            not line_stripped.startswith('NO PATCHES')):
-                            clean_lines.append(line_stripped)
-                    
-                    description = '\n'.join(clean_lines).strip()
-                    
-                    if description:
-                        blocks.append({
-                            'id': 'ocr_block_description',
-                            'type': 'text',
-                            'content': description,
-                            'bbox': {'x0': 0, 'y0': 0, 'x1': 100, 'y1': 100},
-                            'confidence': 0.8
-                        })
-                        markdown_text = description
-                
-                logger.info(f"✅ Распознано {len(blocks)} блоков")
-                
-                return OCRResponse(
-                    blocks=[OCRBlock(**block) for block in blocks],
-                    markdown=markdown_text.strip(),
-                    raw_output=raw_output
-                )
+        if prompt:
+            # Модель ожидает токен изображения в начале промпта
+            if not prompt.startswith("<image>"):
+                prompt = f"<image>\n{prompt}"
+        else:
+            prompt = _resolve_prompt("default", None)
         
-        finally:
-            # Удаляем временный файл
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        logger.info(f"📄 Страница {page_id}, режим {mode}")
+        return await _submit_ocr(image_data, prompt, **sizes)
     
     except Exception as e:
         logger.error(f"❌ Ошибка OCR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/ocr/figure_batch", response_model=OCRBatchResponse)
+async def ocr_figure_batch(
+    files: List[UploadFile] = File(...),
+    prompt_type: str = Form("default"),
+    custom_prompt: str = Form(None),
+    base_size: int = Form(1024),
+    image_size: int = Form(1024),
+    crop_mode: bool = Form(False)
+):
+    """
+    Пакетная обработка изображений (один HTTP запрос на K изображений)
+    
+    Экономит HTTP round-trip'ы, но не дает батчевого инференса: изображения
+    распознаются по одному в потоке GPU (_gpu_executor), event loop и
+    остальные запросы (/health) при этом не блокируются.
+    
+    Параметры те же, что у /ocr/figure, и применяются ко всем файлам.
+    Ошибка одного изображения не прерывает пакет: для него в results
+    возвращается null, а текст ошибки - в errors по тому же индексу.
+    
+    Returns:
+        OCRBatchResponse с результатами в порядке files
+    """
+    if not model_loaded:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    prompt = _resolve_prompt(prompt_type, custom_prompt)
+    results: List[Optional[OCRResponse]] = []
+    errors: List[Optional[str]] = []
+    
+    async def process(file: UploadFile) -> OCRResponse:
+        image_data = await file.read()
+        return await _submit_ocr(image_data, prompt, base_size, image_size, crop_mode)
+    
+    # Все изображения пакета сразу в очередь - попадают в одни группы
+    outcomes = await asyncio.gather(*(process(file) for file in files), return_exceptions=True)
+    
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"❌ Ошибка OCR ({file.filename}): {outcome}")
+            results.append(None)
+            errors.append(str(outcome))
+        else:
+            results.append(outcome)
+            errors.append(None)
+    
+    logger.info(f"✅ Пакет: {len(files)} изображений, ошибок: {sum(1 for e in errors if e)}")
+    return OCRBatchResponse(results=results, errors=errors)
+
+
 if __name__ == "__main__":
     # Запуск сервиса
     uvicorn.run(
@@ -6,12 +6,19 @@ DeepSeek-OCR Wrapper для интеграции с микросервисом
 """
 
 import sys
+import math
+from collections import deque
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Deque, Dict, Any, List, Optional
 import base64
 import io
 from PIL import Image
 
+try:
+    from .modes import DEEPSEEK_MODES
+except ImportError:  # Модуль загружен не как часть пакета
+    from modes import DEEPSEEK_MODES
+
 # Добавляем путь к DeepSeek-OCR
 DEEPSEEK_DIR = Path(__file__).parent.parent.parent / "DeepSeek-OCR" / "DeepSeek-OCR-master" / "DeepSeek-OCR-vllm"
 sys.path.insert(0, str(DEEPSEEK_DIR))
@@ -26,6 +33,29 @@ except ImportError as e:
     print(f"⚠️  DeepSeek-OCR не доступен: {e}")
 
 
+# Кэш движков vLLM: загрузка занимает 1-2 минуты и всю память GPU,
+# поэтому экземпляры wrapper'а с одинаковыми параметрами делят один движок
+_ENGINES: Dict[tuple, Any] = {}
+
+
+def get_or_create_engine(**engine_kwargs) -> Any:
+    """
+    Получить движок vLLM из кэша или создать новый
+    
+    Args:
+        **engine_kwargs: Аргументы конструктора vLLM LLM
+    
+    Returns:
+        Экземпляр LLM (общий для одинаковых аргументов)
+    """
+    key = tuple(sorted(engine_kwargs.items()))
+    engine = _ENGINES.get(key)
+    if engine is None:
+        engine = LLM(**engine_kwargs)
+        _ENGINES[key] = engine
+    return engine
+
+
 class DeepSeekOCRWrapper:
     """
     Обертка для DeepSeek-OCR
@@ -34,14 +64,11 @@ class DeepSeekOCRWrapper:
     и форматирует результаты для API.
     """
     
-    # Конфигурация режимов
-    MODES = {
-        "Tiny": {"base_size": 512, "image_size": 512, "vision_tokens": 64},
-        "Small": {"base_size": 640, "image_size": 640, "vision_tokens": 100},
-        "Base": {"base_size": 1024, "image_size": 1024, "vision_tokens": 256},
-        "Large": {"base_size": 1280, "image_size": 1280, "vision_tokens": 400},
-        "Gundam": {"base_size": 1024, "image_size": 640, "vision_tokens": None}  # Dynamic
-    }
+    # Конфигурация режимов (общая с app.py)
+    MODES = DEEPSEEK_MODES
+    
+    # Сколько последних длин ответов хранить для suggest_limits()
+    OUTPUT_LENGTHS_WINDOW = 1000
     
     # Промпты для разных задач
     PROMPTS = {
@@ -52,14 +79,27 @@ class DeepSeekOCRWrapper:
         "describe": '<image>\nDescribe this image in detail.',
     }
     
-    def __init__(self, model_path: str = "deepseek-ai/DeepSeek-OCR"):
+    def __init__(self,
+                 model_path: str = "deepseek-ai/DeepSeek-OCR",
+                 max_model_len: int = 4096,
+                 max_tokens: int = 2048):
         """
         Инициализация DeepSeek-OCR
         
         Args:
             model_path: Путь к модели (HuggingFace или локальный)
+            max_model_len: Максимальная длина контекста vLLM (определяет резерв KV-cache)
+            max_tokens: Лимит генерируемых токенов на страницу
+        
+        Note:
+            Завышенные лимиты резервируют KV-cache, который мог бы вместить больше
+            параллельных запросов. Подберите значения по suggest_limits() на своем корпусе.
         """
         self.model_path = model_path
+        self.max_model_len = max_model_len
+        self.max_tokens = max_tokens
+        # Длины последних ответов для профилирования (окно - не растет у долгоживущего wrapper'а)
+        self._output_lengths: Deque[int] = deque(maxlen=self.OUTPUT_LENGTHS_WINDOW)
         self.llm = None
         self.available = DEEPSEEK_AVAILABLE
         
@@ -74,11 +114,11 @@ class DeepSeekOCRWrapper:
             print(f"🔄 Загрузка DeepSeek-OCR: {self.model_path}")
             
             # Параметры vLLM для DeepSeek-OCR
-            self.llm = LLM(
+            self.llm = get_or_create_engine(
                 model=self.model_path,
                 trust_remote_code=True,  # Обязательно для DeepSeek-OCR
                 gpu_memory_utilization=0.9,
-                max_model_len=4096,
+                max_model_len=self.max_model_len,
                 dtype="bfloat16",  # Оптимально для OCR
                 disable_log_stats=False,
             )
@@ -129,7 +169,7 @@ class DeepSeekOCRWrapper:
             # Настройка sampling с NGram logits processor для стабильности
             sampling_params = SamplingParams(
                 temperature=0.0,  # Детерминированный вывод для OCR
-                max_tokens=2048,
+                max_tokens=self.max_tokens,
                 top_p=1.0,
                 # NGramPerReqLogitsProcessor добавляется через vLLM
                 logits_processors=[
@@ -154,6 +194,8 @@ class DeepSeekOCRWrapper:
             generated_text = outputs[0].outputs[0].text
             token_ids = outputs[0].outputs[0].token_ids
             
+            self._output_lengths.append(len(token_ids))
+            
             # Парсинг Markdown в блоки
             blocks = self._parse_markdown(generated_text)
             
@@ -174,6 +216,36 @@ class DeepSeekOCRWrapper:
             # Fallback на stub
             return self._stub_response(image_bytes, mode)
     
+    def suggest_limits(self, percentile: float = 0.99, headroom: float = 1.1) -> Optional[Dict[str, int]]:
+        """
+        Рекомендуемые лимиты по фактическим длинам ответов
+        
+        Прогоните ~20 типичных страниц через process_image(), затем пересоздайте
+        wrapper с полученными значениями.
+        
+        Args:
+            percentile: Перцентиль длины ответа (по умолчанию P99)
+            headroom: Запас сверх перцентиля
+        
+        Returns:
+            {"max_tokens", "max_model_len", "samples"} или None если нет данных
+        """
+        if not self._output_lengths:
+            return None
+        
+        lengths = sorted(self._output_lengths)
+        index = min(len(lengths) - 1, math.ceil(percentile * len(lengths)) - 1)
+        max_tokens = math.ceil(lengths[max(index, 0)] * headroom)
+        
+        # Контекст = vision токены самого "тяжелого" фиксированного режима + ответ
+        max_vision = max(m["vision_tokens"] or 0 for m in self.MODES.values())
+        
+        return {
+            "max_tokens": max_tokens,
+            "max_model_len": max_tokens + max_vision,
+            "samples": len(lengths)
+        }
+    
     def _parse_markdown(self, markdown: str) -> List[Dict[str, Any]]:
         """
         Парсинг Markdown в структурированные блоки
@@ -287,6 +359,8 @@ See `docs/DeepSeek_OCR_Setup.md` for setup instructions.
             "available": self.available,
             "model_loaded": self.llm is not None,
             "model_path": self.model_path,
+            "max_model_len": self.max_model_len,
+            "max_tokens": self.max_tokens,
             "modes": list(self.MODES.keys()),
             "deepseek_available": DEEPSEEK_AVAILABLE
         }
@@ -0,0 +1,25 @@
+"""
+Режимы DeepSeek-OCR - единая таблица параметров
+
+Используется FastAPI сервисом (app.py, параметры model.infer) и
+DeepSeekOCRWrapper (vLLM, оценка vision токенов).
+
+Принципы:
+- Single Source of Truth: размеры режимов задаются только здесь
+"""
+
+from typing import Any, Dict
+
+
+# Режим → параметры обработки изображения и число vision токенов
+# (None - динамическое, зависит от числа тайлов crop_mode)
+DEEPSEEK_MODES: Dict[str, Dict[str, Any]] = {
+    "Tiny": {"base_size": 512, "image_size": 512, "crop_mode": False, "vision_tokens": 64},
+    "Small": {"base_size": 640, "image_size": 640, "crop_mode": False, "vision_tokens": 100},
+    "Base": {"base_size": 1024, "image_size": 1024, "crop_mode": False, "vision_tokens": 256},
+    "Large": {"base_size": 1280, "image_size": 1280, "crop_mode": False, "vision_tokens": 400},
+    "Gundam": {"base_size": 1024, "image_size": 640, "crop_mode": True, "vision_tokens": None},
+}
+
+# Ключи режима, которые принимает model.infer
+INFER_KEYS = ("base_size", "image_size", "crop_mode")
@@ -181,7 +181,7 @@ class MarkdownFormatter:
             
             if formatted:
                 # Управление списками
-                block_list_id = block.metadata.get("list_id")
+                block_list_id = block.list_id
                 
                 # Если начался новый список
                 if block.type == ContentType.LIST and block_list_id != current_list_id:
@@ -241,7 +241,7 @@ class MarkdownFormatter:
     
     def _format_heading(self, block: IRBlock) -> str:
         """Форматирование заголовка"""
-        level = block.metadata.get("heading_level", 1)
+        level = block.heading_level or 1
         text = block.content.strip()
         
         # Markdown заголовок: # H1, ## H2, ### H3, etc.
@@ -267,7 +267,7 @@ class MarkdownFormatter:
     def _format_list_item(self, block: IRBlock) -> str:
         """Форматирование элемента списка"""
         text = block.content.strip()
-        list_type = block.metadata.get("list_type", "unordered")
+        list_type = block.list_type or "unordered"
         
         # Удаляем маркеры из оригинального текста
         text = re.sub(r'^[-•·]\s+', '', text)
@@ -19,19 +19,24 @@ PDF to Context Pipeline - главный оркестратор
 - KISS: Один путь обработки вместо маршрутизации
 """
 
-from typing import Optional
+import asyncio
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
 from pathlib import Path
 
 from .core.parser import PDFParser
 from .core.analyzer import PageAnalyzer
 from .core.structure_preserver import StructurePreserver
-from .extractors.native_extractor import NativeExtractor
+from .extractors.native_extractor import NativeExtractor, extract_page_in_worker
 from .extractors.ocr_client import OCRClient
 from .ir.builder import IRBuilder
 from .ir.structure_analyzer import StructureAnalyzer
 from .output.markdown_formatter import MarkdownFormatter
 from .ir.models import IR
 from .models.data_models import TextBlock, ImageBlock, DrawingBlock, TableBlock, OCRBlock
+from .utils.stderr import suppress_stderr
 
 
 class PDFToContextPipeline:
@@ -49,6 +54,9 @@ class PDFToContextPipeline:
     ```
     """
     
+    # Меньше страниц - запуск пула процессов дороже самого извлечения
+    POOL_MIN_PAGES = 8
+    
     def __init__(self,
                  ocr_base_url: str = "http://localhost:8000",
                  enable_ocr: Optional[bool] = None,
@@ -59,7 +67,10 @@ class PDFToContextPipeline:
                  ocr_vector_graphics: bool = True,
                  vector_render_dpi: int = 300,
                  include_frontmatter: bool = True,
-                 include_toc: bool = True):
+                 include_toc: bool = True,
+                 extract_workers: Optional[int] = None,
+                 extract_cache_dir: Optional[str] = None,
+                 keep_image_data: bool = False):
         """
         Инициализация пайплайна (НОВАЯ АРХИТЕКТУРА)
         
@@ -75,6 +86,15 @@ class PDFToContextPipeline:
             vector_render_dpi: DPI для рендеринга векторной графики (по умолчанию 300)
             include_frontmatter: Включать YAML frontmatter
             include_toc: Включать оглавление
+            extract_workers: Процессов для native extraction
+                             (None = NativeExtractor.default_workers(): os.cpu_count(),
+                             но не больше NativeExtractor.MAX_DEFAULT_WORKERS;
+                             1 = в текущем процессе)
+            extract_cache_dir: Каталог кэша native extraction по страницам
+                               (None = без кэша)
+            keep_image_data: Сохранять байты изображений в IR.image_store
+                             (IR.get_image_data / get_image_data_uri); включает
+                             извлечение байтов изображений и без OCR
         """
         # Автоматическое определение режима OCR
         if enable_ocr is None:
@@ -87,7 +107,9 @@ class PDFToContextPipeline:
             extract_drawings=extract_drawings,
             extract_tables=extract_tables,
             render_vectors_to_image=enable_ocr and ocr_vector_graphics,
-            vector_render_dpi=vector_render_dpi
+            vector_render_dpi=vector_render_dpi,
+            cache_dir=extract_cache_dir,
+            extract_image_bytes=enable_ocr or keep_image_data  # Байты нужны OCR или IR.image_store
         )
         
         # OCR клиент с автоматическим выбором сервиса (НОВАЯ АРХИТЕКТУРА)
@@ -114,7 +136,7 @@ class PDFToContextPipeline:
             min_area=min_image_area
         )
         
-        self.ir_builder = IRBuilder()
+        self.ir_builder = IRBuilder(keep_image_data=keep_image_data)
         self.structure_analyzer = StructureAnalyzer()
         self.markdown_formatter = MarkdownFormatter(
             include_frontmatter=include_frontmatter,
@@ -122,6 +144,7 @@ class PDFToContextPipeline:
         )
         
         self.enable_ocr = enable_ocr
+        self.extract_workers = extract_workers
         self.ocr_service_name = None  # Название используемого OCR сервиса
         if self.ocr_client and hasattr(self.ocr_client, 'ocr_service'):
             self.ocr_service_name = self.ocr_client.ocr_service.get_service_name()
@@ -182,6 +205,30 @@ class PDFToContextPipeline:
         """
         Обработать PDF документ (НОВАЯ АРХИТЕКТУРА)
         
+        Синхронная обертка над process_async. Из кода с уже запущенным
+        event loop (FastAPI, Jupyter) обработка выполняется в отдельном
+        потоке со своим loop - asyncio.run() в работающем loop невозможен;
+        там лучше вызывать process_async напрямую.
+        
+        Args:
+            pdf_path: Путь к PDF файлу
+            output_path: Путь для сохранения Markdown (опционально)
+        
+        Returns:
+            Markdown строка
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.process_async(pdf_path, output_path))
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.process_async(pdf_path, output_path)).result()
+    
+    async def process_async(self, pdf_path: str, output_path: Optional[str] = None) -> str:
+        """
+        Обработать PDF документ (асинхронно, в текущем event loop)
+        
         Args:
             pdf_path: Путь к PDF файлу
             output_path: Путь для сохранения Markdown (опционально)
@@ -200,63 +247,10 @@ class PDFToContextPipeline:
             document_metadata = parser.extract_metadata()
             self._stats["total_pages"] = document_metadata.total_pages
             
-            # 2. Обработка каждой страницы (НОВЫЙ FLOW)
-            extracted_data = []
-            
-            for page_num in range(parser.get_total_pages()):
-                print(f"   Страница {page_num + 1}/{parser.get_total_pages()}: ", end="")
-                
-                page = parser.get_page(page_num)
-                
-                try:
-                    # ШАГ 1: Native extraction - ВСЕГДА
-                    # Извлекаем структуру + placeholder'ы для графики
-                    print("extract", end="")
-                    page_data = self.native_extractor.extract_page(page, pdf_path)
-                    
-                    # ШАГ 2: StructurePreserver - встраивание OCR
-                    # Обрабатываем изображения и векторную графику с needs_ocr=True
-                    if self.enable_ocr and (page_data["image_blocks"] or page_data["drawing_blocks"]):
-                        print(" → ocr", end="")
-                        
-                        # Объединяем все блоки для обработки
-                        all_blocks = (
-                            page_data["text_blocks"] +
-                            page_data["image_blocks"] +
-                            page_data["drawing_blocks"] +
-                            page_data["table_blocks"]
-                        )
-                        
-                        # Обрабатываем через StructurePreserver
-                        processed_blocks = self.structure_preserver.process_structure(
-                            all_blocks,
-                            page_num
-                        )
-                        
-                        # Разделяем обратно по типам
-                        page_data = self._split_blocks_by_type(processed_blocks)
-                    
-                    extracted_data.append(page_data)
-                    print(" ✓")
-                
-                except Exception as e:
-                    print(f" ✗ Ошибка: {e}")
-                    import traceback
-                    if page_num == 1:  # Печатаем traceback только для первой ошибки
-                        print("\n🔍 Traceback:")
-                        traceback.print_exc()
-                    self._stats["errors"].append({
-                        "page": page_num + 1,
-                        "error": str(e)
-                    })
-                    # Добавляем пустые данные
-                    extracted_data.append({
-                        "text_blocks": [],
-                        "image_blocks": [],
-                        "drawing_blocks": [],
-                        "table_blocks": [],
-                        "ocr_blocks": []
-                    })
+            # 2. Обработка страниц (НОВЫЙ FLOW)
+            # Извлечение следующих страниц идет параллельно с OCR предыдущих
+            with self.native_extractor:
+                extracted_data = await self._extract_pages(parser, pdf_path)
             
             # 3. Построение IR
             print("🔨 Построение промежуточного представления...")
@@ -285,6 +279,123 @@ class PDFToContextPipeline:
             
             return markdown
     
+    async def _extract_pages(self, parser: PDFParser, pdf_path: str,
+                             prefetch: int = 4) -> List[Dict[str, Any]]:
+        """
+        Извлечение и OCR всех страниц с перекрытием по времени
+        
+        Producer извлекает страницы (NativeExtractor, CPU) в пуле процессов
+        (или в отдельном потоке для маленьких документов) и кладет страницы
+        с графикой в очередь; consumer отправляет их в OCR (StructurePreserver,
+        ожидание GPU/сети). Время ≈ max(извлечение, OCR) вместо суммы.
+        
+        Args:
+            parser: Открытый PDFParser
+            pdf_path: Путь к PDF файлу
+            prefetch: Сколько извлеченных страниц может ждать OCR
+        
+        Returns:
+            Данные страниц в порядке страниц (как NativeExtractor.extract_page)
+        """
+        total_pages = parser.get_total_pages()
+        extracted_data: List[Optional[Dict[str, Any]]] = [None] * total_pages
+        pending: asyncio.Queue = asyncio.Queue(maxsize=max(1, prefetch))
+        loop = asyncio.get_running_loop()
+        
+        def extract(page_num: int) -> Dict[str, Any]:
+            # ШАГ 1: Native extraction - ВСЕГДА
+            # Извлекаем структуру + placeholder'ы для графики
+            # (один внешний suppress_stderr на загрузку и извлечение страницы)
+            with suppress_stderr():
+                return self.native_extractor.extract_page(parser.get_page(page_num), pdf_path)
+        
+        def finish(page_num: int, page_data: Optional[Dict[str, Any]],
+                   error: Optional[Exception] = None, ocr: bool = False):
+            steps = "extract → ocr" if ocr else "extract"
+            if error is None:
+                extracted_data[page_num] = page_data
+                print(f"   Страница {page_num + 1}/{total_pages}: {steps} ✓")
+                return
+            
+            print(f"   Страница {page_num + 1}/{total_pages}: {steps} ✗ Ошибка: {error}")
+            if not self._stats["errors"]:  # Печатаем traceback только для первой ошибки
+                # В stdout: stderr может быть подавлен suppress_stderr() потока извлечения
+                print("\n🔍 Traceback:")
+                traceback.print_exception(type(error), error, error.__traceback__, file=sys.stdout)
+            self._stats["errors"].append({
+                "page": page_num + 1,
+                "error": str(error)
+            })
+            # Добавляем пустые данные
+            extracted_data[page_num] = {
+                "text_blocks": [],
+                "image_blocks": [],
+                "drawing_blocks": [],
+                "table_blocks": [],
+                "ocr_blocks": []
+            }
+        
+        async def producer(extract_async):
+            for page_num in range(total_pages):
+                try:
+                    page_data = await extract_async(page_num)
+                except Exception as e:
+                    finish(page_num, None, e)
+                    continue
+                
+                # ШАГ 2: StructurePreserver - встраивание OCR
+                # Обрабатываем изображения и векторную графику с needs_ocr=True
+                if self.enable_ocr and (page_data["image_blocks"] or page_data["drawing_blocks"]):
+                    await pending.put((page_num, page_data))
+                else:
+                    finish(page_num, page_data)
+            
+            await pending.put(None)
+        
+        async def consumer():
+            while (item := await pending.get()) is not None:
+                page_num, page_data = item
+                
+                # Объединяем все блоки для обработки
+                all_blocks = (
+                    page_data["text_blocks"] +
+                    page_data["image_blocks"] +
+                    page_data["drawing_blocks"] +
+                    page_data["table_blocks"]
+                )
+                
+                try:
+                    processed_blocks = await self.structure_preserver.process_structure_async(
+                        all_blocks,
+                        page_num
+                    )
+                except Exception as e:
+                    finish(page_num, None, e, ocr=True)
+                    continue
+                
+                # Разделяем обратно по типам
+                finish(page_num, self._split_blocks_by_type(processed_blocks), ocr=True)
+        
+        workers = self._extract_workers(total_pages)
+        if workers > 1:
+            # Каждый процесс открывает документ сам; страницы ставятся в пул
+            # сразу, результаты забираются в порядке страниц
+            with self.native_extractor.open_pool(pdf_path, workers) as pool:
+                futures = [pool.submit(extract_page_in_worker, n) for n in range(total_pages)]
+                await asyncio.gather(
+                    producer(lambda page_num: asyncio.wrap_future(futures[page_num])),
+                    consumer()
+                )
+        else:
+            # PyMuPDF не потокобезопасен - документ читается строго из одного потока
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                await asyncio.gather(
+                    producer(lambda page_num: loop.run_in_executor(executor, extract, page_num)),
+                    consumer()
+                )
+        
+        return extracted_data
+    
     def process_to_ir(self, pdf_path: str) -> IR:
         """
         Обработать PDF и вернуть IR (без Markdown форматирования)
@@ -298,14 +409,14 @@ class PDFToContextPipeline:
         with PDFParser(pdf_path) as parser:
             document_metadata = parser.extract_metadata()
             extracted_data = []
+            ocr_pages = []  # (индекс в extracted_data, blocks, page_num)
             
-            for page_num in range(parser.get_total_pages()):
-                page = parser.get_page(page_num)
-                
-                # НОВАЯ АРХИТЕКТУРА
-                page_data = self.native_extractor.extract_page(page, pdf_path)
-                
-                # StructurePreserver
+            # НОВАЯ АРХИТЕКТУРА: native extraction (в пуле процессов для больших документов)
+            workers = self._extract_workers(parser.get_total_pages())
+            pages = self.native_extractor.extract_document(pdf_path, workers=workers)
+            
+            for page_num, page_data in enumerate(pages):
+                # Страницы с изображениями копим для пакетного OCR
                 if self.enable_ocr and page_data["image_blocks"]:
                     all_blocks = (
                         page_data["text_blocks"] +
@@ -313,19 +424,29 @@ class PDFToContextPipeline:
                         page_data["drawing_blocks"] +
                         page_data["table_blocks"]
                     )
-                    processed_blocks = self.structure_preserver.process_structure(
-                        all_blocks,
-                        page_num
-                    )
-                    page_data = self._split_blocks_by_type(processed_blocks)
+                    ocr_pages.append((len(extracted_data), all_blocks, page_num))
                 
                 extracted_data.append(page_data)
             
+            # StructurePreserver: OCR изображений всего документа пакетами
+            if ocr_pages:
+                processed_pages = self.structure_preserver.process_document(
+                    [(blocks, page_num) for _, blocks, page_num in ocr_pages]
+                )
+                for (index, _, _), processed_blocks in zip(ocr_pages, processed_pages):
+                    extracted_data[index] = self._split_blocks_by_type(processed_blocks)
+            
             ir = self.ir_builder.build_ir(extracted_data, document_metadata)
             ir = self.structure_analyzer.analyze(ir)
             
             return ir
     
+    def _extract_workers(self, total_pages: int) -> int:
+        """Количество процессов извлечения для документа (1 - без пула)"""
+        if total_pages < self.POOL_MIN_PAGES:
+            return 1
+        return min(self.extract_workers or self.native_extractor.default_workers(), total_pages)
+    
     def health_check(self) -> dict:
         """
         Проверка работоспособности пайплайна
@@ -405,7 +526,7 @@ class PDFToContextPipeline:
             print(f"\n   Графика:")
             print(f"   - Найдено изображений: {sp_stats['total_images']}")
             print(f"   - Обработано OCR: {sp_stats['ocr_processed']}")
-            print(f"   - Пропущено (маленькие): {sp_stats['ocr_skipped']}")
+            print(f"   - Пропущено (маленькие / OCR недоступен): {sp_stats['ocr_skipped']}")
             if sp_stats['ocr_errors'] > 0:
                 print(f"   - Ошибок OCR: {sp_stats['ocr_errors']}")
         
@@ -0,0 +1,383 @@
+"""
+BBox Ops - геометрия для наборов прямоугольников
+
+Операции над сотнями/тысячами bbox страницы (площадь объединения и т.п.)
+выполняются векторно на NumPy, а не попарно на объектах BBox: BBoxArray
+хранит все bbox страницы одним массивом.
+
+Принципы:
+- Single Responsibility: Только геометрия прямоугольников (x0, y0, x1, y1)
+- Graceful degradation: без NumPy - точный, но медленный проход на Python,
+  без Numba - векторные операции NumPy
+"""
+
+from typing import Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+Rect = Tuple[float, float, float, float]
+
+# Предел размера сетки сжатых координат; больше - координаты квантуются
+# (погрешность - доля процента площади страницы, памяти - десятки МБ)
+MAX_GRID_CELLS = 4_000_000
+
+# Скомпилированные Numba ядра (None - еще не загружали, False - Numba нет)
+_near_mask_kernel = None
+_overlap_pairs_kernel = None
+
+# Строк за шаг в overlapping_pairs без Numba (ограничивает память маски)
+OVERLAP_BLOCK_ROWS = 512
+
+
+def union_area(rects: Sequence[Rect], max_cells: int = MAX_GRID_CELLS) -> float:
+    """
+    Площадь объединения прямоугольников (перекрытия считаются один раз)
+
+    Координаты сжимаются до уникальных значений, покрытие ячеек сетки
+    считается через двумерный массив разностей и cumsum.
+
+    Args:
+        rects: Прямоугольники (x0, y0, x1, y1)
+        max_cells: Предел размера сетки (больше - координаты квантуются)
+
+    Returns:
+        float: Площадь объединения
+    """
+    if not NUMPY_AVAILABLE:
+        rects = [r for r in rects if r[2] > r[0] and r[3] > r[1]]
+        return _union_area_sweep(rects) if rects else 0.0
+
+    coords = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    return _union_area_coords(coords, max_cells)
+
+
+def _union_area_coords(coords, max_cells: int):
+    """union_area для массива (N, 4); вырожденные прямоугольники отбрасываются"""
+    coords = coords[(coords[:, 2] > coords[:, 0]) & (coords[:, 3] > coords[:, 1])]
+    if len(coords) == 0:
+        return 0.0
+
+    xs = np.unique(coords[:, [0, 2]])
+    ys = np.unique(coords[:, [1, 3]])
+
+    if (len(xs) - 1) * (len(ys) - 1) > max_cells:
+        # Слишком много различных координат - округляем до сетки side x side
+        side = max(1, int(max_cells ** 0.5))
+        for columns, values in (([0, 2], xs), ([1, 3], ys)):
+            step = (values[-1] - values[0]) / side
+            if step > 0:
+                coords[:, columns] = values[0] + np.round((coords[:, columns] - values[0]) / step) * step
+        xs = np.unique(coords[:, [0, 2]])
+        ys = np.unique(coords[:, [1, 3]])
+
+    ix0 = np.searchsorted(xs, coords[:, 0])
+    ix1 = np.searchsorted(xs, coords[:, 2])
+    iy0 = np.searchsorted(ys, coords[:, 1])
+    iy1 = np.searchsorted(ys, coords[:, 3])
+
+    # +1 в левом нижнем углу прямоугольника, -1 за его правой/верхней границей
+    diff = np.zeros((len(xs), len(ys)), dtype=np.int32)
+    np.add.at(diff, (ix0, iy0), 1)
+    np.add.at(diff, (ix1, iy0), -1)
+    np.add.at(diff, (ix0, iy1), -1)
+    np.add.at(diff, (ix1, iy1), 1)
+
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+    return float(np.diff(xs) @ covered.astype(np.float64) @ np.diff(ys))
+
+
+class BBoxArray:
+    """
+    Набор bbox страницы как один массив NumPy (N, 4): x0, y0, x1, y1
+
+    Создается один раз на страницу (из drawings/изображений), дальше площади,
+    перекрытия и охватывающие bbox считаются векторно без создания объектов
+    BBox на каждую операцию.
+
+    Использование:
+    ```python
+    boxes = BBoxArray.from_bboxes(d.bbox for d in drawings)
+    large = boxes.areas() >= min_area
+    x0, y0, x1, y1 = boxes.merge_all([0, 3, 5])
+    ```
+    """
+
+    __slots__ = ("coords",)
+
+    def __init__(self, rects):
+        """
+        Args:
+            rects: Прямоугольники (x0, y0, x1, y1) или массив (N, 4)
+        """
+        self.coords = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+
+    @classmethod
+    def from_bboxes(cls, bboxes) -> "BBoxArray":
+        """Создать из объектов с атрибутами x0, y0, x1, y1 (BBox)"""
+        return cls([(b.x0, b.y0, b.x1, b.y1) for b in bboxes])
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def areas(self):
+        """Площади bbox (как BBox.area())"""
+        c = self.coords
+        return (c[:, 2] - c[:, 0]) * (c[:, 3] - c[:, 1])
+
+    def pairwise_overlap_area(self, other: "BBoxArray"):
+        """
+        Площади перекрытия каждого bbox с каждым bbox other
+
+        Returns:
+            Массив (N, M); 0 для неперекрывающихся
+        """
+        a = self.coords[:, None, :]
+        b = other.coords[None, :, :]
+        width = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+        height = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+        return np.maximum(width, 0.0) * np.maximum(height, 0.0)
+
+    def clip(self, x0: float, y0: float, x1: float, y1: float) -> "BBoxArray":
+        """Обрезать bbox по прямоугольнику (например, по границам страницы)"""
+        clipped = np.empty_like(self.coords)
+        np.maximum(self.coords[:, :2], (x0, y0), out=clipped[:, :2])
+        np.minimum(self.coords[:, 2:], (x1, y1), out=clipped[:, 2:])
+        return BBoxArray(clipped)
+
+    def union_area(self, max_cells: int = MAX_GRID_CELLS) -> float:
+        """Площадь объединения (перекрытия считаются один раз)"""
+        return _union_area_coords(self.coords, max_cells)
+
+    def merge_all(self, indices=None) -> Rect:
+        """
+        Минимальный охватывающий bbox (всех или выбранных по индексам)
+
+        Returns:
+            (x0, y0, x1, y1); (0, 0, 0, 0) для пустого набора
+        """
+        coords = self.coords if indices is None else self.coords[indices]
+        if len(coords) == 0:
+            return (0.0, 0.0, 0.0, 0.0)
+        low = coords[:, :2].min(axis=0)
+        high = coords[:, 2:].max(axis=0)
+        return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+
+    def merge_groups(self, labels, group_count: int) -> "BBoxArray":
+        """
+        Охватывающие bbox групп: bbox i входит в группу labels[i]
+
+        Args:
+            labels: Номер группы (0..group_count-1) для каждого bbox
+            group_count: Количество групп
+
+        Returns:
+            BBoxArray из group_count охватывающих bbox
+        """
+        labels = np.asarray(labels, dtype=np.intp)
+        merged = np.empty((group_count, 4), dtype=np.float64)
+        merged[:, :2] = np.inf
+        merged[:, 2:] = -np.inf
+        for column, ufunc in ((0, np.minimum), (1, np.minimum), (2, np.maximum), (3, np.maximum)):
+            ufunc.at(merged[:, column], labels, self.coords[:, column])
+        return BBoxArray(merged)
+
+
+def _union_area_sweep(rects: Sequence[Rect]) -> float:
+    """Площадь объединения без NumPy: вертикальные полосы + слияние интервалов по Y"""
+    xs = sorted({r[0] for r in rects} | {r[2] for r in rects})
+    area = 0.0
+
+    for left, right in zip(xs, xs[1:]):
+        intervals = sorted((r[1], r[3]) for r in rects if r[0] <= left and r[2] >= right)
+
+        covered = 0.0
+        start = end = None
+        for y0, y1 in intervals:
+            if end is None or y0 > end:
+                if end is not None:
+                    covered += end - start
+                start, end = y0, y1
+            else:
+                end = max(end, y1)
+        if end is not None:
+            covered += end - start
+
+        area += covered * (right - left)
+
+    return area
+
+
+def near_mask(coords, start: int, stop: int, proximity: float):
+    """
+    Маска "bbox близки" для строк [start, stop) и всех столбцов (только j > i)
+
+    Расстояние - минимальное между краями (0 при перекрытии). С Numba
+    считается скомпилированным циклом без промежуточных массивов N x N,
+    иначе - векторно на NumPy.
+
+    Args:
+        coords: Массив NumPy (N, 4) float64 с (x0, y0, x1, y1)
+        start, stop: Диапазон строк
+        proximity: Порог близости
+
+    Returns:
+        Булев массив (stop - start, N)
+    """
+    kernel = _load_near_mask_kernel()
+    if kernel:
+        return kernel(coords, start, stop, proximity)
+
+    x0, y0, x1, y1 = coords.T
+    rows = slice(start, stop)
+    dx = np.maximum(0.0, np.maximum(x0[None, :] - x1[rows, None], x0[rows, None] - x1[None, :]))
+    dy = np.maximum(0.0, np.maximum(y0[None, :] - y1[rows, None], y0[rows, None] - y1[None, :]))
+    near = dx * dx + dy * dy <= proximity * proximity  # Без sqrt
+
+    columns = np.arange(len(coords))
+    near &= columns[None, :] > columns[rows, None]
+    return near
+
+
+def _near_mask_loop(coords, start, stop, proximity):
+    """Ядро near_mask для Numba (обычный Python код над скалярами)"""
+    count = coords.shape[0]
+    proximity_sq = proximity * proximity
+    near = np.zeros((stop - start, count), dtype=np.bool_)
+
+    for i in range(start, stop):
+        ax0, ay0, ax1, ay1 = coords[i, 0], coords[i, 1], coords[i, 2], coords[i, 3]
+        for j in range(i + 1, count):
+            dx = max(0.0, coords[j, 0] - ax1, ax0 - coords[j, 2])
+            dy = max(0.0, coords[j, 1] - ay1, ay0 - coords[j, 3])
+            near[i - start, j] = dx * dx + dy * dy <= proximity_sq
+
+    return near
+
+
+def _load_near_mask_kernel():
+    """Ленивая компиляция ядра (Numba импортируется только при первом вызове)"""
+    global _near_mask_kernel
+    if _near_mask_kernel is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _near_mask_kernel = False
+        else:
+            # cache=True - машинный код сохраняется между запусками CLI
+            _near_mask_kernel = njit(cache=True)(_near_mask_loop)
+    return _near_mask_kernel
+
+
+def overlapping_pairs(coords):
+    """
+    Пары bbox с перекрытием положительной площади (без матрицы N x N)
+
+    bbox сортируются по x0, и каждый сравнивается только со следующими,
+    пока их x0 левее его x1 (sweep по X). С Numba - скомпилированный цикл
+    (два прохода: подсчет пар, затем заполнение), иначе - векторно на NumPy
+    блоками строк. Память - O(N + пар), а не O(N²).
+
+    Args:
+        coords: Массив NumPy (N, 4) с (x0, y0, x1, y1)
+
+    Returns:
+        (first, second): массивы индексов int64, first[k] < second[k]
+    """
+    coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 4)
+    if len(coords) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    order = np.argsort(coords[:, 0], kind="stable")
+    sorted_coords = coords[order]
+
+    kernel = _load_overlap_pairs_kernel()
+    if kernel:
+        first, second = kernel(sorted_coords)
+    else:
+        first, second = _overlap_pairs_numpy(sorted_coords)
+
+    first, second = order[first], order[second]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def _overlap_pairs_numpy(coords):
+    """overlapping_pairs без Numba: coords отсортированы по x0"""
+    x0, y0, x1, y1 = coords.T
+    count = len(coords)
+    firsts, seconds = [], []
+
+    for start in range(0, count, OVERLAP_BLOCK_ROWS):
+        stop = min(start + OVERLAP_BLOCK_ROWS, count)
+        # Дальше этого столбца x0 правее x1 любой строки блока - перекрытий нет
+        end = int(np.searchsorted(x0, x1[start:stop].max(), side="left"))
+        if end <= start + 1:
+            continue
+
+        rows = slice(start, stop)
+        columns = slice(start, end)
+        overlap = (
+            (x0[None, columns] < x1[rows, None]) & (x1[None, columns] > x0[rows, None])
+            & (y0[None, columns] < y1[rows, None]) & (y1[None, columns] > y0[rows, None])
+        )
+        overlap &= np.arange(start, end)[None, :] > np.arange(start, stop)[:, None]
+
+        i, j = np.nonzero(overlap)
+        firsts.append(i + start)
+        seconds.append(j + start)
+
+    if not firsts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(firsts).astype(np.int64), np.concatenate(seconds).astype(np.int64)
+
+
+def _overlap_pairs_loop(coords):
+    """Ядро overlapping_pairs для Numba: coords отсортированы по x0"""
+    count = coords.shape[0]
+
+    # Проход 1: количество пар (чтобы выделить выход точного размера)
+    total = 0
+    for i in range(count):
+        ax1, ay0, ay1 = coords[i, 2], coords[i, 1], coords[i, 3]
+        j = i + 1
+        while j < count and coords[j, 0] < ax1:
+            if coords[j, 1] < ay1 and coords[j, 3] > ay0 and coords[j, 2] > coords[i, 0]:
+                total += 1
+            j += 1
+
+    first = np.empty(total, dtype=np.int64)
+    second = np.empty(total, dtype=np.int64)
+
+    # Проход 2: заполнение
+    k = 0
+    for i in range(count):
+        ax1, ay0, ay1 = coords[i, 2], coords[i, 1], coords[i, 3]
+        j = i + 1
+        while j < count and coords[j, 0] < ax1:
+            if coords[j, 1] < ay1 and coords[j, 3] > ay0 and coords[j, 2] > coords[i, 0]:
+                first[k] = i
+                second[k] = j
+                k += 1
+            j += 1
+
+    return first, second
+
+
+def _load_overlap_pairs_kernel():
+    """Ленивая компиляция ядра overlapping_pairs"""
+    global _overlap_pairs_kernel
+    if _overlap_pairs_kernel is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _overlap_pairs_kernel = False
+        else:
+            _overlap_pairs_kernel = njit(cache=True)(_overlap_pairs_loop)
+    return _overlap_pairs_kernel
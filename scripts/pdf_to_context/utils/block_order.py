@@ -0,0 +1,60 @@
+"""
+Block Order - сортировка блоков в порядке чтения
+
+Порядок чтения: страница → Y (сверху вниз) → X (слева направо).
+Для больших списков (весь документ) ключи упаковываются в массивы NumPy
+и сортируются одним np.lexsort вместо N·log N сравнений Python кортежей.
+
+Принципы:
+- Single Responsibility: Только порядок блоков
+- Graceful degradation: без NumPy (или на малых списках) - обычная сортировка Python
+"""
+
+from typing import List, Sequence, TypeVar
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+T = TypeVar("T")
+
+# На малых списках (блоки одной страницы) накладные расходы NumPy больше выигрыша
+NUMPY_MIN_BLOCKS = 256
+
+
+def sort_reading_order(blocks: Sequence[T], page_attr: str = "page_num") -> List[T]:
+    """
+    Отсортировать блоки в порядке чтения (стабильно)
+
+    Args:
+        blocks: Блоки с атрибутами bbox и номером страницы
+        page_attr: Имя атрибута номера страницы ("page_num" для блоков
+                  экстракторов, "page" для IRBlock)
+
+    Returns:
+        Новый список блоков, отсортированный по (page, -y1, x0)
+    """
+    if not NUMPY_AVAILABLE or len(blocks) < NUMPY_MIN_BLOCKS:
+        return sorted(
+            blocks,
+            key=lambda b: (getattr(b, page_attr), -b.bbox.y1, b.bbox.x0)
+        )
+
+    count = len(blocks)
+    pages = np.empty(count, dtype=np.int64)
+    neg_y1 = np.empty(count, dtype=np.float64)
+    x0 = np.empty(count, dtype=np.float64)
+
+    for index, block in enumerate(blocks):
+        bbox = block.bbox
+        pages[index] = getattr(block, page_attr)
+        neg_y1[index] = -bbox.y1
+        x0[index] = bbox.x0
+
+    # lexsort: последний ключ - главный; сортировка стабильна, как sorted()
+    order = np.lexsort((x0, neg_y1, pages))
+    return [blocks[index] for index in order.tolist()]
@@ -0,0 +1,53 @@
+"""
+Перцептивный хэш изображений (dHash)
+
+Используется для поиска почти одинаковых изображений (масштабированных,
+пересжатых), которые не совпадают побайтно, - например, повторяющихся
+логотипов и шаблонных схем в одном документе.
+
+Принципы:
+- KISS: dHash на PIL без дополнительных зависимостей
+- Graceful degradation: нечитаемое изображение → None (не участвует в дедупликации)
+"""
+
+import io
+from typing import Optional
+
+from PIL import Image
+
+
+def dhash(image_data: bytes, hash_size: int = 8) -> Optional[int]:
+    """
+    Разностный хэш изображения (hash_size² бит)
+    
+    Изображение уменьшается до (hash_size + 1) x hash_size в оттенках серого,
+    каждый бит - "левый пиксель ярче правого".
+    
+    Args:
+        image_data: Байты изображения (PNG/JPEG)
+        hash_size: Сторона сетки (8 → 64-битный хэш)
+    
+    Returns:
+        Хэш как int или None, если изображение не удалось прочитать
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            # Для JPEG декодируем сразу в уменьшенном виде
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+            pixels = small.tobytes()
+    except Exception:
+        return None
+    
+    value = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Число различающихся бит двух хэшей"""
+    return bin(a ^ b).count("1")
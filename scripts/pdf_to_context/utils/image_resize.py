@@ -0,0 +1,67 @@
+"""
+Уменьшение изображений перед отправкой в OCR
+
+DeepSeek-OCR все равно обрабатывает изображение в разрешении base_size
+(1024), поэтому сканы 4000x3000 выгоднее уменьшить на клиенте: меньше
+трафика и меньше работы сервису. Декодирование + Lanczos - CPU-bound,
+поэтому пакет изображений обрабатывается в пуле процессов.
+
+Принципы:
+- Single Responsibility: Только уменьшение изображений
+- Graceful degradation: нечитаемое или маленькое изображение возвращается как есть
+"""
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from PIL import Image
+
+
+def preshrink(image_data: bytes, target: int = 1024, quality: int = 90) -> bytes:
+    """
+    Уменьшить изображение до target по длинной стороне (JPEG)
+
+    Args:
+        image_data: Байты изображения
+        target: Максимальная длина стороны (px)
+        quality: Качество JPEG
+
+    Returns:
+        Байты уменьшенного JPEG или исходные байты, если уменьшать не нужно
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            if max(image.size) <= target:
+                return image_data
+
+            # Для JPEG декодируем сразу в уменьшенном виде (кратно 1/2..1/8)
+            image.draft("RGB", (target, target))
+            image = image.convert("RGB")
+            image.thumbnail((target, target), Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality)
+            return buffer.getvalue()
+    except Exception:
+        return image_data
+
+
+def preshrink_many(images: List[bytes], target: int = 1024) -> List[bytes]:
+    """
+    Уменьшить список изображений (в пуле процессов, если их несколько)
+
+    Args:
+        images: Байты изображений
+        target: Максимальная длина стороны (px)
+
+    Returns:
+        Список байтов в том же порядке
+    """
+    if len(images) <= 1:
+        return [preshrink(data, target) for data in images]
+
+    workers = min(len(images), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(preshrink, images, [target] * len(images)))
@@ -0,0 +1,95 @@
+"""
+Stderr - подавление вывода C-библиотек (PyMuPDF) в stderr
+
+PyMuPDF пишет предупреждения напрямую в файловый дескриптор 2, поэтому
+перенаправляется сам дескриптор. Контекст реентерабельный (счетчик
+вложенности): системные вызовы dup/dup2 выполняются только на внешнем
+входе/выходе, вложенные with (страница внутри документа) почти бесплатны.
+/dev/null открывается один раз на процесс. Если у sys.stderr нет файлового
+дескриптора (подменен StringIO: pytest, IPython), контекст ничего не
+перенаправляет.
+
+Принципы:
+- Single Responsibility: Только перенаправление stderr
+- Потокобезопасность: счетчик общий для процесса и защищен блокировкой
+"""
+
+import contextlib
+import io
+import os
+import sys
+import threading
+
+
+_lock = threading.Lock()
+_depth = 0  # Вложенность активных suppress_stderr()
+_saved_fd = None  # Копия исходного stderr (на время подавления; None - не перенаправлен)
+_redirected_fd = None  # Дескриптор, перенаправленный в /dev/null
+_devnull_fd = None  # Открытый /dev/null (один на процесс)
+
+
+@contextlib.contextmanager
+def suppress_stderr():
+    """
+    Подавление stderr на уровне файловых дескрипторов.
+    Работает с низкоуровневыми C-библиотеками (PyMuPDF).
+
+    Обработку документа можно обернуть одним внешним with - тогда
+    with внутри обработки страниц не выполняют системных вызовов.
+    """
+    _enter()
+    try:
+        yield
+    finally:
+        _exit()
+
+
+def _enter():
+    """Внешний вход: сохранить stderr и перенаправить его в /dev/null"""
+    global _depth, _saved_fd, _redirected_fd, _devnull_fd
+    with _lock:
+        if _depth > 0:
+            _depth += 1
+            return
+
+        try:
+            stderr_fd = sys.stderr.fileno()
+        except (AttributeError, ValueError, io.UnsupportedOperation):
+            # Нет дескриптора - перенаправлять нечего
+            _depth = 1
+            return
+
+        # Счетчик растет только после успешного перенаправления:
+        # при ошибке os.* состояние остается прежним
+        if _devnull_fd is None:
+            _devnull_fd = os.open(os.devnull, os.O_WRONLY)
+
+        sys.stderr.flush()
+        saved_fd = os.dup(stderr_fd)
+        try:
+            os.dup2(_devnull_fd, stderr_fd)
+        except OSError:
+            os.close(saved_fd)
+            raise
+
+        _saved_fd = saved_fd
+        _redirected_fd = stderr_fd
+        _depth = 1
+
+
+def _exit():
+    """Внешний выход: восстановить stderr"""
+    global _depth, _saved_fd, _redirected_fd
+    with _lock:
+        _depth -= 1
+        if _depth > 0 or _saved_fd is None:
+            return
+
+        try:
+            sys.stderr.flush()
+        except (AttributeError, ValueError):
+            pass
+        os.dup2(_saved_fd, _redirected_fd)
+        os.close(_saved_fd)
+        _saved_fd = None
+        _redirected_fd = None
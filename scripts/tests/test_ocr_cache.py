@@ -0,0 +1,61 @@
+"""
+Тесты OCRCache: LRU в памяти и запись на диск
+
+Запуск из корня репозитория:
+    python -m unittest scripts/tests/test_ocr_cache.py
+"""
+
+import os
+import tempfile
+import unittest
+
+from scripts.pdf_to_context.extractors.ocr_cache import OCRCache
+
+
+class OCRCacheMemoryTest(unittest.TestCase):
+    """Память процесса - LRU на max_entries записей"""
+
+    def test_evicts_least_recently_used(self):
+        cache = OCRCache(max_entries=2)
+        cache.put("a", {"markdown": "A"})
+        cache.put("b", {"markdown": "B"})
+
+        # "a" использован последним - вытесняется "b"
+        self.assertEqual(cache.get("a"), {"markdown": "A"})
+        cache.put("c", {"markdown": "C"})
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), {"markdown": "A"})
+        self.assertEqual(cache.get("c"), {"markdown": "C"})
+        self.assertEqual(cache.get_statistics()["entries"], 2)
+
+    def test_disk_hits_are_bounded_in_memory(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            writer = OCRCache(cache_dir=cache_dir)
+            for key in "abcd":
+                writer.put(key, key.upper())
+
+            reader = OCRCache(cache_dir=cache_dir, max_entries=2)
+            for key in "abcd":
+                self.assertEqual(reader.get(key), key.upper())
+
+            # Все записи читаются с диска, но в памяти - только последние две
+            self.assertEqual(reader.get_statistics()["entries"], 2)
+            self.assertEqual(reader.get("a"), "A")
+
+
+class OCRCacheDiskTest(unittest.TestCase):
+    """Запись на диск"""
+
+    def test_failed_write_leaves_no_temp_file(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = OCRCache(cache_dir=cache_dir)
+            cache.put("bad", {"payload": object()})  # Не сериализуется в JSON
+
+            self.assertEqual(os.listdir(cache_dir), [])
+            # Запись в памяти осталась - OCR продолжает работать
+            self.assertIsNotNone(cache.get("bad"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Тесты suppress_stderr: счетчик вложенности при ошибках и без дескриптора
+
+Запуск из корня репозитория:
+    python -m unittest scripts/tests/test_stderr.py
+"""
+
+import io
+import sys
+import unittest
+from unittest import mock
+
+from scripts.pdf_to_context.utils import stderr
+
+
+class SuppressStderrTest(unittest.TestCase):
+
+    def test_stderr_without_fileno(self):
+        original = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            with stderr.suppress_stderr():
+                with stderr.suppress_stderr():
+                    pass
+        finally:
+            sys.stderr = original
+
+        self.assertEqual(stderr._depth, 0)
+        self.assertIsNone(stderr._saved_fd)
+
+    def test_failed_redirect_keeps_depth(self):
+        with mock.patch.object(stderr.os, "dup", side_effect=OSError("dup failed")):
+            with self.assertRaises(OSError):
+                with stderr.suppress_stderr():
+                    pass
+
+        self.assertEqual(stderr._depth, 0)
+        self.assertIsNone(stderr._saved_fd)
+
+    def test_redirect_is_restored(self):
+        try:
+            sys.stderr.fileno()
+        except (AttributeError, ValueError, io.UnsupportedOperation):
+            self.skipTest("stderr без дескриптора")
+
+        with stderr.suppress_stderr():
+            self.assertEqual(stderr._depth, 1)
+            self.assertIsNotNone(stderr._saved_fd)
+
+        self.assertEqual(stderr._depth, 0)
+        self.assertIsNone(stderr._saved_fd)
+
+
+if __name__ == "__main__":
+    unittest.main()